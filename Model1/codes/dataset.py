@@ -1,15 +1,17 @@
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import rioxarray as rxr
 
-from shapely import Point, distance
 from pyproj import Transformer
 from rasterio.transform import rowcol
+from numpy.lib.stride_tricks import sliding_window_view
 
 import torch
 from torch.utils.data import Dataset
 
+from utils.distance_raster import distance_raster
+from utils.feature_store import build_feature_stack
+
 # Dataset
 class MeuDataset(Dataset):
     nix_bands = [
@@ -25,6 +27,22 @@ class MeuDataset(Dataset):
 
     columns_dados = ["Ponto", "Lat", "Lon", "soils_type", "Clay", "Silt", "Sand", "K (C1)"]
 
+    # Janela da convolução, deve ser ímpar. O cubo dos rasteres é salvo com a borda de meia janela
+    janela = 25
+
+    # Rasteres de entrada, na ordem das bandas do modelo
+    rasters = {
+        "USOSOLO":                 r"D:/Mestrado/Trabalho Final/SIG/USOSOLO.tif",                 # Tipos de uso do solo
+        "Elevation":               r"D:/Mestrado/Trabalho Final/SIG/Elevation.tif",               # Elevação
+        "TerrainRuggednessIndex":  r"D:/Mestrado/Trabalho Final/SIG/TerrainRuggednessIndex.tif",  # Variação de elevação entre um pixel e seus vizinhos imediatos
+        "TopograficPositionIndex": r"D:/Mestrado/Trabalho Final/SIG/TopograficPositionIndex.tif", # Elevação de um ponto com a média da elevação ao redor, topo, vale ou plano
+        "Roughness":               r"D:/Mestrado/Trabalho Final/SIG/Roughness.tif",               # A diferença entre a elevação máxima e mínima dentro de uma vizinhança
+        "Slope":                   r"D:/Mestrado/Trabalho Final/SIG/Slope.tif",                   # Declividade
+        "Aspect":                  r"D:/Mestrado/Trabalho Final/SIG/Aspect.tif",                  # Para onde "aponta" a face do terreno
+        "textura_2":               r"D:\Mestrado\Trabalho Final\SIG\textura_2.tif",               # Textura a 2 cm
+        "textura_20":              r"D:\Mestrado\Trabalho Final\SIG\textura_20.tif",              # Textura a 20 cm
+    }
+
     def __init__(self, device:torch.device|None=None, eval=False):
         """
         O dataset tem o formato de uma tupla com os valores em X e em Y:
@@ -35,7 +53,6 @@ class MeuDataset(Dataset):
         """
         self.eval = eval
         self.device = device
-        self.janela = 25 # Janela deve ser ímpar
 
         if self.janela%2 == 0:
             raise ValueError("A janela deve ser ímpar")
@@ -55,42 +72,37 @@ class MeuDataset(Dataset):
         # Lendo Rasteres importantes
         self.talvegues = gpd.read_file(r"D:/Mestrado/Trabalho Final/SIG/HidrografiaArea.zip")
 
-        # Lendo Rasteres
+        # Lendo Rasteres, alinhados uma única vez no grid do USOSOLO e abertos com memória mapeada,
+        # salvos com a borda de meia janela em NaN para as janelas dos pixels das bordas
         print("Lendo Rasteres")
-        self.uso_solo        = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/USOSOLO.tif")                 # Tipos de uso do solo
-        self.elevation       = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Elevation.tif")               # Elevação
-        self.terrain_rug_idx = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/TerrainRuggednessIndex.tif")  # Variação de elevação entre um pixel e seus vizinhos imediatos
-        self.topo_pos_idx    = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/TopograficPositionIndex.tif") # Elevação de um ponto com a média da elevação ao redor, topo, vale ou plano
-        self.roughness       = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Roughness.tif")               # A diferença entre a elevação máxima e mínima dentro de uma vizinhança
-        self.slope           = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Slope.tif")                   # Declividade
-        self.aspect          = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Aspect.tif")                  # Para onde "aponta" a face do terreno
-        self.texture_02      = rxr.open_rasterio(r"D:\Mestrado\Trabalho Final\SIG\textura_2.tif")               # Textura a 2 cm
-        self.texture_20      = rxr.open_rasterio(r"D:\Mestrado\Trabalho Final\SIG\textura_20.tif")              # Textura a 20 cm
-        
+        self.features = build_feature_stack(self.rasters, r"D:/Mestrado/Trabalho Final/SIG/features", pad=self.janela//2)
+
         # X e Y dos valores
         if self.eval:
-            xx, yy = np.meshgrid(self.uso_solo.x.values, self.uso_solo.y.values) # type: ignore
-            self.x_y = np.column_stack([xx.ravel(), yy.ravel()])                 # type: ignore
-
-        # Dados dos rasteres concatenados
-        self.raster_data = np.array([
-            self.uso_solo.values[0], # type: ignore
-            self.elevation.values[0], # type: ignore
-            self.terrain_rug_idx.values[0], # type: ignore
-            self.topo_pos_idx.values[0], # type: ignore
-            self.roughness.values[0], # type: ignore
-            self.slope.values[0], # type: ignore
-            self.aspect.values[0], # type: ignore
-            self.texture_02.values[0], # type: ignore
-            self.texture_20.values[0], # type: ignore
-        ])
-
-        self.transformer = Transformer.from_crs("EPSG:31983", self.uso_solo.rio.crs, always_xy=True) # type: ignore
-        self.transform = self.uso_solo.rio.transform() # type: ignore
+            xx, yy = np.meshgrid(*self.features.xy())
+            self.x_y = np.column_stack([xx.ravel(), yy.ravel()])
+
+        # Dados dos rasteres concatenados (bandas, linhas, colunas), lidos do disco apenas quando indexados
+        self.raster_data = self.features.data
+
+        self.crs = self.features.crs
+        self.transformer = Transformer.from_crs("EPSG:31983", self.crs, always_xy=True)
+        self.transform = self.features.transform
+
+        # Distância até o talvegue de cada pixel, calculada uma vez e salva junto dos demais rasteres
+        print("Distância dos talvegues")
+        self.dist_talvegue = distance_raster(
+            self.talvegues.to_crs(self.crs).geometry.values,
+            self.rasters["USOSOLO"],
+            out_path=r"D:/Mestrado/Trabalho Final/SIG/DistanciaTalvegue.tif",
+        )
 
         print("Processando dados")
         self._process_dados()
 
+        # Janelas de todos os pixels, (bandas, linhas, colunas, janela, janela), criadas sob demanda
+        self._windows = None
+
     def _process_dados(self):
         # Dados para convolução
         x, y = self.transformer.transform(self.dados["Lon"], self.dados["Lat"])
@@ -109,75 +121,94 @@ class MeuDataset(Dataset):
         self.dados['s_col']=start_col
         self.dados['e_col']=end_col
 
-        # Distância até o talvegue principal
-        self.linhas_unidas = self.talvegues.union_all()
-        pontos = gpd.GeoSeries(gpd.points_from_xy(self.dados["Lon"], self.dados["Lat"]), crs="EPSG:31983")
-        dists = pontos.apply(lambda p: p.distance(self.linhas_unidas))
-        self.dados["dist_talvegue"] = dists
+        # Distância até o talvegue principal, no pixel do ponto (NaN para pontos fora do raster)
+        row, col = np.asarray(row), np.asarray(col)
+        height, width = self.dist_talvegue.shape
+        inside = (row >= 0) & (row < height) & (col >= 0) & (col < width)
+        self.dados["dist_talvegue"] = np.where(
+            inside,
+            self.dist_talvegue[np.clip(row, 0, height-1), np.clip(col, 0, width-1)],
+            np.nan,
+        )
 
 
-    def __len__(self):
-        return self.uso_solo.size if len(self.x_y) else len(self.dados) # type: ignore
+    @property
+    def windows(self) -> np.ndarray:
+        """Janelas `janela` x `janela` centradas em cada pixel, `(bandas, linhas, colunas, janela, janela)`.
 
-    def __getitem__(self, i):
-        idx = i
-        if isinstance(i, (int, float)):
-            idx = [i]
-        elif self.eval and (isinstance(i, slice) or isinstance(i, (list, np.ndarray))):
-            if isinstance(i, slice):
-                indices = list(range(*i.indices(len(self))))
-            else:
-                indices = i
-            
-            rasters = []
-            values = []
-            for idx in indices:
-                raster, value = self.__getitem__(idx)
-                rasters.append(raster[0])
-                values.append(value[0])
-
-            rasters = torch.stack(rasters)
-            values = torch.stack(values)
-            return rasters, values
-
-        # Modo de gerar os dados finais
-        if self.eval:
-            x_y = self.x_y[i] # type: ignore
-            x, y = self.transformer.transform(x_y[0], x_y[1])
-            row, col = rowcol(self.transform, x, y)
+        As janelas são uma visão (`sliding_window_view`) do cubo salvo com a borda em NaN, ainda com
+        memória mapeada: apenas as páginas das janelas indexadas são lidas do disco.
+        """
+        if self._windows is None:
+            self._windows = sliding_window_view(self.features.padded, (self.janela, self.janela), axis=(1, 2))
+        return self._windows
+
+    def _eval_pixels(self, indices) -> tuple[np.ndarray, np.ndarray]:
+        """Linha e coluna no raster dos pixels `indices` de `x_y`"""
+        x_y = self.x_y[indices] # type: ignore
+        x, y = self.transformer.transform(x_y[:, 0], x_y[:, 1])
+        rows, cols = rowcol(self.transform, x, y)
+        return np.asarray(rows), np.asarray(cols)
+
+    def _eval_batch(self, rows:np.ndarray, cols:np.ndarray, dtype:torch.dtype = torch.float64):
+        """Tensores `(rasters_vals (N, bandas, janela, janela), dist (N, 1))` dos pixels `rows`, `cols`.
+
+        Os tensores são montados direto em `dtype` (`torch.float64` como no treino, ou `torch.float32`),
+        sem passar pelo float64.
+        """
+        bands, height, width = self.raster_data.shape
+        np_dtype = np.float64 if dtype == torch.float64 else np.float32
 
-            bands, height, width = self.raster_data.shape
+        # Pixels fora do raster ficam com a janela inteira e a distância em NaN
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        rows = np.clip(rows, 0, height-1)
+        cols = np.clip(cols, 0, width-1)
 
-            jan = int((self.janela-1)/2)
-            window_shape = (bands, 2*jan + 1, 2*jan + 1)
+        # Banda a banda, para não manter uma segunda cópia do lote inteiro no dtype do cubo
+        patches = np.empty((len(rows), bands, self.janela, self.janela), dtype=np_dtype)
+        for band in range(bands):
+            patches[:, band] = self.windows[band, rows, cols]
+        patches[~inside] = np.nan
 
-            # Criar janela preenchida com NaN
-            janela_data = np.full(window_shape, np.nan, dtype=self.raster_data.dtype)
+        # Distância do talvegue
+        dist = np.where(inside, self.dist_talvegue[rows, cols], np.nan).astype(np_dtype)
 
-            # Calcular limites válidos dentro do raster
-            row_min = max(0, row - jan) # type: ignore
-            row_max = min(height, row + jan + 1) # type: ignore
+        rasters_vals = torch.as_tensor(patches, dtype=dtype, device=self.device)
+        dist = torch.as_tensor(dist[:, None], dtype=dtype, device=self.device)
+        return rasters_vals, dist
 
-            col_min = max(0, col - jan) # type: ignore
-            col_max = min(width, col + jan + 1) # type: ignore
-            
-            # Limites relativos à janela
-            win_row_start = row_min - (row - jan)
-            win_row_end   = win_row_start + (row_max - row_min)
+    def iter_batches(self, batch_pixels:int = 2048, dtype:torch.dtype = torch.float64):
+        """Percorre todos os pixels do raster (modo `eval`) em lotes de até `batch_pixels` pixels.
 
-            win_col_start = col_min - (col - jan)
-            win_col_end   = win_col_start + (col_max - col_min)
-            
-            # Copiar a parte válida do raster para a janela
-            janela_data[:, win_row_start:win_row_end, win_col_start:win_col_end] = self.raster_data[:, row_min:row_max, col_min:col_max]
+        Retorna `(slice dos índices do dataset, rasters_vals, dist)` de cada lote, em `dtype`. O tamanho do
+        lote não depende da largura do raster: cada pixel tem `bandas x janela x janela` valores
+        (~22 KB em float32), então `batch_pixels=2048` são ~45 MB por lote.
+        """
+        if not self.eval:
+            raise ValueError("iter_batches só pode ser usado no modo eval")
+        if batch_pixels < 1:
+            raise ValueError(f"batch_pixels deve ser >= 1: {batch_pixels}")
+
+        for start in range(0, len(self), batch_pixels):
+            end = min(len(self), start + batch_pixels)
+            yield slice(start, end), *self._eval_batch(*self._eval_pixels(slice(start, end)), dtype=dtype)
+
+    def __len__(self):
+        return self.features.height*self.features.width if self.eval else len(self.dados)
 
-            # Distância do talvegue
-            p = Point(x, y)
-            dist = torch.tensor(np.array([[distance(p, self.linhas_unidas)]]), device=self.device)
+    def __getitem__(self, i):
+        idx = i
+        if isinstance(i, (int, float)):
+            idx = [i]
 
-            rasters_vals = torch.tensor(np.array([janela_data]), device=self.device, dtype=torch.float64)
+        # Modo de gerar os dados finais, todos os pixels pedidos de uma vez
+        if self.eval:
+            if isinstance(i, slice):
+                indices = np.arange(*i.indices(len(self)))
+            else:
+                indices = np.atleast_1d(np.asarray(idx, dtype=np.int64))
 
-            return (rasters_vals, dist)
+            return self._eval_batch(*self._eval_pixels(indices))
 
         # Pontos
         pontos = self.dados.loc[idx]
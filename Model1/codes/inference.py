@@ -0,0 +1,128 @@
+import queue
+import threading
+import numpy as np
+import rasterio
+
+from time import perf_counter
+from tqdm import tqdm
+from rasterio.windows import Window
+
+import torch
+
+from utils.raster_blocks import tiled_profile
+from Model1.codes.dataset import MeuDataset
+
+
+def _prefetch(iterator, prefetch:int):
+    """Executa `iterator` em uma thread, mantendo até `prefetch` itens prontos na fila"""
+    items = queue.Queue(maxsize=prefetch)
+    done = object()
+    errors = []
+
+    def worker():
+        try:
+            for item in iterator:
+                items.put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            items.put(done)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    while True:
+        item = items.get()
+        if item is done:
+            break
+        yield item
+
+    thread.join()
+    if errors:
+        raise errors[0]
+
+def predict_raster(
+    model:torch.nn.Module,
+    dataset:MeuDataset,
+    out_path:str,
+    batch_pixels:int = 2048,
+    dtype:torch.dtype = torch.float32,
+    prefetch:int = 2,
+    n_threads:int|None = None,
+    block_size:int = 256,
+) -> dict:
+    """Aplica o `model` em todos os pixels do `dataset` (modo `eval`) e salva o resultado em `out_path`.
+
+    - `batch_pixels`: pixels por lote, independente da largura do raster (~22 KB por pixel em float32)
+    - `dtype`: `torch.float64` (como no treino), `torch.float32` ou `torch.bfloat16` (autocast na CPU)
+    - `prefetch`: lotes preparados em uma thread enquanto o modelo processa o lote atual
+    - `n_threads`: threads do PyTorch na CPU, por padrão as do PyTorch
+
+    Os lotes são montados direto no dtype dos pesos. A predição é acumulada em um bloco de `block_size`
+    linhas e gravada em um GeoTIFF tileado no grid dos rasteres do `dataset`. O modelo volta ao dtype e
+    ao modo de treino originais ao final, mesmo em caso de erro.
+    Retorna `{"pixels", "seconds", "pixels_per_second"}`.
+    """
+    if not dataset.eval:
+        raise ValueError("O dataset deve estar no modo eval")
+    if dtype not in (torch.float64, torch.float32, torch.bfloat16):
+        raise ValueError(f"dtype {dtype} não suportado, use torch.float64, torch.float32 ou torch.bfloat16")
+
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+
+    # bfloat16 roda com os pesos em float32 e autocast, as camadas que suportam usam bfloat16.
+    # O `model.to` altera o próprio modelo, então o dtype e o modo de treino são restaurados no final
+    weights_dtype = torch.float32 if dtype == torch.bfloat16 else dtype
+    device = next(model.parameters()).device
+    original_dtype = next(model.parameters()).dtype
+    was_training = model.training
+    model.to(dtype=weights_dtype).eval()
+
+    try:
+        _, height, width = dataset.raster_data.shape
+        profile = tiled_profile({
+            "width": width,
+            "height": height,
+            "crs": dataset.crs,
+            "transform": dataset.transform,
+        }, dtype="float32", block_size=block_size)
+
+        # Linhas completas da predição, gravadas a cada `block_size` linhas (uma faixa de tiles)
+        buffer = np.empty(min(block_size, height)*width, dtype=np.float32)
+        filled = 0
+        row_off = 0
+
+        n_pixels = 0
+        start = perf_counter()
+        with rasterio.open(out_path, "w", **profile) as dst, torch.inference_mode():
+            batches = dataset.iter_batches(batch_pixels, dtype=weights_dtype)
+            bar = tqdm(_prefetch(batches, prefetch), total=-(-len(dataset)//batch_pixels), desc="Inferência")
+            for idx, rasters, dist in bar:
+                rasters = rasters.to(device=device, non_blocking=True)
+                dist = dist.to(device=device, non_blocking=True)
+
+                with torch.autocast(device.type, dtype=torch.bfloat16, enabled=dtype == torch.bfloat16):
+                    y_pred = model(rasters, dist)
+
+                values = y_pred[:, 0].float().cpu().numpy()
+                while len(values):
+                    n = min(len(values), len(buffer) - filled)
+                    buffer[filled:filled + n] = values[:n]
+                    filled += n
+                    values = values[n:]
+
+                    if filled == len(buffer) or (row_off*width + filled == height*width):
+                        rows = filled//width
+                        dst.write(buffer[:filled].reshape(rows, width), 1, window=Window(0, row_off, width, rows))
+                        row_off += rows
+                        filled = 0
+
+                n_pixels += idx.stop - idx.start
+                bar.set_postfix(px_s=f"{n_pixels/(perf_counter() - start):.0f}")
+    finally:
+        model.to(dtype=original_dtype).train(was_training)
+
+    seconds = perf_counter() - start
+    print(f"{n_pixels} pixels em {seconds:.1f} s ({n_pixels/seconds:.0f} pixels/s)")
+    return {"pixels": n_pixels, "seconds": seconds, "pixels_per_second": n_pixels/seconds}
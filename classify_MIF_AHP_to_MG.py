@@ -1,11 +1,6 @@
-import jenkspy
-import numpy as np
 import pandas as pd
-import xarray as xr
-import rioxarray as rxr
 
-from tqdm import tqdm
-from utils import USO_SOLO_MAPBIOMAS
+from utils import potencial_mg, jenks_raster, classify_raster
 from time import sleep
 
 print("Tabela de fatores de influência")
@@ -24,7 +19,6 @@ print(tabela_pesos)
 # CONFIGURAÇÕES
 # ------------------------------------------------------------------
 
-tipos_unicos = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
 chunks = {"x": 1024, "y": 1024}
 
 # ------------------------------------------------------------------
@@ -33,161 +27,43 @@ chunks = {"x": 1024, "y": 1024}
 
 
 print("Rodando loop")
-tipos_unicos = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
-chunks = {"x": 1024, "y": 1024}
-
-for forma in []: #["MIF", "AHP"]:
-    tipo = f"Influência {forma}"
-
-    print("Obtendo dados do raster original")
-    uni_geo = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/UnidadesGeologicas_MG.tif")
-    coords={"x": uni_geo.x, "y": uni_geo.y}
-    original_crs = uni_geo.rio.crs
-
-    print("Lendo demais rasteres")
-    print("Uni. Geológica")
-    uni_geo:np.ndarray     = uni_geo.values[0].astype("uint8")
-    index:np.ndarray = (uni_geo * tabela_pesos[tipo].values[0]).astype("float32")
-    del uni_geo
-
-
-
-    print("Cálculos para uso do solo")
-    print("Uso do Solo")
-    uso_solo:np.ndarray    = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/UsoSoloMG.tif").values[0].astype("float32")
-    for key, value in USO_SOLO_MAPBIOMAS.items():
-        index[uso_solo==key] += (value['infiltration_index'] * tabela_pesos[tipo].values[1]).astype("float32")
-    del uso_solo
-
-
-
-    print("Cálculos para declividade")
-    declividade:np.ndarray = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Slope_MG.tif").values[0].astype("float32")
-    index[(declividade < 6.7)]                        += (4 * tabela_pesos[tipo].values[2]).astype("float32")
-    index[(declividade >= 6.7)  & (declividade < 20)] += (3 * tabela_pesos[tipo].values[2]).astype("float32")
-    index[(declividade >= 20) & (declividade < 40)]   += (2 * tabela_pesos[tipo].values[2]).astype("float32")
-    index[(declividade >= 40)]                        += (1 * tabela_pesos[tipo].values[2]).astype("float32")
-    index[(declividade < 0)|(declividade > 360)]      = np.nan
-    del declividade
-
-
-
-    print("Cálculos para elevação")
-    elevacao:np.ndarray    = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Elevation_MG.tif").values[0].astype("float32")
-    index[ elevacao  <  300]                      += (9 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >=  300) & (elevacao <  500)] += (8 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >=  500) & (elevacao <  600)] += (7 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >=  600) & (elevacao <  700)] += (6 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >=  700) & (elevacao <  800)] += (5 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >=  800) & (elevacao <  900)] += (4 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >=  900) & (elevacao < 1100)] += (3 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >= 1100) & (elevacao < 1300)] += (2 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[(elevacao >= 1300)]                     += (1 * tabela_pesos[tipo].values[3]).astype("float32")
-    index[elevacao < 0]                            = np.nan
-    del elevacao
-
-
-
-    print("Cálculos para a Textura")
-    tipo_solo:np.ndarray   = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/TipoSoloIDE_MG.tif").values[0].astype("uint8")
-    for tipo_unico in tipos_unicos:
-        index[tipo_solo==tipo_unico] += (tipo_unico * tabela_pesos[tipo].values[4]).astype("float32")
-    del tipo_solo
-
-
+rasteres = [
+    r"D:/Mestrado/Trabalho Final/SIG/UnidadesGeologicas_MG.tif",
+    r"D:/Mestrado/Trabalho Final/SIG/UsoSoloMG.tif",
+    r"D:/Mestrado/Trabalho Final/SIG/Slope_MG.tif",
+    r"D:/Mestrado/Trabalho Final/SIG/Elevation_MG.tif",
+    r"D:/Mestrado/Trabalho Final/SIG/TipoSoloIDE_MG.tif",
+]
 
-    # # Outras informações
-    # index.values[np.isnan(index.values)] = -9999
+formas = [] #["MIF", "AHP"]
 
-    # # (opcional) definir valor nodata
-    # index = index.rio.write_nodata(-9999)
+# Os cinco rasteres são lidos juntos, janela a janela, uma única vez para todas as formas,
+# e cada bloco é gravado direto nos GeoTIFFs
+if formas:
+    pesos  = {forma: tabela_pesos[f"Influência {forma}"].values for forma in formas}
+    saidas = {forma: fr"D:\Mestrado\Trabalho Final\SIG\Potencial_MG_{forma}.tif" for forma in formas}
 
-    # Salvar como GeoTIFF
-    xr_array = xr.DataArray(
-        index.astype("float32"),
-        dims=("y", "x"),
-        coords=coords,
-        name=f"classificacao_potencial_{tipo.lower()}"
-    )
-    del coords, index
-
-    # Copiar CRS e transformar em um raster compatível
-    # xr_array = xr_array.rio.write_crs(original_crs)
-    # xr_array = xr_array.rio.reproject_match(potencial_infiltracao)
-
-    # (opcional) definir valor nodata
-    # xr_array = xr_array.rio.write_nodata(-9999)
-
-    # Salvar como GeoTIFF
-    saida = fr"D:\Mestrado\Trabalho Final\SIG\Potencial_MG_{forma}.tif"
-    xr_array.rio.to_raster(saida)
-    del xr_array
-    print(f"✅ Raster salvo com sucesso em: '{saida}'")
+    potencial_mg(rasteres, pesos, saidas, block_size=chunks["x"])
+    for saida in saidas.values():
+        print(f"✅ Raster salvo com sucesso em: '{saida}'")
 
 
 # Fazer esta parte, não colocarei junto.
 
-uni_geo = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/UnidadesGeologicas_MG.tif")
-coords={"x": uni_geo.x, "y": uni_geo.y}
-original_crs = uni_geo.rio.crs
-del uni_geo
-
 for forma in ["MIF", "AHP"]:
     # Classificação utilizando Jenks
     k = 5
 
-    print(f"Lendo potencial {forma}")
-    potencial_infiltracao = rxr.open_rasterio(rf'D:\Mestrado\Trabalho Final\SIG\Potencial_MG_{forma}.tif')
-
-    flat = potencial_infiltracao.values[0].flatten()
-    del potencial_infiltracao
-    flat = flat[flat>=0]
-
+    # Jenks sobre o histograma do raster inteiro, lido por blocos e sem amostragem
     print(f"Calculando Jenks {forma}")
-    choices = np.random.choice(flat, size=100_000, replace=False)
-    del flat
-    breaks = jenkspy.jenks_breaks(choices, n_classes=k)
+    jenks = jenks_raster(rf'D:\Mestrado\Trabalho Final\SIG\Potencial_MG_{forma}.tif', n_classes=k, valid_range=(0, None), block_size=chunks["x"])
+    breaks = jenks["breaks"]
     breaks[-1] = 100 # Valor alto para ser "Menor" que ele
-    # del choices
     print(f"Tipo: {forma}\nClasses Jenks:\n\t{'\n\t'.join([str(i) for i in breaks[1:]])}")
+    print(f"GVF: {jenks['gvf']:.4f} | Resolução das quebras (amplitude dos bins): {jenks['bin_resolution']:.6f}")
 
-    print("Lendo potencial de infiltração")
-    potencial_infiltracao = rxr.open_rasterio(rf'D:\Mestrado\Trabalho Final\SIG\Potencial_MG_{forma}.tif').values[0].astype("float32")
-    classificacao_potencial = np.zeros_like(potencial_infiltracao).astype("uint8")
-
-
-    last_break = None
-    now_break = None
-    for i, _break in tqdm(enumerate(breaks[1:], 1), desc="Processando", total=len(breaks)):
-        now_break = _break
-
-        mask = potencial_infiltracao <= now_break
-
-        if last_break is not None:
-            mask = mask & (potencial_infiltracao > last_break)
-        last_break = now_break
-
-        classificacao_potencial[mask] = i
-        del mask
-
-    # Criar um novo DataArray com as mesmas coordenadas e metadados
-    print("Gerando Raster")
-    potencial_de = xr.DataArray(
-        classificacao_potencial.astype("uint8"),
-        dims=("y", "x"),
-        coords=coords,
-        name=f"classificacao_potencial_{forma}"
-    )
-
-    # Copiar CRS e transformar em um raster compatível
-    potencial_de = potencial_de.rio.write_crs(original_crs)
-    # potencial_de = potencial_de.rio.reproject_match(potencial_infiltracao)
-
-    # (opcional) definir valor nodata
-    # potencial_de = potencial_de.rio.write_nodata(-9999)
-
-    # Salvar como GeoTIFF
-    print("Salvando Raster")
+    # Classes 1..k em uint8, calculadas bloco a bloco, sem dados = 255
+    entrada = rf'D:\Mestrado\Trabalho Final\SIG\Potencial_MG_{forma}.tif'
     saida = fr"D:\Mestrado\Trabalho Final\SIG\Classificacao_Infiltracao_MG_{forma}.tif"
-    potencial_de.rio.to_raster(saida)
-    print(f"✅ Raster salvo com sucesso em: '{saida}'")
\ No newline at end of file
+    classify_raster(entrada, breaks, saida, valid_range=(0, None), block_size=chunks["x"])
+    print(f"✅ Raster salvo com sucesso em: '{saida}'")
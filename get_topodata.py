@@ -1,10 +1,8 @@
-import zipfile
 import os, tempfile
-import rioxarray as rxr
-from tqdm import tqdm
-from rioxarray.merge import merge_arrays
 from rasterio.env import Env
 
+from utils.mosaic import build_mosaic
+
 # === configurando o temp do GDAL ===
 os.environ["GDAL_TMPDIR"] = "D:/APAGAR"
 os.environ["CPL_TMPDIR"]  = "D:/APAGAR"
@@ -16,38 +14,13 @@ tempfile.tempdir = "D:/APAGAR"
 
 raster_dir = "rasters_declividade"
 
-
-for file in os.listdir(raster_dir):
-    if file.lower().endswith(".zip"):
-        zip_path = os.path.join(raster_dir, file)
-
-        with zipfile.ZipFile(zip_path, "r") as z:
-            for name in z.namelist():
-                out_path = os.path.join(raster_dir, name)
-                if not os.path.exists(out_path):
-                    z.extract(name, raster_dir)
-
-# === carregue TUDO em RAM ===
-rasters = sorted(
-    f for f in os.listdir(raster_dir)
-    if f.lower().endswith(".tif")
-)
-
-rasters_readed = []
-for raster in tqdm(rasters, desc="Lendo rasters"):
-    rst = rxr.open_rasterio(f"rasters_declividade/{raster}", masked=True).load()
-    rst = rst.rio.write_crs("EPSG:4326")
-    rasters_readed.append(rst)
-
-# === agora 1 merge ÚNICO ===
+# === mosaico janela a janela, lendo as folhas direto dos zips ===
+# Cada janela lê apenas as folhas que a cruzam; se for interrompido, continua de onde parou.
 with Env(
     GDAL_TEMPDIR="D:/APAGAR",
-    GDAL_CACHEMAX=4096  # 4GB in RAM
+    GDAL_CACHEMAX=512,
 ):
-    mosaic = merge_arrays(rasters_readed)
-
-# === Salvar ===
-mosaic.rio.to_raster("mosaic_topodata.tif")
+    build_mosaic(raster_dir, "mosaic_topodata.tif", crs="EPSG:4326")
 
 
 
@@ -13,7 +13,10 @@ import geopandas as gpd
 import rioxarray as rxr
 import matplotlib.pyplot as plt
 
-from utils import Infiltrometro, ALL_FUNCTIONS, nse, points_distance, USO_SOLO_CLASS, SOIL_TYPES
+from rasterio.enums import Resampling
+from utils import Infiltrometro, ALL_FUNCTIONS, nse, points_distance, ELEVACAO_INTERVALOS, DECLIVIDADE_INTERVALOS
+from utils import reclassify_lut, reclassify_intervals, lut_from_classes, LUT_SOIL_TYPES, LUT_USO_SOLO_CLASS, weighted_overlay, jenks_array
+from utils import classify_breaks, NODATA_CLASSE, align_rasters
 
 from tqdm import tqdm
 from xgboost import XGBRegressor
@@ -339,14 +342,42 @@ fatores
 
 # %%
 print("Lendo Rasteres")
-textura         = rxr.open_rasterio(r"D:\Mestrado\Trabalho Final\SIG\20_SOILTYPE.tif")             # Textura a 20 cm
-tipo_solo       = rxr.open_rasterio(r"D:\Mestrado\Trabalho Final\SIG\TipoSoloIDE.tif")             # Tipo de Solo IDE Sisema
-uso_solo        = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/USOSOLO.tif")                 # Tipos de uso do solo
-form_geo        = rxr.open_rasterio(r"D:\Mestrado\Trabalho Final\SIG\FormacaoGeologica.tif")       # Formação Geológica
-elevation       = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Elevation.tif")               # Elevação
-slope           = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Slope.tif")                   # Declividade
-roughness       = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Roughness.tif")               # A diferença entre a elevação máxima e mínima dentro de uma vizinhança
-aspect          = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Aspect.tif")                  # Para onde "aponta" a face do terreno
+
+# Todos os rasteres no grid da textura, reprojetados uma única vez e salvos em cache
+RASTERES = {
+    "textura":   r"D:\Mestrado\Trabalho Final\SIG\20_SOILTYPE.tif",             # Textura a 20 cm
+    "tipo_solo": r"D:\Mestrado\Trabalho Final\SIG\TipoSoloIDE.tif",             # Tipo de Solo IDE Sisema
+    "uso_solo":  r"D:/Mestrado/Trabalho Final/SIG/USOSOLO.tif",                 # Tipos de uso do solo
+    "form_geo":  r"D:\Mestrado\Trabalho Final\SIG\FormacaoGeologica.tif",       # Formação Geológica
+    "elevation": r"D:/Mestrado/Trabalho Final/SIG/Elevation.tif",               # Elevação
+    "slope":     r"D:/Mestrado/Trabalho Final/SIG/Slope.tif",                   # Declividade
+    "roughness": r"D:/Mestrado/Trabalho Final/SIG/Roughness.tif",               # A diferença entre a elevação máxima e mínima dentro de uma vizinhança
+    "aspect":    r"D:/Mestrado/Trabalho Final/SIG/Aspect.tif",                  # Para onde "aponta" a face do terreno
+}
+
+# Reamostragem de cada raster: vizinho mais próximo nas classes e bilinear nos contínuos. O aspecto é
+# circular (0-360°), a interpolação entre 359° e 1° daria ~180°, então também usa o vizinho mais próximo
+REAMOSTRAGEM = {
+    "textura":   Resampling.nearest,
+    "tipo_solo": Resampling.nearest,
+    "uso_solo":  Resampling.nearest,
+    "form_geo":  Resampling.nearest,
+    "elevation": Resampling.bilinear,
+    "slope":     Resampling.bilinear,
+    "roughness": Resampling.bilinear,
+    "aspect":    Resampling.nearest,
+}
+
+alinhados = align_rasters(RASTERES, RASTERES["textura"], r"D:\Mestrado\Trabalho Final\SIG\Alinhados", resampling=REAMOSTRAGEM)
+
+textura         = rxr.open_rasterio(alinhados["textura"])
+tipo_solo       = rxr.open_rasterio(alinhados["tipo_solo"])
+uso_solo        = rxr.open_rasterio(alinhados["uso_solo"])
+form_geo        = rxr.open_rasterio(alinhados["form_geo"])
+elevation       = rxr.open_rasterio(alinhados["elevation"])
+slope           = rxr.open_rasterio(alinhados["slope"])
+roughness       = rxr.open_rasterio(alinhados["roughness"])
+aspect          = rxr.open_rasterio(alinhados["aspect"])
 
 # %% [markdown]
 # # Variáveis de Apoio
@@ -354,11 +385,7 @@ aspect          = rxr.open_rasterio(r"D:/Mestrado/Trabalho Final/SIG/Aspect.tif"
 # %%
 # Textura
 
-texture_index = np.zeros_like(textura, dtype=float)
-
-for tipo, values in SOIL_TYPES.items():
-    texture_index[textura.values == tipo] = values['infiltration_index']
-texture_index[textura<0] = np.nan
+texture_index = reclassify_lut(textura.values, LUT_SOIL_TYPES, below=np.nan)
 
 texture_index
 
@@ -366,12 +393,7 @@ texture_index
 # %%
 # Uso do solo para influência na infiltração
 
-uso_solo_index = np.zeros_like(uso_solo, dtype=float)
-
-for tipo, values in USO_SOLO_CLASS.items():
-    uso_solo_index[uso_solo.values == tipo] = values['infiltration_index']
-
-uso_solo_index[uso_solo.values < 0] = np.nan
+uso_solo_index = reclassify_lut(uso_solo.values, LUT_USO_SOLO_CLASS, below=np.nan)
 uso_solo_index
 
 # %%
@@ -384,41 +406,19 @@ index = {
     1111: 4, # Grupo Piracicaba - A presença dominante de quartzitos (permeáveis) aumenta o potencial de infiltração, apesar da intercalação de filitos reduzir localmente.
 }
 
-form_geo_index = np.zeros_like(form_geo, dtype=float)
-
-for tipo, value in index.items():
-    form_geo_index[form_geo.values == tipo] = value
-form_geo_index[form_geo.values < 0] = np.nan
+form_geo_index = reclassify_lut(form_geo.values, lut_from_classes(index), below=np.nan)
 
 form_geo_index
 
 
 # %%
-elevation_index = np.zeros_like(elevation.values, dtype=float)
-
-
-elevation_index[(elevation_index < 800)] = 9
-elevation_index[(elevation_index >= 800) & (elevation_index < 900)] = 8
-elevation_index[(elevation_index >= 900) & (elevation_index < 1000)] = 7
-elevation_index[(elevation_index >= 1000) & (elevation_index < 1100)] = 6
-elevation_index[(elevation_index >= 1100) & (elevation_index < 1200)] = 5
-elevation_index[(elevation_index >= 1200) & (elevation_index < 1300)] = 4
-elevation_index[(elevation_index >= 1300) & (elevation_index < 1400)] = 3
-elevation_index[(elevation_index >= 1400) & (elevation_index < 1500)] = 2
-elevation_index[(elevation_index >= 1500)] = 1
-elevation_index[elevation.values < 0] = np.nan
+elevation_index = reclassify_intervals(elevation.values, *ELEVACAO_INTERVALOS, valid_range=(0, None))
 
 elevation_index
 
 # %%
 # Declividade é similar a rugosidade, pois quanto maior for a declividade menor é a infiltração
-slope_index = np.zeros_like(slope.values, dtype=float)
-
-slope_index[(slope_index < 8)]                        = 4
-slope_index[(slope_index >= 8)  & (slope_index < 15)] = 3
-slope_index[(slope_index >= 15) & (slope_index < 25)] = 2
-slope_index[(slope_index >= 25)]                      = 1
-slope_index[slope.values < 0] = np.nan
+slope_index = reclassify_intervals(slope.values, *DECLIVIDADE_INTERVALOS, valid_range=(0, None))
 
 slope_index
 
@@ -467,26 +467,19 @@ aspect_per_sun_index
 tabela_pesos
 
 # %%
-for tipo in ["MIF", "AHP"]:
-    if metodo == 1:
-        potencial_infiltracao = (
-            tabela_pesos.loc[0][f"Influência {tipo}"] * texture_index + \
-            tabela_pesos.loc[1][f"Influência {tipo}"] * uso_solo_index + \
-            tabela_pesos.loc[2][f"Influência {tipo}"] * form_geo_index + \
-            tabela_pesos.loc[3][f"Influência {tipo}"] * elevation_index + \
-            tabela_pesos.loc[4][f"Influência {tipo}"] * slope_index + \
-            tabela_pesos.loc[5][f"Influência {tipo}"] * roughness_index + \
-            tabela_pesos.loc[6][f"Influência {tipo}"] * aspect_per_sun_index
-        )
-    elif metodo == 2:
-        potencial_infiltracao = (
-            tabela_pesos.loc[0][f"Influência {tipo}"] * form_geo_index + \
-            tabela_pesos.loc[1][f"Influência {tipo}"] * uso_solo_index + \
-            tabela_pesos.loc[2][f"Influência {tipo}"] * slope_index + \
-            tabela_pesos.loc[3][f"Influência {tipo}"] * elevation_index + \
-            tabela_pesos.loc[4][f"Influência {tipo}"] * texture_index
-        )
+if metodo == 1:
+    fatores_index = [texture_index, uso_solo_index, form_geo_index, elevation_index, slope_index, roughness_index, aspect_per_sun_index]
+elif metodo == 2:
+    fatores_index = [form_geo_index, uso_solo_index, slope_index, elevation_index, texture_index]
 
+# Todos os potenciais (MIF e AHP) em uma única passada pelos fatores
+potenciais = weighted_overlay(
+    fatores_index,
+    {tipo: tabela_pesos[f"Influência {tipo}"].values for tipo in ["MIF", "AHP"]},
+)
+
+for tipo in ["MIF", "AHP"]:
+    potencial_infiltracao = potenciais[tipo]
     potencial_infiltracao[np.isnan(potencial_infiltracao)] = -9999
 
     # Garantir que o resultado tem o mesmo shape que o raster base
@@ -500,9 +493,8 @@ for tipo in ["MIF", "AHP"]:
         name=f"potencial_infiltracao_{tipo.lower()}"
     )
 
-    # Copiar CRS e transformar em um raster compatível
+    # Copiar o CRS, as coordenadas já são as do grid da textura
     potencial_da = potencial_da.rio.write_crs(textura.rio.crs)
-    potencial_da = potencial_da.rio.reproject_match(textura)
 
     # (opcional) definir valor nodata
     potencial_da = potencial_da.rio.write_nodata(-9999)
@@ -516,44 +508,25 @@ for tipo in ["MIF", "AHP"]:
     # Classificação utilizando Jenks
     k = 5
 
-    flat = potencial_infiltracao.flatten()
-    flat = flat[flat>=0]
-    breaks = jenkspy.jenks_breaks(flat, n_classes=k)
+    jenks = jenks_array(potencial_infiltracao, n_classes=k, valid_range=(0, None))
+    breaks = jenks["breaks"]
 
     print(f"Tipo: {tipo}\nMétodo: {metodo}\nClasses Jenks:\n\t{'\n\t'.join([str(i) for i in breaks])}")
 
-    classificacao_potencial = np.full_like(potencial_infiltracao, fill_value=-9999)
-
-    last_break = None
-    now_break = None
-    for i, _break in enumerate(breaks[1:], 1):
-        now_break = _break
-
-        mask = potencial_infiltracao <= now_break
-
-        if last_break is not None:
-            mask = mask & (potencial_infiltracao > last_break)
-        last_break = now_break
-
-        classificacao_potencial[mask] = i
-    
-    maskNone = potencial_infiltracao < 0
-    classificacao_potencial[maskNone] = -9999
+    # Classes 1..k em uint8 em uma única passada, sem dados = NODATA_CLASSE
+    classificacao_potencial = classify_breaks(potencial_infiltracao, breaks, valid_range=(0, None))
 
     # Criar um novo DataArray com as mesmas coordenadas e metadados
     potencial_de = xr.DataArray(
-        classificacao_potencial.astype("float32"),
+        classificacao_potencial,
         dims=("y", "x"),
         coords={"x": textura.x, "y": textura.y},
         name=f"classificacao_potencial_{tipo.lower()}"
     )
 
-    # Copiar CRS e transformar em um raster compatível
+    # Copiar o CRS, as coordenadas já são as do grid da textura
+    potencial_de = potencial_de.rio.write_nodata(NODATA_CLASSE)
     potencial_de = potencial_de.rio.write_crs(textura.rio.crs)
-    potencial_de = potencial_de.rio.reproject_match(textura)
-
-    # (opcional) definir valor nodata
-    potencial_de = potencial_de.rio.write_nodata(-9999)
 
     # Salvar como GeoTIFF
     saida = fr"D:\Mestrado\Trabalho Final\SIG\Classificacao_Infiltracao_{tipo}_{metodo}.tif"
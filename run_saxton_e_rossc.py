@@ -12,7 +12,7 @@ import geopandas as gpd
 import rioxarray as rxr
 import matplotlib.pyplot as plt
 
-from utils import Infiltrometro, ALL_FUNCTIONS, nse, points_distance, USO_SOLO_CLASS, SOIL_TYPES, run_rf_xgb
+from utils import Infiltrometro, ALL_FUNCTIONS, nse, points_distance, USO_SOLO_CLASS, SOIL_TYPES, run_rf_xgb, jenks_array, classify_breaks, NODATA_CLASSE
 
 from tqdm import tqdm
 from xgboost import XGBRegressor
@@ -68,47 +68,33 @@ for key in keys:
     # Classificação em 5 classes usando Jenks
     
     print(f"Gerando Jenks para {key}")
-    breaks = jenkspy.jenks_breaks(np.random.choice(values[values >= 0].flatten(), size=100_000, replace=False), n_classes=5)
+    # Jenks determinístico com todos os pixels, sem a amostra aleatória de 100 mil valores
+    jenks = jenks_array(values, n_classes=5, valid_range=(0, None))
+    breaks = jenks["breaks"]
     print(f"Tipo: {key}\nClasses Jenks:\n\t{'\n\t'.join([str(i) for i in breaks])}")
 
-    classificacao_potencial = np.full_like(values, fill_value=-9999)
-
-    last_break = None
-    now_break = None
-    for i, _break in enumerate(breaks, 1):
-        now_break = _break
-
-        mask = values <= now_break
-
-        if last_break is not None:
-            mask = mask & (values > last_break)
-        last_break = now_break
-
-        classificacao_potencial[mask] = i
-
-    maskNone = values < 0
-    classificacao_potencial[maskNone] = -9999
+    # Classes 1..k em uint8 em uma única passada, sem dados = NODATA_CLASSE
+    classificacao_potencial = classify_breaks(values, breaks, valid_range=(0, None))
 
     # Criar um novo DataArray com as mesmas coordenadas e metadados
     potencial_da = xr.DataArray(
-        classificacao_potencial.astype("float32"),
+        classificacao_potencial,
         dims=("y", "x"),
         coords={"x": textura.x, "y": textura.y},
         name=f"potencial_infiltracao_{key.lower()}"
     )
 
     # Copiar CRS e transformar em um raster compatível
+    potencial_da = potencial_da.rio.write_nodata(NODATA_CLASSE)
     potencial_da = potencial_da.rio.write_crs(textura.rio.crs)
     potencial_da = potencial_da.rio.reproject_match(textura)
 
-    # (opcional) definir valor nodata
-    potencial_da = potencial_da.rio.write_nodata(-9999)
-
     # Salvar como GeoTIFF
     saida = fr"D:\Mestrado\Trabalho Final\SIG\Classificacao_Infiltracao_{key}.tif"
     # potencial_da.rio.to_raster(saida)
     print(f"✅ Raster salvo com sucesso em: '{saida}'")
 
     print(f"Gerando Jenks Classificação {key}")
-    breaks = jenkspy.jenks_breaks(np.random.choice(classificacao_potencial[classificacao_potencial>=0].flatten(), size=100_000, replace=False), n_classes=5)
+    jenks = jenks_array(classificacao_potencial, n_classes=5, valid_range=(1, NODATA_CLASSE - 1))
+    breaks = jenks["breaks"]
     print(f"Tipo: {key}\nClasses Jenks:\n\t{'\n\t'.join([str(i) for i in breaks])}")
\ No newline at end of file
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import rasterio
+import shapely
+
+from rasterio.transform import from_origin
+
+from utils.zonal import zonal_stats
+
+
+@pytest.fixture
+def raster(tmp_path):
+    """Raster float 100 x 100 (pixels de 1 m) com um bloco de NaN no centro"""
+    values = np.random.default_rng(0).random((100, 100)).astype(np.float32)
+    values[40:60, 40:60] = np.nan
+
+    path = tmp_path / "raster.tif"
+    with rasterio.open(
+        path, "w", driver="GTiff", width=100, height=100, count=1, dtype="float32",
+        transform=from_origin(0, 100, 1, 1), crs="EPSG:31983",
+    ) as dst:
+        dst.write(values, 1)
+    return str(path), values
+
+def test_zonal_stats_zonas_vazias(raster):
+    path, values = raster
+    zones = {
+        "a":    shapely.box(0, 70, 30, 100),      # Linhas 0:30, colunas 0:30
+        "nan":  shapely.box(42, 42, 58, 58),      # Apenas pixels NaN, zona vazia no meio
+        "b":    shapely.box(60, 10, 90, 40),      # Linhas 60:90, colunas 60:90
+        "fora": shapely.box(200, 200, 210, 210),  # Fora do grid, zona vazia no fim
+    }
+
+    table = zonal_stats({"r": path}, zones).set_index("zone")
+
+    for zone, block in (("a", values[0:30, 0:30]), ("b", values[60:90, 60:90])):
+        row = table.loc[zone]
+        assert row["count"] == block.size
+        assert row["mean"] == pytest.approx(block.mean(dtype=np.float64))
+        assert row["median"] == pytest.approx(np.median(block))
+        assert row["min"] == pytest.approx(block.min())
+        assert row["max"] == pytest.approx(block.max())
+
+    for zone in ("nan", "fora"):
+        row = table.loc[zone]
+        assert row["count"] == 0
+        assert row[["mean", "median", "min", "max"]].isna().all()
@@ -1,5 +1,10 @@
 import numpy as np
-from rosetta import rosetta, SoilData
+import rasterio
+
+from functools import partial
+
+from .rosetta_cache import rosetta_mean
+from .raster_blocks import process_blocks
 
 
 def WMssc(sand, silt, clay):
@@ -31,17 +36,8 @@ def ROssc(sand, silt, clay):
      Utiliza o ROSETTA
      Entrada: %areia, %silte, %argila
     --------------------------------------"""
-    sand = np.atleast_1d(sand)
-    silt = np.atleast_1d(silt)
-    clay = np.atleast_1d(clay)
-
-    if not (sand.shape == silt.shape == clay.shape):
-        raise ValueError("sand, silt e clay devem ter o mesmo tamanho.")
-    
-    data = np.stack([sand, silt, clay], axis=1)
-
-    mean, _, _ = rosetta(3, SoilData.from_array(data))
-    log10_Ks = mean[:, 4]
+    mean = rosetta_mean(sand, silt, clay)
+    log10_Ks = mean[..., 4]
     Ks = np.pow(10, log10_Ks)   # cm/dia
     Ks = Ks / 86400.0           # cm/s
     return Ks
@@ -89,17 +85,7 @@ def Saxton(sand, silt, clay):
     t2 = (-3.8950 + (0.03671*sand) - (0.1103*clay) + 8.7546 * (10**(-4))*np.pow(clay, 2))
 
     # Obtendo Teta_s
-    sand = np.atleast_1d(sand)
-    silt = np.atleast_1d(silt)
-    clay = np.atleast_1d(clay)
-
-    if not (sand.shape == silt.shape == clay.shape):
-        raise ValueError("sand, silt e clay devem ter o mesmo tamanho.")
-    
-    data = np.stack([sand, silt, clay], axis=1)
-
-    mean, _, _ = rosetta(3, SoilData.from_array(data))
-    teta_s = mean[:, 1]
+    teta_s = rosetta_mean(sand, silt, clay)[..., 1]
     t2 = t2/teta_s
 
     Ks = 2.778 * (10**-6) * np.exp(t1 + t2) # cm/h
@@ -125,4 +111,76 @@ ALL_FUNCTIONS = {
     "DanePuckett": DanePuckett,
     "Saxton":Saxton,
     "My_Linear": My_Linear,
-}
\ No newline at end of file
+}
+
+
+def _ptf_bloco(blocos:list[np.ndarray], functions:list[str], nodatas:list, multi:bool):
+    sand, silt, clay = [bloco.astype("float32") for bloco in blocos]
+
+    # Pixels sem dados em qualquer uma das texturas ficam NaN
+    valid = np.ones(sand.shape, dtype=bool)
+    for bloco, nodata in zip((sand, silt, clay), nodatas):
+        valid &= ~np.isnan(bloco)
+        if nodata is not None and not np.isnan(nodata):
+            valid &= bloco != np.float32(nodata)
+
+    s, si, c = sand[valid], silt[valid], clay[valid]
+
+    results = {}
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for name in functions:
+            Ks = np.full(sand.shape, np.nan, dtype="float32")
+            if s.size:
+                Ks[valid] = ALL_FUNCTIONS[name](s, si, c)
+            results[name] = Ks
+
+    if multi:
+        return results
+    return np.stack([results[name] for name in functions])
+
+def ptf_rasters(
+    sand:str,
+    silt:str,
+    clay:str,
+    out_path:str|dict[str, str],
+    functions:list[str]|None = None,
+    block_size:int = 1024,
+    n_workers:int|None = None,
+):
+    """Aplica as PTFs de `ALL_FUNCTIONS` (Ks em cm/s) aos rasteres de areia, silte e argila, por blocos.
+
+    - `out_path`: caminho de um GeoTIFF com uma banda por PTF (na ordem de `functions`, com o nome da
+      PTF na descrição da banda) ou `{nome da PTF: caminho}` para um GeoTIFF por PTF
+    - `functions`: PTFs calculadas, por padrão todas (ou as chaves de `out_path`)
+
+    As texturas são lidas uma única vez por bloco para todas as PTFs e o cálculo é feito em float32 em
+    `n_workers` threads. Pixels sem dados em qualquer textura recebem NaN.
+    """
+    multi = isinstance(out_path, dict)
+    if functions is None:
+        functions = list(out_path.keys()) if multi else list(ALL_FUNCTIONS.keys())
+    elif multi and set(functions) != set(out_path):
+        raise ValueError("As PTFs de `functions` devem ser as chaves de `out_path`")
+
+    for name in functions:
+        if name not in ALL_FUNCTIONS:
+            raise ValueError(f"PTF desconhecida: {name}, as opções são {list(ALL_FUNCTIONS.keys())}")
+
+    paths = [sand, silt, clay]
+    nodatas = []
+    for path in paths:
+        with rasterio.open(path) as src:
+            nodatas.append(src.nodata)
+
+    return process_blocks(
+        partial(_ptf_bloco, functions=functions, nodatas=nodatas, multi=multi),
+        paths,
+        out_path,
+        dtype="float32",
+        nodata=np.nan,
+        block_size=block_size,
+        n_workers=n_workers,
+        desc="Calculando PTFs",
+        count=1 if multi else len(functions),
+        descriptions=None if multi else functions,
+    )
@@ -4,7 +4,23 @@ gpd.options.io_engine = "pyogrio"
 from .infiltracao import *
 from .consts import *
 from .generate_random import generate_random_hash, generate_random_color
+from .rosetta_cache import RosettaCache, ROSETTA_CACHE, rosetta_mean
 from .PTFs import *
 from .nse_error import nse
-from .points_distance import points_distance
-from .calc_ML_functions import run_rf_xgb
\ No newline at end of file
+from .points_distance import points_distance, benchmark_points_distance
+from .calc_ML_functions import run_rf_xgb
+from .raster_blocks import iter_windows, map_blocks, process_blocks
+from .reclass import lut_from_classes, reclassify_lut, reclassify_intervals, LUT_USO_SOLO_CLASS, LUT_USO_SOLO_MAPBIOMAS, LUT_SOIL_TYPES
+from .overlay import weighted_overlay
+from .jenks import StreamingHistogram, jenks_histogram, jenks_array, jenks_raster
+from .classify import classify_breaks, classify_raster, NODATA_CLASSE
+from .potencial import potencial_mg, FATORES_MG
+from .kriging import fit_variogram, fit_shared_variogram, OrdinaryKriging, LocalKriging, krige_to_rasters, benchmark_local_kriging
+from .bias_correction import draw_subsets, draw_stratified_subsets, quantile_mapping_batch, nse_rmse_batch, simulate_bias_correction, summarize_simulations
+from .sweep import run_sweep, sweep_fingerprint
+from .distance_raster import distance_raster
+from .feature_store import build_feature_stack, FeatureStack
+from .terrain import TERRAIN_BANDS, terrain_block, terrain_raster, MULTISCALE_STATS, multiscale_block, multiscale_raster
+from .mosaic import list_zip_tiles, index_tiles, build_mosaic
+from .alignment import grid_from_raster, align_raster, align_rasters
+from .zonal import zone_index, zonal_stats
@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import rasterio
+
+from tqdm import tqdm
+from rasterio.vrt import WarpedVRT
+from rasterio.enums import Resampling
+
+from .raster_blocks import iter_windows, tiled_profile
+
+
+_HASH_LOCK = threading.Lock()
+
+
+def grid_from_raster(path:str) -> dict:
+    """Grid canônico `{"crs", "transform", "width", "height"}` de um raster de referência"""
+    with rasterio.open(path) as src:
+        return {"crs": src.crs, "transform": src.transform, "width": src.width, "height": src.height}
+
+def _grid_key(grid:dict) -> str:
+    crs = grid["crs"].to_wkt() if grid["crs"] is not None else None
+    return json.dumps([crs, list(grid["transform"])[:6], grid["width"], grid["height"]])
+
+def file_hash(path:str, cache_dir:str|None = None, chunk_size:int = 16*1024*1024) -> str:
+    """SHA-256 do conteúdo do arquivo.
+
+    Com `cache_dir`, o hash fica salvo em `hashes.json` junto com o tamanho e a data do arquivo, então
+    arquivos que não mudaram não são lidos de novo.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    hashes_path = None if cache_dir is None else os.path.join(cache_dir, "hashes.json")
+
+    hashes = {}
+    if hashes_path is not None and os.path.exists(hashes_path):
+        with _HASH_LOCK, open(hashes_path, "r", encoding="utf-8") as f:
+            hashes = json.load(f)
+
+    cached = hashes.get(path)
+    if cached is not None and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+        return cached["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if hashes_path is not None:
+        with _HASH_LOCK:
+            if os.path.exists(hashes_path):
+                with open(hashes_path, "r", encoding="utf-8") as f:
+                    hashes = json.load(f)
+            hashes[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest}
+
+            tmp = f"{hashes_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(hashes, f, indent=1)
+            os.replace(tmp, hashes_path)
+
+    return digest
+
+def is_aligned(path:str, grid:dict) -> bool:
+    """Verifica se o raster já está no grid (tamanho, transformação e CRS)"""
+    with rasterio.open(path) as src:
+        return (
+            src.width == grid["width"] and
+            src.height == grid["height"] and
+            src.transform.almost_equals(grid["transform"]) and
+            src.crs == grid["crs"]
+        )
+
+def align_raster(
+    path:str,
+    grid:dict,
+    cache_dir:str,
+    categorical:bool|None = None,
+    resampling:Resampling|None = None,
+    block_size:int = 2048,
+) -> str:
+    """Reprojeta o raster `path` para o `grid` uma única vez e retorna o caminho do raster alinhado.
+
+    Rasteres categóricos (classes, ex.: uso do solo, textura, geologia) usam o vizinho mais próximo e
+    contínuos (ex.: elevação, declividade) a interpolação bilinear. Com `categorical=None`, rasteres de
+    inteiros são considerados categóricos. `resampling` define a reamostragem diretamente (ex.: vizinho
+    mais próximo para o aspecto, que é circular e não pode ser interpolado). Rasteres de inteiros
+    interpolados são gravados em float32, sem truncar os valores.
+
+    O resultado fica em `cache_dir` com o nome formado pelo hash do conteúdo do raster, do grid, da
+    reamostragem e do tipo de saída, e é reaproveitado nas próximas chamadas. Um raster que já está no
+    grid é retornado sem cópia.
+    """
+    if is_aligned(path, grid):
+        return path
+
+    with rasterio.open(path) as src:
+        if categorical is None:
+            categorical = np.dtype(src.dtypes[0]).kind in "iub"
+        dtype, nodata = src.dtypes[0], src.nodata
+
+    if resampling is None:
+        resampling = Resampling.nearest if categorical else Resampling.bilinear
+
+    # Valores interpolados ficam em float32, com NaN fora da extensão do raster de origem se não houver nodata
+    if resampling != Resampling.nearest:
+        if np.dtype(dtype).kind in "iub":
+            dtype = "float32"
+        if nodata is None:
+            nodata = np.nan
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha256(f"{file_hash(path, cache_dir)}|{_grid_key(grid)}|{resampling.name}|{dtype}".encode()).hexdigest()
+    name = os.path.splitext(os.path.basename(path))[0]
+    out_path = os.path.join(cache_dir, f"{name}_{key[:16]}.tif")
+    if os.path.exists(out_path):
+        return out_path
+
+    profile = tiled_profile({"crs": grid["crs"], "transform": grid["transform"], "width": grid["width"], "height": grid["height"]}, dtype=dtype, nodata=nodata)
+    if nodata is None:
+        profile.pop("nodata")
+
+    tmp = f"{out_path}.tmp.tif"
+    with rasterio.open(path) as src, WarpedVRT(
+        src,
+        crs=grid["crs"],
+        transform=grid["transform"],
+        width=grid["width"],
+        height=grid["height"],
+        resampling=resampling,
+        src_nodata=src.nodata,
+        nodata=nodata,
+        dtype=dtype,
+    ) as vrt, rasterio.open(tmp, "w", **profile) as dst:
+        for window in tqdm(iter_windows(grid["width"], grid["height"], block_size), desc=f"Alinhando {name}", leave=False):
+            dst.write(vrt.read(1, window=window).astype(dtype, copy=False), 1, window=window)
+    os.replace(tmp, out_path)
+
+    return out_path
+
+def align_rasters(
+    paths:dict[str, str],
+    reference:str,
+    cache_dir:str,
+    categorical:dict[str, bool]|None = None,
+    resampling:dict[str, Resampling]|None = None,
+) -> dict[str, str]:
+    """Alinha todos os rasteres `{nome: caminho}` ao grid do raster `reference`, ver `align_raster`.
+
+    `categorical` indica, por nome, se o raster é categórico e `resampling` a reamostragem de cada
+    raster, que tem prioridade. Os rasteres que não estão em nenhum dos dois são inferidos pelo tipo
+    (inteiros são categóricos), então rasteres contínuos salvos como inteiros (ex.: elevação em int16)
+    devem ser indicados. Retorna `{nome: caminho do raster alinhado}`.
+    """
+    categorical = categorical or {}
+    resampling = resampling or {}
+    grid = grid_from_raster(reference)
+    return {
+        name: align_raster(path, grid, cache_dir, categorical.get(name), resampling.get(name))
+        for name, path in paths.items()
+    }
@@ -0,0 +1,200 @@
+import math
+import numpy as np
+import pandas as pd
+
+from itertools import combinations, product
+
+from .sweep import run_sweep
+
+
+def draw_subsets(n:int, size:int, n_max:int, rng:np.random.Generator) -> np.ndarray:
+    """Sorteia até `n_max` subconjuntos distintos de `size` índices em `range(n)`, sem repetição.
+
+    Retorna uma matriz `(S, size)` com os índices de cada subconjunto em ordem crescente. Quando existem
+    no máximo `n_max` combinações, retorna todas elas (em ordem aleatória).
+    """
+    total = math.comb(n, size)
+    if total <= n_max:
+        subsets = np.array(list(combinations(range(n), size)), dtype=np.intp).reshape(total, size)
+        return subsets[rng.permutation(total)]
+
+    subsets = np.empty((0, size), dtype=np.intp)
+    while len(subsets) < n_max:
+        missing = n_max - len(subsets)
+
+        # Cada linha é uma permutação aleatória, os primeiros `size` índices formam o subconjunto
+        draw = np.argsort(rng.random((missing + missing//10 + 1, n)), axis=1)[:, :size]
+        draw.sort(axis=1)
+
+        # Remove os repetidos mantendo a ordem do sorteio
+        subsets = np.concatenate([subsets, draw])
+        _, first = np.unique(subsets, axis=0, return_index=True)
+        subsets = subsets[np.sort(first)]
+
+    return subsets[:n_max]
+
+def draw_stratified_subsets(groups:list[np.ndarray], size:int, n_max:int, rng:np.random.Generator) -> np.ndarray:
+    """Como `draw_subsets`, mas com `min(len(grupo), size)` índices de cada grupo de `groups` (ex.: por textura).
+
+    Retorna uma matriz `(S, Σ min(len(grupo), size))` com os índices de cada subconjunto em ordem crescente.
+    """
+    groups = [np.asarray(group, dtype=np.intp) for group in groups]
+    sizes = [min(len(group), size) for group in groups]
+
+    total = math.prod([math.comb(len(group), k) for group, k in zip(groups, sizes)])
+    if total <= n_max:
+        per_group = [[group[list(c)] for c in combinations(range(len(group)), k)] for group, k in zip(groups, sizes)]
+        subsets = np.array([np.concatenate(parts) for parts in product(*per_group)], dtype=np.intp).reshape(total, sum(sizes))
+        subsets.sort(axis=1)
+        return subsets[rng.permutation(total)]
+
+    subsets = np.empty((0, sum(sizes)), dtype=np.intp)
+    while len(subsets) < n_max:
+        n_draw = n_max - len(subsets) + (n_max - len(subsets))//10 + 1
+
+        draw = np.concatenate([
+            group[np.argsort(rng.random((n_draw, len(group))), axis=1)[:, :k]]
+            for group, k in zip(groups, sizes)
+        ], axis=1)
+        draw.sort(axis=1)
+
+        subsets = np.concatenate([subsets, draw])
+        _, first = np.unique(subsets, axis=0, return_index=True)
+        subsets = subsets[np.sort(first)]
+
+    return subsets[:n_max]
+
+def empirical_quantiles(values:np.ndarray, n_quantiles:int = 100) -> tuple[np.ndarray, np.ndarray]:
+    """Quantis empíricos de cada linha de `values` `(S, n)`, como no `QuantileTransformer` do sklearn.
+
+    Retorna as referências `(Q,)` e os quantis `(S, Q)`, com `Q = min(n_quantiles, n)`.
+    """
+    values = np.atleast_2d(values)
+    references = np.linspace(0, 1, min(n_quantiles, values.shape[1]))
+
+    # Mesmo cálculo do sklearn, para que os empates caiam exatamente nos mesmos quantis
+    quantiles = np.percentile(values, references*100, axis=1).T
+
+    return references, np.maximum.accumulate(quantiles, axis=1)
+
+def quantile_mapping_batch(sim:np.ndarray, obs:np.ndarray, n_quantiles:int = 100) -> np.ndarray:
+    """Quantile Mapping de `sim` `(N,)` para cada amostra observada de `obs` `(S, n)`.
+
+    Mesmo resultado do `QuantileTransformer(output_distribution="uniform")` ajustado em `sim` e em cada
+    linha de `obs`: `sim` é levado ao espaço uniforme uma única vez e reprojetado nos quantis de todas
+    as amostras de uma vez. Retorna `(S, N)`.
+    """
+    sim = np.asarray(sim, dtype=np.float64)
+    ref_sim, q_sim = empirical_quantiles(sim[None, :], n_quantiles)
+    q_sim = q_sim[0]
+
+    # Simulado -> uniforme (média da interpolação crescente e decrescente, como no sklearn)
+    u = 0.5*(np.interp(sim, q_sim, ref_sim) - np.interp(-sim, -q_sim[::-1], -ref_sim[::-1]))
+    u[sim == q_sim[-1]] = 1
+    u[sim == q_sim[0]] = 0
+
+    # Uniforme -> observado, interpolação linear entre as referências de cada amostra
+    ref_obs, q_obs = empirical_quantiles(obs, n_quantiles)
+    if len(ref_obs) == 1:
+        return np.repeat(q_obs, len(sim), axis=1)
+
+    position = u*(len(ref_obs) - 1)
+    low = np.minimum(np.floor(position).astype(np.intp), len(ref_obs) - 2)
+    frac = (u - ref_obs[low])/(ref_obs[low + 1] - ref_obs[low])
+    return q_obs[:, low] + frac*(q_obs[:, low + 1] - q_obs[:, low])
+
+def nse_rmse_batch(pred:np.ndarray, y:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """NSE e RMSE de cada linha de `pred` `(S, N)` em relação a `y` `(N,)`"""
+    error = np.sum(np.power(pred - y, 2), axis=1)
+    nse = 1 - error/np.sum(np.power(y - y.mean(), 2))
+    rmse = np.sqrt(error/len(y))
+    return nse, rmse
+
+def simulate_calibration_size(
+    sim:np.ndarray,
+    y:np.ndarray,
+    size:int,
+    n_simulations:int,
+    rng:np.random.Generator,
+    groups:list[np.ndarray]|None = None,
+    batch_size:int = 10_000,
+) -> pd.DataFrame:
+    """Correção de viés de `sim` com `n_simulations` amostras distintas de `size` pontos de calibração de `y`.
+
+    Com `groups`, cada amostra tem `size` pontos de cada grupo (ver `draw_stratified_subsets`).
+    Com `size=0` retorna o NSE e o RMSE de `sim` sem correção.
+    Retorna um DataFrame com `N_SIM`, `NSE` e `RMSE` de cada simulação.
+    """
+    if size == 0:
+        nse, rmse = nse_rmse_batch(np.asarray(sim, dtype=np.float64)[None, :], y)
+        return pd.DataFrame({"N_SIM": [0], "NSE": nse, "RMSE": rmse})
+
+    if groups is None:
+        subsets = draw_subsets(len(y), size, n_simulations, rng)
+    else:
+        subsets = draw_stratified_subsets(groups, size, n_simulations, rng)
+
+    nse = np.empty(len(subsets))
+    rmse = np.empty(len(subsets))
+    for start in range(0, len(subsets), batch_size):
+        batch = subsets[start:start + batch_size]
+        corrected = quantile_mapping_batch(sim, y[batch])
+        nse[start:start + len(batch)], rmse[start:start + len(batch)] = nse_rmse_batch(corrected, y)
+
+    return pd.DataFrame({
+        "N_SIM": np.arange(len(subsets)),
+        "NSE": nse,
+        "RMSE": rmse,
+    })
+
+def calibration_task(task:dict, rng:np.random.Generator, sims:dict[str, np.ndarray], y:np.ndarray, n_simulations:int, groups=None) -> pd.DataFrame:
+    """Tarefa `{"PTF", "N_PONTOS"}` da varredura de `simulate_bias_correction`"""
+    return simulate_calibration_size(sims[task["PTF"]], y, task["N_PONTOS"], n_simulations, rng, groups=groups)
+
+def simulate_bias_correction(
+    sims:dict[str, np.ndarray],
+    y:np.ndarray,
+    sizes:list[int]|None = None,
+    n_simulations:int = 50_000,
+    seed:int = 42,
+    groups:list[np.ndarray]|None = None,
+    n_workers:int|None = None,
+    checkpoint_dir:str|None = None,
+    out_path:str|None = None,
+) -> pd.DataFrame:
+    """Simulações de Monte Carlo da correção de viés por Quantile Mapping para cada PTF e número de pontos.
+
+    - `sims`: `{nome da PTF: log10(Ks) simulado (N,)}`
+    - `y`: `log10(Ks)` observado `(N,)`
+    - `sizes`: números de pontos de calibração, por padrão `1..N` (0 é o resultado sem correção)
+    - `groups`: índices dos pontos de cada grupo, para sortear `size` pontos por grupo
+
+    Cada par (PTF, número de pontos) é uma tarefa de `run_sweep`, executada em `n_workers` processos com
+    um gerador aleatório próprio derivado de `seed` e, com `checkpoint_dir`, retomada se interrompida.
+    Retorna uma tabela com `PTF`, `N_PONTOS`, `N_SIM`, `NSE` e `RMSE` de todas as simulações e, com
+    `out_path`, salva em um único arquivo Parquet.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    sizes = list(range(1, len(y) + 1)) if sizes is None else list(sizes)
+
+    tasks = [{"PTF": key, "N_PONTOS": size} for key in sims.keys() for size in sizes]
+    context = {
+        "sims": {key: np.asarray(sim, dtype=np.float64) for key, sim in sims.items()},
+        "y": y,
+        "n_simulations": n_simulations,
+        "groups": groups,
+    }
+
+    result = run_sweep(calibration_task, tasks, context, seed=seed, n_workers=n_workers, checkpoint_dir=checkpoint_dir)
+    result["PTF"] = result["PTF"].astype("category")
+
+    if out_path is not None:
+        result.to_parquet(out_path, index=False)
+
+    return result
+
+def summarize_simulations(simulations:pd.DataFrame) -> pd.DataFrame:
+    """Mínimo, máximo, média e mediana do NSE e do RMSE por PTF e número de pontos de calibração"""
+    summary = simulations.groupby(["PTF", "N_PONTOS"], observed=True)[["NSE", "RMSE"]].agg(["max", "min", "mean", "median"])
+    summary.columns = [f"{param}_{stat.upper()}" for param, stat in summary.columns]
+    return summary.reset_index()
@@ -0,0 +1,86 @@
+import numpy as np
+
+from functools import partial
+
+from .reclass import CHUNK_SIZE
+from .raster_blocks import process_blocks
+
+
+# Valor sem dados dos rasteres de classes (uint8)
+NODATA_CLASSE = 255
+
+
+def classify_breaks(
+    values:np.ndarray,
+    breaks:list[float],
+    nodata:int = NODATA_CLASSE,
+    valid_range:tuple[float|None, float|None] = (None, None),
+) -> np.ndarray:
+    """Classifica `values` nas classes `1..k` definidas pelas quebras `breaks` (formato do Jenks).
+
+    `breaks` é `[mínimo, limite da classe 1, ..., limite da classe k]` e a classe `i` contém os valores
+    em `(breaks[i-1], breaks[i]]`, a primeira incluindo tudo até `breaks[1]`. Valores acima da última
+    quebra, fora de `valid_range` ou NaN recebem `nodata`.
+
+    A classe é obtida contando as quebras abaixo de cada valor, em pedaços que cabem no cache,
+    sem máscaras booleanas do tamanho do raster. O resultado é uint8.
+    """
+    n_classes = len(breaks) - 1
+    if n_classes < 1 or n_classes >= nodata:
+        raise ValueError(f"Número de classes inválido: {n_classes}")
+
+    values = np.asarray(values)
+    dtype = values.dtype if values.dtype.kind == "f" else np.dtype("float64")
+    low = -np.inf if valid_range[0] is None else valid_range[0]
+    high = breaks[-1] if valid_range[1] is None else min(valid_range[1], breaks[-1])
+
+    # índice = (valor >= low) + quantidade de limites estritamente menores que o valor
+    # 0 -> abaixo do intervalo válido ou NaN, 1..k -> classes, k+1 -> acima da última quebra
+    limits = np.array([*breaks[1:-1], high], dtype=dtype)
+    low = dtype.type(low)
+    table = np.array([nodata, *range(1, n_classes + 1), nodata], dtype=np.uint8)
+
+    flat = values.reshape(-1)
+    out = np.empty(flat.size, dtype=np.uint8)
+    idx = np.empty(CHUNK_SIZE, dtype=np.uint8)
+    cmp = np.empty(CHUNK_SIZE, dtype=bool)
+
+    for start in range(0, flat.size, CHUNK_SIZE):
+        chunk = flat[start:start + CHUNK_SIZE]
+        chunk_idx = idx[:chunk.size]
+        chunk_cmp = cmp[:chunk.size]
+
+        np.greater_equal(chunk, low, out=chunk_cmp)
+        np.copyto(chunk_idx, chunk_cmp)
+        for limit in limits:
+            np.greater(chunk, limit, out=chunk_cmp)
+            np.add(chunk_idx, chunk_cmp, out=chunk_idx)
+
+        np.take(table, chunk_idx, out=out[start:start + chunk.size])
+
+    return out.reshape(values.shape)
+
+def _classify_bloco(blocos:list[np.ndarray], breaks, nodata, valid_range):
+    return classify_breaks(blocos[0], breaks, nodata=nodata, valid_range=valid_range)
+
+def classify_raster(
+    path:str,
+    breaks:list[float],
+    out_path:str,
+    nodata:int = NODATA_CLASSE,
+    valid_range:tuple[float|None, float|None] = (None, None),
+    block_size:int = 1024,
+    n_workers:int|None = None,
+):
+    """Classifica o raster de `path` pelas quebras `breaks` (ver `classify_breaks`), bloco a bloco,
+    gravando um GeoTIFF uint8 com `nodata` em `out_path`."""
+    return process_blocks(
+        partial(_classify_bloco, breaks=list(breaks), nodata=nodata, valid_range=valid_range),
+        [path],
+        out_path,
+        dtype="uint8",
+        nodata=nodata,
+        block_size=block_size,
+        n_workers=n_workers,
+        desc="Classificando",
+    )
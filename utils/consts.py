@@ -213,4 +213,31 @@ SOIL_TYPES = {
         "name": "rock",
         "infiltration_index": 1,
     },
-}
\ No newline at end of file
+}
+# Intervalos de reclassificação: (limites, classes)
+# Cada classe vale para [limite anterior, limite), a primeira para valores abaixo do primeiro limite
+# e a última para valores a partir do último limite.
+
+# Elevação (m) - Bacia
+ELEVACAO_INTERVALOS = (
+    [800, 900, 1000, 1100, 1200, 1300, 1400, 1500],
+    [9,   8,   7,    6,    5,    4,    3,    2,    1],
+)
+
+# Elevação (m) - Minas Gerais
+ELEVACAO_INTERVALOS_MG = (
+    [300, 500, 600, 700, 800, 900, 1100, 1300],
+    [9,   8,   7,   6,   5,   4,   3,    2,    1],
+)
+
+# Declividade (graus) - Bacia
+DECLIVIDADE_INTERVALOS = (
+    [8, 15, 25],
+    [4, 3,  2,  1],
+)
+
+# Declividade (graus) - Minas Gerais
+DECLIVIDADE_INTERVALOS_MG = (
+    [6.7, 20, 40],
+    [4,   3,  2,  1],
+)
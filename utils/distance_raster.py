@@ -0,0 +1,94 @@
+import os
+import hashlib
+import numpy as np
+import rasterio
+import shapely
+
+from affine import Affine
+from rasterio.features import rasterize
+from rasterio.transform import xy
+from scipy.ndimage import distance_transform_edt
+
+from .raster_blocks import tiled_profile
+
+
+def _cache_key(geometries:np.ndarray, profile:dict, all_touched:bool, margin:int) -> str:
+    """Hash das geometrias e do grid, gravado no raster para saber se o cache ainda é válido"""
+    h = hashlib.sha256()
+    for wkb in shapely.to_wkb(geometries):
+        h.update(wkb)
+    h.update(repr((tuple(profile["transform"]), profile["width"], profile["height"], str(profile["crs"]), all_touched, margin)).encode())
+    return h.hexdigest()
+
+def distance_raster(geometries, template:str, out_path:str|None = None, all_touched:bool = True, margin:int = 64) -> np.ndarray:
+    """Distância (em unidades do CRS) do centro de cada pixel do grid do raster `template` até as `geometries`.
+
+    As geometrias (ex.: talvegues da hidrografia, já no CRS do `template`) são rasterizadas uma única
+    vez em um grid com `margin` pixels a mais em cada lado e a distância é a transformada de distância
+    euclidiana exata (`distance_transform_edt`) entre os centros dos pixels, com o tamanho do pixel em x
+    e y. Com `all_touched=True`, todo pixel tocado por uma geometria tem distância 0, inclusive os de
+    polígonos mais finos que um pixel, então o erro para a distância exata é de até meia diagonal do pixel.
+
+    As geometrias fora do grid com a margem não são rasterizadas, então os pixels com a distância maior
+    que a distância até a borda do grid com a margem têm a distância exata calculada pelo Shapely.
+
+    Com `out_path`, o resultado é salvo como GeoTIFF e reaproveitado enquanto as geometrias e o grid
+    forem os mesmos. Retorna a matriz `(linhas, colunas)` em float32.
+    """
+    geometries = np.asarray(shapely.get_parts(np.atleast_1d(np.asarray(geometries, dtype=object))), dtype=object)
+    geometries = geometries[~shapely.is_empty(geometries)]
+    if len(geometries) == 0:
+        raise ValueError("Nenhuma geometria para calcular a distância")
+    if margin < 0:
+        raise ValueError(f"margin deve ser >= 0: {margin}")
+
+    with rasterio.open(template) as src:
+        profile = src.profile.copy()
+
+    key = _cache_key(geometries, profile, all_touched, margin)
+    if out_path is not None and os.path.exists(out_path):
+        with rasterio.open(out_path) as src:
+            if src.tags().get("DISTANCE_KEY") == key:
+                return src.read(1)
+
+    transform = profile["transform"]
+    height, width = profile["height"], profile["width"]
+    sampling = (abs(transform.e), abs(transform.a))
+
+    mask = rasterize(
+        geometries,
+        out_shape=(height + 2*margin, width + 2*margin),
+        transform=transform*Affine.translation(-margin, -margin),
+        fill=1,
+        default_value=0,
+        all_touched=all_touched,
+        dtype=np.uint8,
+    )
+    if mask.all():
+        dist = np.full((height, width), np.inf)
+    else:
+        dist = distance_transform_edt(mask, sampling=sampling)[margin:margin + height, margin:margin + width]
+
+    # Distância de cada pixel até a borda do grid com a margem: geometrias fora dele estão no mínimo a
+    # essa distância, então apenas os pixels mais distantes que a borda podem estar mais perto delas
+    rows, cols = np.arange(height), np.arange(width)
+    edge_row = (np.minimum(rows, height - 1 - rows) + margin + 0.5)*sampling[0]
+    edge_col = (np.minimum(cols, width - 1 - cols) + margin + 0.5)*sampling[1]
+    exact = dist > np.minimum(edge_row[:, None], edge_col[None, :])
+
+    if exact.any():
+        rows, cols = np.nonzero(exact)
+        x, y = xy(transform, rows, cols)
+        _, distances = shapely.STRtree(geometries).query_nearest(shapely.points(x, y), return_distance=True, all_matches=False)
+        dist[exact] = distances
+
+    dist = dist.astype(np.float32)
+
+    if out_path is not None:
+        tmp = f"{out_path}.tmp.tif"
+        with rasterio.open(tmp, "w", **tiled_profile(profile, dtype="float32")) as dst:
+            dst.write(dist, 1)
+            dst.update_tags(DISTANCE_KEY=key)
+        os.replace(tmp, out_path)
+
+    return dist
@@ -0,0 +1,180 @@
+import os
+import json
+import numpy as np
+import rasterio
+
+from tqdm import tqdm
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.vrt import WarpedVRT
+from rasterio.enums import Resampling
+
+from .raster_blocks import iter_windows
+
+
+def _source_info(path:str) -> dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+def build_feature_stack(
+    paths:dict[str, str],
+    out_dir:str,
+    reference:str|None = None,
+    resampling:dict[str, Resampling]|None = None,
+    dtype = "float32",
+    block_size:int = 2048,
+    pad:int = 0,
+    overwrite:bool = False,
+) -> "FeatureStack":
+    """Alinha os rasteres `paths` (`{nome da banda: caminho}`) em um único cubo `(bandas, linhas, colunas)`.
+
+    O cubo é salvo em `out_dir/features.npy` (aberto com memória mapeada) com os metadados em
+    `out_dir/features.json`: nomes das bandas, transform, CRS, nodata de cada banda e os rasteres de
+    origem. O grid é o do raster `reference` (por padrão o primeiro de `paths`). Rasteres em outro grid
+    são reprojetados com `resampling[nome]` (por padrão o vizinho mais próximo, que não altera os
+    valores), os valores são mantidos como estão nos rasteres, inclusive o nodata.
+
+    Com `pad`, o cubo é salvo com uma borda de `pad` pixels em NaN em volta do grid (ex.: metade da janela
+    de convolução), para que as janelas das bordas sejam uma visão do cubo em disco, sem `np.pad` na
+    memória. A extensão real fica nos metadados e `FeatureStack.data` é apenas o interior.
+
+    Se o cubo já existir e os rasteres de origem não tiverem mudado, apenas abre o cubo salvo. Se os
+    rasteres mudaram, o cubo é refeito. Um cubo salvo com outra configuração (bandas, `reference`, `pad`
+    ou `dtype`) não é sobrescrito, pois pode estar aberto por outro objeto: é levantado um ValueError,
+    use outro `out_dir` ou `overwrite=True`.
+    """
+    if pad < 0:
+        raise ValueError(f"pad deve ser >= 0: {pad}")
+    if pad and np.dtype(dtype).kind != "f":
+        raise ValueError("A borda em NaN (pad) exige um dtype de ponto flutuante")
+
+    resampling = resampling or {}
+    reference = reference or next(iter(paths.values()))
+    npy_path = os.path.join(out_dir, "features.npy")
+    meta_path = os.path.join(out_dir, "features.json")
+
+    sources = {name: _source_info(path) for name, path in paths.items()}
+    if not overwrite and os.path.exists(npy_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        config = {"bands": list(paths.keys()), "reference": os.path.abspath(reference), "pad": pad, "dtype": np.dtype(dtype).name}
+        saved = {key: meta.get(key, 0 if key == "pad" else None) for key in config}
+        if saved != config:
+            diff = ", ".join(f"{key}: {saved[key]!r} != {config[key]!r}" for key in config if saved[key] != config[key])
+            raise ValueError(f"O cubo em {out_dir} foi criado com outra configuração ({diff}), use outro out_dir ou overwrite=True")
+
+        if meta.get("sources") == sources:
+            return FeatureStack(out_dir)
+
+    os.makedirs(out_dir, exist_ok=True)
+    with rasterio.open(reference) as ref:
+        crs, transform, width, height = ref.crs, ref.transform, ref.width, ref.height
+
+    tmp_path = os.path.join(out_dir, "features.tmp.npy")
+    data = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(len(paths), height + 2*pad, width + 2*pad))
+    if pad:
+        data[:, :pad] = np.nan
+        data[:, -pad:] = np.nan
+        data[:, :, :pad] = np.nan
+        data[:, :, -pad:] = np.nan
+
+    nodata = []
+    for band, (name, path) in enumerate(paths.items()):
+        with rasterio.open(path) as src:
+            nodata.append(None if src.nodata is None else float(src.nodata))
+
+            same_grid = src.crs == crs and src.transform.almost_equals(transform) and (src.width, src.height) == (width, height)
+            if same_grid:
+                reader = src
+            else:
+                reader = WarpedVRT(
+                    src,
+                    crs=crs,
+                    transform=transform,
+                    width=width,
+                    height=height,
+                    resampling=resampling.get(name, Resampling.nearest),
+                )
+
+            try:
+                for window in tqdm(iter_windows(width, height, block_size), desc=f"Empilhando {name}", leave=False):
+                    rows, cols = window.toslices()
+                    data[band, rows.start + pad:rows.stop + pad, cols.start + pad:cols.stop + pad] = reader.read(1, window=window)
+            finally:
+                if reader is not src:
+                    reader.close()
+
+    data.flush()
+    del data
+    os.replace(tmp_path, npy_path)
+
+    meta = {
+        "bands": list(paths.keys()),
+        "shape": [len(paths), height, width],
+        "pad": pad,
+        "dtype": np.dtype(dtype).name,
+        "transform": list(transform)[:6],
+        "crs": crs.to_wkt() if crs is not None else None,
+        "nodata": nodata,
+        "reference": os.path.abspath(reference),
+        "sources": sources,
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    return FeatureStack(out_dir)
+
+
+class FeatureStack:
+    """Cubo de bandas salvo por `build_feature_stack`, aberto com memória mapeada.
+
+    Abrir custa apenas a leitura do `features.json`, os pixels são lidos do disco quando indexados.
+    `padded` é o cubo salvo, com a borda de `pad` pixels em NaN, e `data` a visão do grid sem a borda.
+    """
+
+    def __init__(self, out_dir:str):
+        with open(os.path.join(out_dir, "features.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        self.path = out_dir
+        self.bands:list[str] = meta["bands"]
+        self.transform = Affine(*meta["transform"])
+        self.crs = CRS.from_wkt(meta["crs"]) if meta["crs"] is not None else None
+        self.nodata:dict[str, float|None] = dict(zip(self.bands, meta["nodata"]))
+        self.pad:int = meta.get("pad", 0)
+        self.padded:np.ndarray = np.load(os.path.join(out_dir, "features.npy"), mmap_mode="r")
+
+        bands, height, width = meta["shape"]
+        if self.padded.shape != (bands, height + 2*self.pad, width + 2*self.pad):
+            raise ValueError(f"O cubo em {out_dir} não corresponde aos metadados")
+
+        self.data:np.ndarray = self.padded[:, self.pad:self.pad + height, self.pad:self.pad + width]
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.data.shape
+
+    @property
+    def height(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def width(self) -> int:
+        return self.data.shape[2]
+
+    def band(self, name:str) -> np.ndarray:
+        """Banda `name` `(linhas, colunas)`, também com memória mapeada"""
+        return self.data[self.bands.index(name)]
+
+    def xy(self) -> tuple[np.ndarray, np.ndarray]:
+        """Coordenadas x das colunas e y das linhas no centro dos pixels"""
+        x = self.transform.c + (np.arange(self.width) + 0.5)*self.transform.a
+        y = self.transform.f + (np.arange(self.height) + 0.5)*self.transform.e
+        return x, y
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __len__(self):
+        return len(self.bands)
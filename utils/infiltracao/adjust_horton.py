@@ -83,3 +83,246 @@ def adjust_horton(I, t, N_particulas=10000, N_iteracoes=10000, c1=1.5, c2=1.2, w
 
     return params
 
+
+
+def pack_curves(curves):
+    """Empacota curvas `[(I, t), ...]` de tamanhos diferentes em arrays `(S, T)` com NaN e a máscara dos valores"""
+    T = max([len(I) for I, _ in curves], default=0)
+
+    I_pad = np.full((len(curves), T), np.nan)
+    t_pad = np.full((len(curves), T), np.nan)
+    for i, (I, t) in enumerate(curves):
+        I_pad[i, :len(I)] = I
+        t_pad[i, :len(t)] = t
+
+    mask = ~np.isnan(I_pad) & ~np.isnan(t_pad)
+    return np.where(mask, I_pad, 0.0), np.where(mask, t_pad, 0.0), mask
+
+def FO_batch(X, Iobs, t, mask):
+    """Mesma função objetivo do `FO` (erro absoluto médio) para `X` `(S, P, 3)` e curvas `(S, T)` com máscara"""
+    fo = X[..., 0:1]
+    fc = X[..., 1:2]
+    k  = X[..., 2:3]
+
+    Iest = horton(t[:, None, :], fo, fc, k)
+
+    erros = np.sum(np.abs(Iobs[:, None, :] - Iest)*mask[:, None, :], axis=-1)/np.maximum(mask.sum(axis=-1), 1)[:, None]
+    erros = np.where(np.isnan(erros) | np.isinf(erros), 1E12, erros)
+
+    return erros
+
+def adjust_horton_batch(curves, N_particulas=1000, N_iteracoes=1000, c1=1.5, c2=1.2, w=0.8, patience=50, ftol=1e-8, seed=None) -> pd.DataFrame:
+    """PSO do `adjust_horton` para várias curvas `[(I, t), ...]` ao mesmo tempo.
+
+    As curvas são empacotadas em arrays com máscara e cada uma tem o seu enxame (global best), com os
+    mesmos limites e a mesma função objetivo do `adjust_horton`; todos os enxames evoluem juntos em
+    tensores `(curvas, partículas, tempos)`. Uma curva para quando o melhor custo não melhora mais que
+    `ftol` (relativo) por `patience` iterações, e as iterações seguintes só calculam as curvas restantes.
+
+    A memória por iteração é da ordem de `curvas*N_particulas*tempos` floats.
+    Retorna um DataFrame com `fo`, `fc`, `k`, `rmse`, `iterations`, `converged` e `method` de cada curva.
+    """
+    rng = np.random.default_rng(seed)
+    I, t, mask = pack_curves(curves)
+    S = len(I)
+
+    low, high = horton_bounds(I, mask)
+    span = (high - low)[:, None, :]
+
+    # Posições e velocidades iniciais de cada enxame
+    X = low[:, None, :] + rng.random((S, N_particulas, 3))*span
+    V = (rng.random((S, N_particulas, 3)) - 0.5)*0.2*span
+
+    pbest = X.copy()
+    pbest_cost = FO_batch(X, I, t, mask)
+    best = np.argmin(pbest_cost, axis=1)
+    gbest = pbest[np.arange(S), best]
+    gbest_cost = pbest_cost[np.arange(S), best]
+
+    stagnation = np.zeros(S, dtype=int)
+    iterations = np.zeros(S, dtype=int)
+    active = mask.any(axis=1)
+
+    for _ in range(N_iteracoes):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+
+        x, v = X[idx], V[idx]
+        r1 = rng.random(x.shape)
+        r2 = rng.random(x.shape)
+
+        v = w*v + c1*r1*(pbest[idx] - x) + c2*r2*(gbest[idx, None, :] - x)
+        x = np.clip(x + v, low[idx, None, :], high[idx, None, :])
+
+        cost = FO_batch(x, I[idx], t[idx], mask[idx])
+        better = cost < pbest_cost[idx]
+
+        pb = pbest[idx]
+        pb[better] = x[better]
+        pbest[idx] = pb
+        pbest_cost[idx] = np.where(better, cost, pbest_cost[idx])
+        X[idx], V[idx] = x, v
+
+        best = np.argmin(pbest_cost[idx], axis=1)
+        new_cost = pbest_cost[idx, best]
+        improved = new_cost < gbest_cost[idx] - ftol*np.abs(gbest_cost[idx])
+
+        gbest[idx] = np.where((new_cost < gbest_cost[idx])[:, None], pbest[idx, best], gbest[idx])
+        gbest_cost[idx] = np.minimum(new_cost, gbest_cost[idx])
+
+        stagnation[idx] = np.where(improved, 0, stagnation[idx] + 1)
+        iterations[idx] += 1
+        active[idx] = stagnation[idx] < patience
+
+    Iest = horton(t, gbest[:, 0:1], gbest[:, 1:2], gbest[:, 2:3])
+    n = np.maximum(mask.sum(axis=1), 1)
+    has_data = mask.any(axis=1)
+
+    result = pd.DataFrame({
+        "fo": gbest[:, 0],
+        "fc": gbest[:, 1],
+        "k": gbest[:, 2],
+        "rmse": np.sqrt(np.sum(np.power(Iest - I, 2)*mask, axis=1)/n),
+        "iterations": iterations,
+        "converged": (stagnation >= patience) & has_data,
+        "method": "pso",
+    })
+    result.loc[~has_data, ["fo", "fc", "k", "rmse"]] = np.nan
+    result.loc[~has_data, "method"] = None
+    return result
+
+def horton_bounds(I, mask):
+    """Limites `(N, 3)` mínimo e máximo de `[fo, fc, k]` para cada curva, os mesmos do `adjust_horton`"""
+    first = np.argmax(mask, axis=1)
+    I0 = I[np.arange(len(I)), first]
+    mean = np.sum(np.where(mask, I, 0.0), axis=1)/np.maximum(mask.sum(axis=1), 1)
+
+    low  = np.column_stack([I0,     np.zeros(len(I)), np.zeros(len(I))])
+    high = np.column_stack([I0*100, mean,             np.full(len(I), 4.0)])
+    return np.minimum(low, high), np.maximum(low, high)
+
+def _horton_jacobian(t, X):
+    fo, fc, k = X[:, 0:1], X[:, 1:2], X[:, 2:3]
+    e = np.exp(-k*t)
+    Iest = fc + (fo - fc)*e
+    J = np.stack([e, 1 - e, -(fo - fc)*t*e], axis=-1)
+    return Iest, J
+
+def horton_initial_guess(I, t, mask, low, high):
+    """Chute inicial log-linear: `fc` próximo do menor valor da curva e `log(I - fc) = log(fo - fc) - k*t`"""
+    minimum = np.where(mask, I, np.inf).min(axis=1)
+    fc = np.clip(0.95*np.where(np.isfinite(minimum), minimum, 0.0), low[:, 1], high[:, 1])
+
+    excess = I - fc[:, None]
+    w = (mask & (excess > 0)).astype(np.float64)
+    y = np.log(np.where(w > 0, excess, 1.0))
+
+    # Regressão linear ponderada de y em t
+    n = w.sum(axis=1)
+    st, sy = w @ t, (w*y).sum(axis=1)
+    stt, sty = w @ (t*t), (w*y*t).sum(axis=1)
+    det = n*stt - st*st
+    ok = (n >= 2) & (det > 0)
+    det = np.where(ok, det, 1.0)
+
+    slope = np.where(ok, (n*sty - st*sy)/det, -1.0)
+    intercept = np.where(ok, (sy - slope*st)/np.where(n > 0, n, 1.0), 0.0)
+
+    fo = fc + np.exp(intercept)
+    k = -slope
+    return np.clip(np.column_stack([fo, fc, k]), low, high)
+
+def fit_horton(I, t, mask=None, n_iter:int = 100, tol:float = 1e-10, pso_fallback:bool = False, **pso_kwargs) -> pd.DataFrame:
+    """Ajusta a equação de Horton em todas as curvas de uma vez, com mínimos quadrados.
+
+    - `I`: `(N, T)` taxas de infiltração de cada ponto
+    - `t`: `(T,)` tempos
+    - `mask`: `(N, T)` valores usados de cada curva, por padrão os que não são NaN
+
+    Parte de um chute inicial log-linear e refina com Levenberg-Marquardt vetorizado entre os pontos,
+    respeitando os limites do `adjust_horton`. Um ponto convergiu quando a redução relativa do erro fica
+    abaixo de `tol` ou não existe passo que reduza o erro dentro dos limites. Com `pso_fallback`, os pontos
+    que não convergiram são ajustados juntos pelo PSO (`adjust_horton_batch`, com os `pso_kwargs`).
+
+    Retorna um DataFrame com `fo`, `fc`, `k`, `rmse`, `iterations`, `converged` e `method` de cada ponto.
+    """
+    I = np.atleast_2d(np.asarray(I, dtype=np.float64))
+    t = np.asarray(t, dtype=np.float64)
+    mask = ~np.isnan(I) if mask is None else (np.asarray(mask, dtype=bool) & ~np.isnan(I))
+    I = np.where(mask, I, 0.0)
+    w = mask.astype(np.float64)
+
+    has_data = mask.any(axis=1)
+    low, high = horton_bounds(I, mask)
+    X = horton_initial_guess(I, t, mask, low, high)
+
+    def sse(X, rows):
+        Iest, J = _horton_jacobian(t, X)
+        r = w[rows]*(Iest - I[rows])
+        return (r*r).sum(axis=1), r, J*w[rows, :, None]
+
+    error, r, J = sse(X, slice(None))
+    lamb = np.full(len(I), 1e-3)
+    iterations = np.zeros(len(I), dtype=int)
+    converged = ~has_data
+    eye = np.eye(3)
+
+    for _ in range(n_iter):
+        active = ~converged
+        if not active.any():
+            break
+
+        JtJ = np.einsum("ntp,ntq->npq", J[active], J[active])
+        g = np.einsum("ntp,nt->np", J[active], r[active])
+        diag = np.maximum(np.diagonal(JtJ, axis1=1, axis2=2), 1e-12)
+
+        # Parâmetros no limite com o gradiente apontando para fora ficam fixos no passo
+        x, lo, hi = X[active], low[active], high[active]
+        gap = 1e-12*(np.abs(hi - lo) + 1)
+        free = ~(((x <= lo + gap) & (g > 0)) | ((x >= hi - gap) & (g < 0)))
+        g = g*free
+
+        A = JtJ + lamb[active, None, None]*diag[:, None, :]*eye
+        A = A*free[:, :, None]*free[:, None, :] + eye*~free[:, :, None]
+        step = np.linalg.solve(A, -g[..., None])[..., 0]
+
+        X_new = np.clip(X[active] + step, low[active], high[active])
+        error_new, r_new, J_new = sse(X_new, active)
+
+        better = error_new < error[active]
+        idx = np.flatnonzero(active)
+        accepted = idx[better]
+
+        small = better & (error[active] - error_new <= tol*(error[active] + 1e-300))
+        stuck = ~better & (lamb[active] > 1e10)
+
+        X[accepted] = X_new[better]
+        r[accepted] = r_new[better]
+        J[accepted] = J_new[better]
+        error[accepted] = error_new[better]
+
+        lamb[idx] = np.where(better, lamb[idx]/10, lamb[idx]*10)
+        iterations[idx] += 1
+        converged[idx[small | stuck]] = True
+
+    n = np.maximum(mask.sum(axis=1), 1)
+    result = pd.DataFrame({
+        "fo": X[:, 0],
+        "fc": X[:, 1],
+        "k": X[:, 2],
+        "rmse": np.sqrt(error/n),
+        "iterations": iterations,
+        "converged": converged & has_data,
+        "method": "lm",
+    })
+    result.loc[~has_data, ["fo", "fc", "k", "rmse"]] = np.nan
+    result.loc[~has_data, "method"] = None
+
+    fallback = np.flatnonzero(has_data & ~converged)
+    if pso_fallback and len(fallback):
+        pso = adjust_horton_batch([(I[i, mask[i]], t[mask[i]]) for i in fallback], **pso_kwargs)
+        pso.index = fallback
+        result.loc[fallback] = pso
+
+    return result
@@ -6,13 +6,12 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import matplotlib.patheffects as path_effects
 
-from scipy.optimize import curve_fit
-from rosetta import rosetta, SoilData
 from matplotlib.cm import ScalarMappable
 
 from ..consts import *
+from ..rosetta_cache import rosetta_mean
 from .raster_data import GenerateRaster
-from .adjust_horton import adjust_horton
+from .adjust_horton import fit_horton
 from ..soil_texture import calculate_soil_type
 from ..soil_texture import plot_soil_texture_classes
 
@@ -61,7 +60,7 @@ class Infiltrometro:
         
         self._calculate_C1_C2()
         self._taxa_infilt()
-        # self._horton_params() Apenas quando precisar ajustar os dados.
+        self._horton_params()
 
     def _mask(self, point:str|None = None):
         mask = (self.infiltrations["C1"].values != None)
@@ -73,53 +72,56 @@ class Infiltrometro:
         return mask
 
     def _calculate_C1_C2(self):
-        self.infiltrations["COV_C1_C2"] = None
-
-        columns_time = np.array(COLUMNS_INFILTRATION[4:25])
+        columns_time = list(COLUMNS_INFILTRATION[4:25])
 
         times = np.array([int(i.split("_")[0])*60 + int(i.split("_")[1]) for i in columns_time])
-
-        for ponto in self.infiltrations.itertuples():
-            index = ponto.Index
-            
-            # Valor da infiltração nos dados do ponto para os tempos com dados
-            I_data = np.array(pd.to_numeric(ponto[5:26], errors="coerce"))
-            mask = ~np.isnan(I_data)
-
-            #Deixando apenas o primeiro 0
-            indices_zeros = np.where(I_data <= 0)[0]
-            if len(indices_zeros) > 0:
-                primeiro_zero_idx = indices_zeros[0]
-                mask[primeiro_zero_idx+1:] = False
-
-            # Substituindo os valores nulos pelos valores reais
-            I_data[~mask] = I_data[mask][-1]
-            for i, colum_time in enumerate(columns_time):
-                self.infiltrations.at[index, colum_time] = I_data[i]
-
-            # Caso não tenha nenhum valor de infiltração
-            if not mask.any():
-                continue
-            
-            # Valor de C1, C2 e a covariancia entre eles
-            C1 = None
-            index_mask = 1
-            while C1 is None or C1 < 0:
-                if ponto.Ponto == "P29":
-                    print(mask)
-
-                infiltrado = (I_data[mask][0]-I_data[mask])/(np.pi*np.power(self.disk_diameter/2, 2))
-                C1, C2, covariance = self._aproximate_C1_C2(times[mask], infiltrado)
-                
-                if C1 < 0:
-                    mask[index_mask] = False
-                    index_mask += 1
-
-            # Atualizando o DataFrame com os valores novos de C1, C2 e COV_C1_C2
-
-            self.infiltrations.at[index, "C1"] = C1
-            self.infiltrations.at[index, "C2"] = C2
-            self.infiltrations.at[index, "COV_C1_C2"] = covariance
+        positions = np.arange(len(times))
+
+        # Valor da infiltração nos dados de cada ponto para os tempos com dados
+        I_data = self.infiltrations[columns_time].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        mask = ~np.isnan(I_data)
+
+        # Deixando apenas o primeiro 0
+        zeros = I_data <= 0
+        has_zero = zeros.any(axis=1)
+        first_zero = np.argmax(zeros, axis=1)
+        mask &= ~(has_zero[:, None] & (positions[None, :] > first_zero[:, None]))
+
+        # Leituras reais, antes de preencher as colunas de tempo, usadas também no ajuste de Horton
+        self._readings_mask = mask.copy()
+
+        # Substituindo os valores nulos pelos valores reais (último valor válido de cada ponto)
+        has_data = mask.any(axis=1)
+        last = len(times) - 1 - np.argmax(mask[:, ::-1], axis=1)
+        last_value = I_data[np.arange(len(I_data)), last]
+        I_data = np.where(mask | ~has_data[:, None], I_data, last_value[:, None])
+        self.infiltrations[columns_time] = I_data
+
+        # Candidatos: sem cortes e removendo as amostras 1..j, como no ajuste refeito enquanto C1 < 0
+        trims = ~((positions[None, :] >= 1) & (positions[None, :] <= positions[:, None]))
+        masks = mask[:, None, :] & trims[None, :, :]
+
+        # Volume infiltrado desde a primeira leitura de cada candidato
+        first = np.argmax(masks, axis=2)
+        I0 = np.take_along_axis(I_data, first.reshape(len(I_data), -1), axis=1).reshape(first.shape)
+        infiltrado = (I0[..., None] - I_data[:, None, :])/(np.pi*np.power(self.disk_diameter/2, 2))
+
+        C1, C2, covariance = self._aproximate_C1_C2(times, infiltrado, masks)
+
+        # Primeiro candidato com C1 >= 0
+        valid = ~np.isnan(C1) & (C1 >= 0)
+        found = valid.any(axis=1) & has_data
+        chosen = np.argmax(valid, axis=1)
+        rows = np.arange(len(I_data))
+
+        # Atualizando o DataFrame com os valores novos de C1, C2 e COV_C1_C2
+        self.infiltrations["C1"] = np.where(found, C1[rows, chosen], np.nan)
+        self.infiltrations["C2"] = np.where(found, C2[rows, chosen], np.nan)
+        self.infiltrations["COV_C1_C2"] = pd.Series(
+            [covariance[i, chosen[i]] if found[i] else None for i in rows],
+            index=self.infiltrations.index,
+            dtype=object,
+        )
             
     def _taxa_infilt(self):
         columns_time = COLUMNS_INFILTRATION[4:25]
@@ -150,10 +152,44 @@ class Infiltrometro:
             # Taxa de infiltração em mL/s
             self.infiltrations.at[index, "Taxa Inf"] = (infiltrado/tempo)
 
-    def _aproximate_C1_C2(self, t:np.ndarray, I:np.ndarray):
-        """Retorna uma tupla com os valores de C1, C2 e a covariancia entre eles."""
-        
-        (c1, c2), covariance = curve_fit(self._equation_infiltration, t, I)
+    def _aproximate_C1_C2(self, t:np.ndarray, I:np.ndarray, mask:np.ndarray):
+        """Retorna uma tupla com os valores de C1, C2 e a covariância entre eles, ajustados por mínimos quadrados.
+
+        A equação `I = C1*√t + C2*t` é linear nos parâmetros, então todos os ajustes são resolvidos de uma
+        vez pelas equações normais. `t` tem a forma `(T,)` e `I` e `mask` têm a forma `(..., T)`, um ajuste
+        para cada série usando apenas os tempos de `mask`. A covariância é a mesma do `curve_fit`,
+        `inv(JᵀJ)*SSR/(n - 2)`, infinita com apenas 2 amostras. Ajustes sem solução retornam NaN.
+        """
+        w = mask.astype(np.float64)
+        I = np.where(mask, I, 0.0)
+        sqrt_t = np.sqrt(t)
+
+        # JᵀJ e JᵀI, com J = [√t, t]
+        s11 = w @ t
+        s12 = w @ (t*sqrt_t)
+        s22 = w @ (t*t)
+        b1 = (I*sqrt_t).sum(axis=-1)
+        b2 = (I*t).sum(axis=-1)
+        n = w.sum(axis=-1)
+
+        det = s11*s22 - s12*s12
+        solvable = (n >= 2) & (det > 1e-12*s11*s22)
+        det = np.where(solvable, det, np.nan)
+
+        c1 = (s22*b1 - s12*b2)/det
+        c2 = (s11*b2 - s12*b1)/det
+
+        residual = w*(I - c1[..., None]*sqrt_t - c2[..., None]*t)
+        dof = n - 2
+        s_sq = np.divide((residual*residual).sum(axis=-1), dof, out=np.full(n.shape, np.inf), where=dof > 0)
+
+        covariance = np.empty(n.shape + (2, 2))
+        covariance[..., 0, 0] = s22/det*s_sq
+        covariance[..., 0, 1] = -s12/det*s_sq
+        covariance[..., 1, 0] = covariance[..., 0, 1]
+        covariance[..., 1, 1] = s11/det*s_sq
+        covariance[dof <= 0] = np.inf
+
         return c1, c2, covariance
 
     def _get_gradient_color(self, percent:np.ndarray, start_color:np.ndarray, end_color:np.ndarray):
@@ -161,39 +197,37 @@ class Infiltrometro:
         colors = start_color + (end_color - start_color) * percent[:, np.newaxis]
         return colors
     
-    def _horton_params(self):
-        columns_time = np.array(COLUMNS_INFILTRATION[4:25])
+    def _horton_params(self, pso_fallback:bool = False):
+        """Ajusta a equação de Horton em todos os pontos de uma vez (ver `fit_horton`).
+
+        Salva `H_fo`, `H_fc`, `H_k`, o erro `H_rmse` e se o ajuste convergiu em `H_converged`.
+        Com `pso_fallback`, os pontos que não convergiram são ajustados pelo PSO.
+        """
+        columns_time = list(COLUMNS_INFILTRATION[4:25])
 
         times = (np.array([int(i.split("_")[0])*60 + int(i.split("_")[1]) for i in columns_time]))/60
         tempos = times[1:]
 
         area_reservoir = np.power((self.total_diameter*10E-2), 2)*np.pi/4 # Em m²
 
-        for ponto in self.infiltrations.itertuples():
-            index = ponto.Index
-            
-            # Valor da infiltração nos dados do ponto para os tempos com dados
-            I_data = np.array(pd.to_numeric(ponto[5:26], errors="coerce"))
-            mask = ~np.isnan(I_data)
+        # Valor da infiltração nos dados de cada ponto, com as colunas já preenchidas pelo `_calculate_C1_C2`
+        I_data = self.infiltrations[columns_time].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
 
-            # Caso não tenha nenhum valor de infiltração
-            if not mask.any():
-                continue
-            
-            # Ajuste Horton
-            I_roll = np.roll(I_data, 1)
-
-            I_ml_30s = I_roll[1:] - I_data[1:]
-            I_m3_1h = (I_ml_30s*1E-6)/(30/3600)
-            I_m_1h = (I_m3_1h*1E-6)/area_reservoir
-            I_cm_1h = I_m_1h * 100
+        # Apenas as taxas entre duas leituras reais, sem as taxas 0 criadas pelo preenchimento
+        mask = self._readings_mask[:, :-1] & self._readings_mask[:, 1:]
 
-            params = adjust_horton(I_cm_1h, tempos[mask[1:]], N_particulas=1000, N_iteracoes=1000)
+        I_ml_30s = I_data[:, :-1] - I_data[:, 1:]
+        I_m3_1h = (I_ml_30s*1E-6)/(30/3600)
+        I_m_1h = (I_m3_1h*1E-6)/area_reservoir
+        I_cm_1h = I_m_1h * 100
 
-            self.infiltrations.at[index, "H_fc"] = params['fc']
-            self.infiltrations.at[index, "H_fo"] = params['fo']
-            self.infiltrations.at[index, "H_k"]  = params['k']
+        params = fit_horton(I_cm_1h, tempos, mask=mask, pso_fallback=pso_fallback, N_particulas=1000, N_iteracoes=1000)
 
+        self.infiltrations["H_fc"] = params["fc"].values
+        self.infiltrations["H_fo"] = params["fo"].values
+        self.infiltrations["H_k"]  = params["k"].values
+        self.infiltrations["H_rmse"] = params["rmse"].values
+        self.infiltrations["H_converged"] = params["converged"].values
 
     def _equation_infiltration(self, t:float, C1:np.ndarray, C2:np.ndarray):
         return C1 * np.sqrt(t) + C2*t
@@ -257,16 +291,7 @@ class Infiltrometro:
         clay = self.infiltrations[mask]["Clay"].values
         
         # Obtendo Teta_s
-        sand = np.atleast_1d(sand) # type: ignore
-        silt = np.atleast_1d(silt) # type: ignore
-        clay = np.atleast_1d(clay) # type: ignore
-
-        if not (sand.shape == silt.shape == clay.shape):
-            raise ValueError("sand, silt e clay devem ter o mesmo tamanho.")
-        
-        data = np.stack([sand, silt, clay], axis=1)
-
-        mean, _, _ = rosetta(3, SoilData.from_array(data))
+        mean = rosetta_mean(sand, silt, clay)
         teta_r = mean[:, 0]
         teta_s = mean[:, 1]
 
@@ -402,9 +427,15 @@ class Infiltrometro:
         resolution:float = 30,
         crs = "EPSG:31983",
         max_dist_invlin: None|float = None,
-        null_values:float = -1
+        null_values:float = -1,
+        k_invlin: None|int = None,
+        power_invlin:float = 1,
     ):
-        """Para uma maskacra e um t [00:00], que deve ser uma geometria qualquer, retorna um raster com o valor infiltrado"""
+        """Para uma maskacra e um t [00:00], que deve ser uma geometria qualquer, retorna um raster com o valor infiltrado
+
+        No INVLIN, `k_invlin` limita a interpolação aos k pontos mais próximos de cada pixel (`None` usa todos
+        os pontos, ex.: 12 para grids grandes) e `power_invlin` é o expoente do inverso da distância.
+        """
         mask = mask.to_crs(crs)
         bbox = mask.total_bounds
 
@@ -421,7 +452,7 @@ class Infiltrometro:
         points = points[~mask]
 
         if type == "INVLIN":
-            return raster.generate_invlin(points, max_dist_invlin, null_values)
+            return raster.generate_invlin(points, max_dist_invlin, null_values, power=power_invlin, k=k_invlin)
 
         return GenerateRaster(resolution=resolution, bbox=bbox, crs=crs)
 
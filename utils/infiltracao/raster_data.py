@@ -3,6 +3,7 @@ import xarray as xr
 import rioxarray
 
 from shapely import Point
+from scipy.spatial import cKDTree
 
 class GenerateRaster:
 
@@ -20,31 +21,64 @@ class GenerateRaster:
         )
         self.raster.rio.write_crs(crs, inplace=True)
 
-    def generate_invlin(self, points:np.ndarray, max_dist: float|None = None, null_values:float = -1):
+    def generate_invlin(
+        self,
+        points:np.ndarray,
+        max_dist: float|None = None,
+        null_values:float = -1,
+        power:float = 1,
+        k:int|None = None,
+        max_elements:int = 2**22,
+    ):
+        """Interpolação pelo inverso da distância (IDW) dos `points` `[x, y, valor]` no grid do raster.
+
+        - `power`: expoente da distância, o peso de cada ponto é `1/d^power`
+        - `k`: usa apenas os `k` pontos mais próximos de cada pixel, `O(pixels x k)`. `None` (padrão) usa
+          todos, `O(pixels x pontos)`, então em grids grandes passe um `k` (ex.: 12)
+        - `max_dist`: ignora os pontos a uma distância maior que `max_dist`
+        - Pixels sem pontos recebem `null_values` e pixels sobre um ponto recebem o valor do ponto
+
+        Os vizinhos são obtidos por uma árvore KD (`cKDTree`) e o grid é avaliado em blocos de linhas
+        com no máximo `max_elements` pares (pixel, vizinho) por vez.
+        """
         band = self.raster
         x_coords, y_coords = band['x'].values, band['y'].values
 
         null_raster = self.raster.copy(deep=True)
         null_raster.data[...] = null_values
 
-        for index_y in range(self.raster.shape[0]):  # Para cada linha
-            points_x:np.ndarray = np.array([x_coords[index_x] for index_x in range(self.raster.shape[1])])
-            points_y:np.ndarray = np.array([y_coords[index_y]]*self.raster.shape[1])
+        if len(points) == 0:
+            return null_raster
+
+        tree = cKDTree(points[:, :2])
+        values = points[:, 2]
+
+        k = len(points) if k is None else min(k, len(points))
+        upper_bound = np.inf if max_dist is None else np.nextafter(max_dist, np.inf) # Inclui d == max_dist
+        n_rows = max(1, max_elements // (len(x_coords)*k))
+
+        for start in range(0, len(y_coords), n_rows):  # Para cada bloco de linhas
+            rows = y_coords[start:start + n_rows]
+            grid = np.column_stack([np.tile(x_coords, len(rows)), np.repeat(rows, len(x_coords))])
 
-            dif_x = points_x[:, np.newaxis]-points[:, 0]
-            dif_y = points_y[:, np.newaxis]-points[:, 1]
+            distancias, indices = tree.query(grid, k=k, distance_upper_bound=upper_bound, workers=-1)
+            distancias = distancias.reshape(len(grid), k)
+            indices = indices.reshape(len(grid), k)
 
-            distancias = np.hypot(dif_x, dif_y)
+            # Vizinhos não encontrados (além de max_dist) têm distância infinita e índice inválido
+            found = np.isfinite(distancias)
+            indices = np.where(found, indices, 0)
 
-            if max_dist is not None:
-                mask_dist = (distancias <= max_dist)
-                distancias = np.where(mask_dist, distancias, 0)
+            with np.errstate(divide="ignore"):
+                pesos = np.where(found, 1/np.power(distancias, power), 0)
 
-            multi_media = 1/distancias
-            multi_media[np.isinf(multi_media)] = 0
+            # Pixel exatamente sobre um ponto assume o valor do ponto
+            sobre_ponto = found & (distancias == 0)
+            linhas_sobre = sobre_ponto.any(axis=1)
+            pesos[linhas_sobre] = sobre_ponto[linhas_sobre]
 
-            div_media = np.sum(multi_media, axis=1)
-            na_medio = np.sum(points[:, 2] * multi_media, axis=1)/div_media
+            with np.errstate(invalid="ignore"):
+                na_medio = np.sum(values[indices] * pesos, axis=1)/np.sum(pesos, axis=1)
 
             na_medio = np.nan_to_num(
                 na_medio,
@@ -53,7 +87,7 @@ class GenerateRaster:
                 neginf=null_values
             )
 
-            null_raster.values[index_y] = na_medio
+            null_raster.values[start:start + len(rows)] = na_medio.reshape(len(rows), len(x_coords))
 
         return null_raster
     
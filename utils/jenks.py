@@ -0,0 +1,186 @@
+import numpy as np
+import rasterio
+
+from .raster_blocks import iter_windows, map_blocks
+
+
+class StreamingHistogram:
+    """Histograma fino de um raster, acumulado bloco a bloco.
+
+    Para cada bin guarda a contagem, a soma, a soma dos quadrados, o mínimo e o máximo dos valores,
+    assim a soma dos desvios quadrados de qualquer grupo de bins é exata.
+    """
+
+    def __init__(self, vmin:float, vmax:float, n_bins:int = 4096):
+        if not vmax >= vmin:
+            raise ValueError(f"Intervalo inválido para o histograma: [{vmin}, {vmax}]")
+
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self.n_bins = n_bins
+        self.scale = n_bins / (self.vmax - self.vmin) if self.vmax > self.vmin else 0.0
+
+        self.count = np.zeros(n_bins, dtype=np.float64)
+        self.sum   = np.zeros(n_bins, dtype=np.float64)
+        self.sum2  = np.zeros(n_bins, dtype=np.float64)
+        self.min   = np.full(n_bins, np.inf, dtype=np.float64)
+        self.max   = np.full(n_bins, -np.inf, dtype=np.float64)
+
+    def update(self, values:np.ndarray):
+        """Adiciona os valores (já filtrados) ao histograma, valores fora de [vmin, vmax] são ignorados"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        values = values[(values >= self.vmin) & (values <= self.vmax)]
+        if values.size == 0:
+            return
+
+        idx = ((values - self.vmin) * self.scale).astype(np.intp)
+        np.clip(idx, 0, self.n_bins - 1, out=idx)
+
+        self.count += np.bincount(idx, minlength=self.n_bins)
+        self.sum   += np.bincount(idx, weights=values, minlength=self.n_bins)
+        self.sum2  += np.bincount(idx, weights=values*values, minlength=self.n_bins)
+        np.minimum.at(self.min, idx, values)
+        np.maximum.at(self.max, idx, values)
+
+    def merge(self, other:"StreamingHistogram"):
+        """Soma outro histograma com o mesmo intervalo e número de bins"""
+        if (other.vmin, other.vmax, other.n_bins) != (self.vmin, self.vmax, self.n_bins):
+            raise ValueError("Os histogramas devem ter o mesmo intervalo e número de bins")
+
+        self.count += other.count
+        self.sum   += other.sum
+        self.sum2  += other.sum2
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+
+
+def _valid(values:np.ndarray, valid_range:tuple[float|None, float|None]) -> np.ndarray:
+    values = np.asarray(values).reshape(-1)
+    mask = ~np.isnan(values)
+    if valid_range[0] is not None:
+        mask &= values >= valid_range[0]
+    if valid_range[1] is not None:
+        mask &= values <= valid_range[1]
+    return values[mask]
+
+def jenks_histogram(hist:StreamingHistogram, n_classes:int) -> dict:
+    """Quebras naturais de Jenks (programação dinâmica de Fisher) sobre os bins do histograma.
+
+    Retorna um dicionário com:
+    - `breaks`: `[mínimo, limite superior da classe 1, ..., máximo]`, no mesmo formato do `jenkspy`
+    - `gvf`: qualidade da classificação (Goodness of Variance Fit)
+    - `bin_resolution`: maior amplitude dos bins vizinhos às quebras internas, ou seja, a quantização
+      das quebras pelo histograma (as quebras só podem cair entre bins). Não é um limite do erro em
+      relação ao Jenks exato, que pode escolher outro bin. É zero quando cada bin tem um único valor
+      (rasteres com valores discretos).
+    """
+    used = hist.count > 0
+    count = hist.count[used]
+    bin_min = hist.min[used]
+    bin_max = hist.max[used]
+    m = len(count)
+
+    if m == 0:
+        raise ValueError("O histograma não tem valores")
+    if n_classes > m:
+        raise ValueError(f"Não é possível criar {n_classes} classes com apenas {m} bins com valores")
+
+    # Somas acumuladas, o custo de juntar os bins [j, i) é Σx² - (Σx)²/n
+    cw = np.concatenate([[0.0], np.cumsum(count)])
+    cs = np.concatenate([[0.0], np.cumsum(hist.sum[used])])
+    cq = np.concatenate([[0.0], np.cumsum(hist.sum2[used])])
+
+    def ssd(j, i):
+        s = cs[i] - cs[j]
+        return np.maximum((cq[i] - cq[j]) - s*s/(cw[i] - cw[j]), 0.0)
+
+    # cost[c, i]: menor soma dos desvios quadrados dos bins [0, i) em c+1 classes
+    cost = np.full((n_classes, m + 1), np.inf)
+    start = np.zeros((n_classes, m + 1), dtype=np.intp)
+    cost[0, 1:] = ssd(0, np.arange(1, m + 1))
+
+    for c in range(1, n_classes):
+        for i in range(c + 1, m + 1):
+            j = np.arange(c, i)
+            total = cost[c - 1, j] + ssd(j, i)
+            best = np.argmin(total)
+            cost[c, i] = total[best]
+            start[c, i] = j[best]
+
+    # Bins finais de cada classe
+    ends = [m]
+    for c in range(n_classes - 1, 0, -1):
+        ends.append(start[c, ends[-1]])
+    ends = ends[::-1]
+
+    breaks = [float(bin_min[0])] + [float(bin_max[e - 1]) for e in ends]
+
+    # Amplitude dos bins que encostam em cada quebra interna
+    spread = bin_max - bin_min
+    bin_resolution = max([max(spread[e - 1], spread[e]) for e in ends[:-1]], default=0.0)
+
+    sdam = float(ssd(0, m))
+    sdcm = float(cost[n_classes - 1, m])
+
+    return {
+        "breaks": breaks,
+        "gvf": 1 - sdcm/sdam if sdam > 0 else 1.0,
+        "bin_resolution": float(bin_resolution),
+        "bin_width": (hist.vmax - hist.vmin)/hist.n_bins,
+    }
+
+def jenks_array(
+    values:np.ndarray,
+    n_classes:int,
+    n_bins:int = 4096,
+    valid_range:tuple[float|None, float|None] = (None, None),
+) -> dict:
+    """Quebras de Jenks de um array, sem amostragem, usando um histograma de `n_bins` bins (ver `jenks_histogram`)"""
+    values = _valid(values, valid_range)
+    if values.size == 0:
+        raise ValueError("Não há valores válidos para a classificação")
+
+    hist = StreamingHistogram(values.min(), values.max(), n_bins)
+    hist.update(values)
+    return jenks_histogram(hist, n_classes)
+
+def jenks_raster(
+    path:str,
+    n_classes:int,
+    n_bins:int = 4096,
+    valid_range:tuple[float|None, float|None] = (None, None),
+    block_size:int = 1024,
+    n_workers:int|None = None,
+) -> dict:
+    """Quebras de Jenks de um raster inteiro em memória limitada, lendo-o por blocos (ver `jenks_histogram`).
+
+    Uma primeira leitura obtém o mínimo e o máximo, e a segunda acumula o histograma. O resultado é
+    determinístico, sem a amostragem aleatória de 100 mil pixels.
+    """
+    with rasterio.open(path) as src:
+        windows = iter_windows(src.width, src.height, block_size)
+
+    def min_max(blocos):
+        values = _valid(blocos[0], valid_range)
+        if values.size == 0:
+            return np.inf, -np.inf
+        return values.min(), values.max()
+
+    vmin, vmax = np.inf, -np.inf
+    for _, (bmin, bmax) in map_blocks(min_max, [path], windows, n_workers, desc="Mínimo e máximo"):
+        vmin = min(vmin, bmin)
+        vmax = max(vmax, bmax)
+
+    if vmin > vmax:
+        raise ValueError(f"O raster {path} não tem valores válidos para a classificação")
+
+    def histogram(blocos):
+        hist = StreamingHistogram(vmin, vmax, n_bins)
+        hist.update(_valid(blocos[0], valid_range))
+        return hist
+
+    total = StreamingHistogram(vmin, vmax, n_bins)
+    for _, hist in map_blocks(histogram, [path], windows, n_workers, desc="Histograma"):
+        total.merge(hist)
+
+    return jenks_histogram(total, n_classes)
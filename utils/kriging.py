@@ -0,0 +1,409 @@
+import os
+import numpy as np
+import rasterio
+
+from tqdm import tqdm
+from time import perf_counter
+from skgstat import Variogram
+from contextlib import ExitStack
+from collections import OrderedDict
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+from scipy.linalg import lu_factor, lu_solve
+from scipy.optimize import curve_fit
+from concurrent.futures import ProcessPoolExecutor
+
+from .raster_blocks import iter_windows, tiled_profile
+
+
+# Modelos de variograma normalizados (sill parcial = 1), com o alcance efetivo `r` como no skgstat
+def _spherical(h, r):
+    h = np.minimum(h / r, 1.0)
+    return 1.5*h - 0.5*np.power(h, 3)
+
+def _exponential(h, r):
+    return 1.0 - np.exp(-3.0*h / r)
+
+def _gaussian(h, r):
+    return 1.0 - np.exp(-np.power(2.0*h / r, 2))
+
+VARIOGRAM_MODELS = {
+    "spherical": _spherical,
+    "exponential": _exponential,
+    "gaussian": _gaussian,
+}
+
+
+def fit_variogram(coords:np.ndarray, z:np.ndarray, model:str = "spherical", maxlag="median", n_lags:int = 8) -> dict:
+    """Ajusta um variograma (skgstat) e retorna `{"model", "range", "sill", "nugget"}`, com o sill parcial"""
+    V = Variogram(coords, z, model=model, maxlag=maxlag, n_lags=n_lags)
+
+    return {
+        "model": model,
+        "range": float(V.parameters[0]),
+        "sill": float(V.parameters[1]),
+        "nugget": float(V.parameters[2]),
+    }
+
+def fit_shared_variogram(coords:np.ndarray, targets:dict[str, np.ndarray], model:str = "spherical", maxlag="median", n_lags:int = 8) -> tuple[dict, dict[str, float]]:
+    """Ajusta um único variograma normalizado para vários alvos no mesmo conjunto de pontos.
+
+    Cada alvo é padronizado (média 0, variância 1) e, como os pontos são os mesmos, as semivariâncias
+    experimentais de todos os alvos estão nas mesmas classes de distância e são agrupadas pela média de
+    cada classe. O modelo é ajustado uma única vez a essas semivariâncias (mínimos quadrados com os
+    limites do skgstat e sem efeito pepita, como no `fit_variogram`).
+
+    Retorna o variograma normalizado e a variância de cada alvo, que escala a variância de krigagem.
+    Como os pesos da krigagem não mudam quando a covariância é multiplicada por uma constante, todos os
+    alvos usam a mesma fatoração do sistema.
+    """
+    bins = None
+    experimental = []
+    scales = {}
+    for name, z in targets.items():
+        z = np.asarray(z, dtype=np.float64)
+        std = z.std()
+        scales[name] = float(std*std)
+
+        V = Variogram(coords, (z - z.mean())/(std if std > 0 else 1.0), model=model, maxlag=maxlag, n_lags=n_lags)
+        bins = np.asarray(V.bins, dtype=np.float64)
+        experimental.append(np.asarray(V.experimental, dtype=np.float64))
+
+    experimental = np.stack(experimental)
+    valid = np.isfinite(bins) & np.isfinite(experimental).all(axis=0)
+    if valid.sum() < 2:
+        raise ValueError("Semivariâncias experimentais insuficientes para ajustar o variograma")
+
+    h, semivariance = bins[valid], experimental[:, valid].mean(axis=0)
+    gamma = VARIOGRAM_MODELS[model]
+    (r, sill), _ = curve_fit(
+        lambda h, r, sill: sill*gamma(h, r),
+        h,
+        semivariance,
+        p0=[h.mean(), semivariance.mean()],
+        bounds=(0, [h.max(), semivariance.max()]),
+        method="trf",
+    )
+
+    shared = {"model": model, "range": float(r), "sill": float(sill), "nugget": 0.0}
+    return shared, scales
+
+
+class OrdinaryKriging:
+    """Krigagem ordinária com o sistema fatorado (LU) uma única vez para um conjunto de pontos.
+
+    A covariância é `C(h) = sill*(1 - γn(h))`, com o efeito pepita somado apenas na diagonal dos pontos
+    (erro de medida, como o `gstools` com `exact=False`). A matriz do sistema só depende dos pontos e do
+    variograma, então a mesma fatoração serve para todos os alvos que compartilham o variograma.
+    """
+
+    def __init__(self, coords:np.ndarray, variogram:dict):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.variogram = variogram
+        self._gamma = VARIOGRAM_MODELS[variogram["model"]]
+
+        n = len(self.coords)
+        A = np.ones((n + 1, n + 1))
+        A[:n, :n] = self.covariance(cdist(self.coords, self.coords))
+        A[:n, :n] += variogram["nugget"]*np.eye(n)
+        A[n, n] = 0.0
+
+        self.lu = lu_factor(A)
+
+    def covariance(self, h:np.ndarray) -> np.ndarray:
+        return self.variogram["sill"]*(1.0 - self._gamma(h, self.variogram["range"]))
+
+    def weights(self, targets:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Retorna os pesos `(n, m)` dos pontos e a variância de krigagem `(m,)` nas `targets` `(m, 2)`"""
+        n = len(self.coords)
+
+        b = np.ones((n + 1, len(targets)))
+        b[:n] = self.covariance(cdist(self.coords, targets))
+
+        solution = lu_solve(self.lu, b)
+        lambdas = solution[:n]
+
+        # σ² = C(0) - Σλ·c0 - μ
+        variance = self.variogram["sill"] + self.variogram["nugget"] - np.einsum("ij,ij->j", solution, b)
+        return lambdas, np.maximum(variance, 0.0)
+
+    def predict(self, targets:np.ndarray, values:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Predição `(m, T)` para os `T` alvos em `values` `(n, T)` e a variância `(m,)`"""
+        lambdas, variance = self.weights(targets)
+        return lambdas.T @ np.asarray(values, dtype=np.float64), variance
+
+
+class LocalKriging:
+    """Krigagem ordinária em vizinhança móvel: cada célula usa apenas as `n_neighbors` amostras mais próximas.
+
+    As vizinhanças são buscadas em uma KD-tree e as células com o mesmo conjunto de vizinhos usam o mesmo
+    sistema `(k+1)x(k+1)`. Os sistemas novos são montados e invertidos todos de uma vez (em pilha) e as
+    inversas ficam em um cache LRU de `cache_size` vizinhanças, reaproveitadas entre tiles, já que células
+    próximas do grid quase sempre compartilham os vizinhos. Mesma interface de `OrdinaryKriging`.
+    """
+
+    def __init__(self, coords:np.ndarray, variogram:dict, n_neighbors:int = 16, cache_size:int = 65536):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.variogram = variogram
+        self.n_neighbors = min(n_neighbors, len(self.coords))
+        self.cache_size = cache_size
+        self.tree = cKDTree(self.coords)
+        self._gamma = VARIOGRAM_MODELS[variogram["model"]]
+
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def covariance(self, h:np.ndarray) -> np.ndarray:
+        return self.variogram["sill"]*(1.0 - self._gamma(h, self.variogram["range"]))
+
+    def _inverses(self, neighborhoods:np.ndarray) -> np.ndarray:
+        """Inversas `(G, k+1, k+1)` dos sistemas de cada vizinhança `(G, k)`, usando o cache"""
+        k = neighborhoods.shape[1]
+        inverses = np.empty((len(neighborhoods), k + 1, k + 1))
+
+        keys = [neighbors.tobytes() for neighbors in neighborhoods]
+        missing = []
+        for g, key in enumerate(keys):
+            inverse = self._cache.get(key)
+            if inverse is None:
+                missing.append(g)
+                continue
+            self._cache.move_to_end(key)
+            inverses[g] = inverse
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if not missing:
+            return inverses
+
+        # Monta e inverte todos os sistemas novos de uma vez
+        points = self.coords[neighborhoods[missing]]
+        h = np.linalg.norm(points[:, :, None, :] - points[:, None, :, :], axis=-1)
+
+        A = np.ones((len(missing), k + 1, k + 1))
+        A[:, :k, :k] = self.covariance(h)
+        A[:, np.arange(k), np.arange(k)] += self.variogram["nugget"]
+        A[:, k, k] = 0.0
+        inverses[missing] = np.linalg.inv(A)
+
+        for g in missing:
+            self._cache[keys[g]] = inverses[g]
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return inverses
+
+    def predict(self, targets:np.ndarray, values:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Predição `(m, T)` para os `T` alvos em `values` `(n, T)` e a variância `(m,)`"""
+        targets = np.asarray(targets, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        flat_values = values.reshape(len(self.coords), -1)
+        k = self.n_neighbors
+
+        _, idx = self.tree.query(targets, k=k)
+        idx = np.sort(idx.reshape(len(targets), k), axis=1)
+
+        # Agrupa as células pelo conjunto de vizinhos
+        neighborhoods, group = np.unique(idx, axis=0, return_inverse=True)
+        inverses = self._inverses(neighborhoods)
+        group = group.reshape(-1)
+
+        pred = np.empty((len(targets), flat_values.shape[1]))
+        variance = np.empty(len(targets))
+
+        # Resolve em pedaços para limitar a memória das inversas de cada célula
+        step = max(1, (1 << 22) // ((k + 1)*(k + 1)))
+        for start in range(0, len(targets), step):
+            cells = slice(start, start + step)
+
+            b = np.ones((len(targets[cells]), k + 1))
+            b[:, :k] = self.covariance(np.linalg.norm(self.coords[idx[cells]] - targets[cells, None, :], axis=-1))
+
+            solution = np.einsum("cij,cj->ci", inverses[group[cells]], b)
+
+            pred[cells] = np.einsum("ck,ckt->ct", solution[:, :k], flat_values[idx[cells]])
+            variance[cells] = self.variogram["sill"] + self.variogram["nugget"] - np.einsum("ci,ci->c", solution, b)
+
+        return pred.reshape((len(targets),) + values.shape[1:]), np.maximum(variance, 0.0)
+
+
+def grid_centers(transform, window) -> np.ndarray:
+    """Coordenadas `(m, 2)` dos centros dos pixels de uma janela do grid"""
+    cols = window.col_off + np.arange(window.width) + 0.5
+    rows = window.row_off + np.arange(window.height) + 0.5
+    cc, rr = np.meshgrid(cols, rows)
+    xs, ys = transform * (cc.ravel(), rr.ravel())
+    return np.column_stack([xs, ys])
+
+
+# Estado de cada processo de trabalho: [(krigagem, nomes, valores, escalas), ...] e o transform do grid
+_WORKER: dict = {}
+
+def _init_worker(groups, transform):
+    _WORKER["groups"] = groups
+    _WORKER["transform"] = transform
+
+def _krige_tile(window):
+    targets = grid_centers(_WORKER["transform"], window)
+    shape = (int(window.height), int(window.width))
+
+    results = {}
+    for ok, names, values, scales in _WORKER["groups"]:
+        pred, var = ok.predict(targets, values)
+        for i, name in enumerate(names):
+            results[name] = (
+                pred[:, i].reshape(shape).astype("float32"),
+                (var*scales[i]).reshape(shape).astype("float32"),
+            )
+
+    return window, results
+
+def krige_to_rasters(
+    coords:np.ndarray,
+    targets:dict[str, np.ndarray],
+    template:str,
+    out_paths:dict[str, str],
+    model:str = "spherical",
+    shared_variogram:bool = False,
+    maxlag="median",
+    n_lags:int = 8,
+    n_neighbors:int|None = None,
+    tile_size:int = 256,
+    n_workers:int|None = None,
+):
+    """Krigagem ordinária de vários alvos (ex.: frações de textura em uma profundidade) no grid do raster `template`.
+
+    - `coords`: `(n, 2)` coordenadas dos pontos, no CRS do `template`
+    - `targets`: `{nome: valores (n,)}`, todos medidos nos mesmos pontos
+    - `out_paths`: `{nome: caminho}` do GeoTIFF de saída, banda 1 = predição e banda 2 = variância
+    - `shared_variogram`: um variograma normalizado ajustado às semivariâncias de todos os alvos juntos
+      (`fit_shared_variogram`), com uma única fatoração do sistema. Por padrão cada alvo tem o seu
+      variograma (alvos com o mesmo variograma ainda compartilham a fatoração)
+    - `n_neighbors`: se informado, usa a krigagem local (`LocalKriging`) com as `n_neighbors` amostras mais
+      próximas de cada célula, necessária para grids grandes com muitas amostras
+
+    O grid é processado em tiles de `tile_size` pixels em `n_workers` processos e cada tile é gravado
+    diretamente nos GeoTIFFs tileados. Em scripts (não notebooks) a chamada deve estar protegida por
+    `if __name__ == "__main__":` por causa dos processos.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    names = list(targets.keys())
+
+    if set(names) != set(out_paths):
+        raise ValueError("Cada alvo deve ter um caminho de saída")
+
+    # Agrupa os alvos pelo variograma, uma fatoração por grupo
+    if shared_variogram:
+        variogram, scales = fit_shared_variogram(coords, targets, model, maxlag, n_lags)
+        groups_params = {tuple(variogram.values()): (variogram, names, [scales[name] for name in names])}
+    else:
+        groups_params = {}
+        for name in names:
+            variogram = fit_variogram(coords, targets[name], model, maxlag, n_lags)
+            key = tuple(variogram.values())
+            groups_params.setdefault(key, (variogram, [], []))
+            groups_params[key][1].append(name)
+            groups_params[key][2].append(1.0)
+
+    groups = []
+    for variogram, group_names, scales in groups_params.values():
+        values = np.column_stack([np.asarray(targets[name], dtype=np.float64) for name in group_names])
+        if n_neighbors is None:
+            solver = OrdinaryKriging(coords, variogram)
+        else:
+            solver = LocalKriging(coords, variogram, n_neighbors)
+        groups.append((solver, group_names, values, scales))
+
+    with rasterio.open(template) as src:
+        profile = src.profile.copy()
+    transform = profile["transform"]
+
+    windows = iter_windows(profile["width"], profile["height"], tile_size)
+    out_profile = tiled_profile(profile, dtype="float32", nodata=np.nan, count=2, block_size=min(tile_size, 512))
+
+    n_workers = n_workers or os.cpu_count() or 1
+
+    with ExitStack() as stack:
+        dsts = {name: stack.enter_context(rasterio.open(path, "w", **out_profile)) for name, path in out_paths.items()}
+        for dst in dsts.values():
+            dst.set_band_description(1, "pred")
+            dst.set_band_description(2, "var")
+
+        def write(window, results):
+            for name, (pred, var) in results.items():
+                dsts[name].write(pred, 1, window=window)
+                dsts[name].write(var, 2, window=window)
+
+        if n_workers == 1:
+            _init_worker(groups, transform)
+            for window in tqdm(windows, desc="Krigagem"):
+                write(*_krige_tile(window))
+            return out_paths
+
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(groups, transform)) as executor:
+            for window, results in tqdm(executor.map(_krige_tile, windows, chunksize=4), total=len(windows), desc="Krigagem"):
+                write(window, results)
+
+    return out_paths
+
+
+def _predict_chunked(solver, targets:np.ndarray, values:np.ndarray, chunk_size:int = 4096):
+    pred = np.empty(len(targets))
+    variance = np.empty(len(targets))
+    for start in range(0, len(targets), chunk_size):
+        end = start + chunk_size
+        pred[start:end], variance[start:end] = solver.predict(targets[start:end], values)
+    return pred, variance
+
+def _loo_rmse(make_solver, coords:np.ndarray, z:np.ndarray) -> float:
+    """Raiz do erro quadrático médio da validação cruzada deixando uma amostra de fora"""
+    errors = np.empty(len(z))
+    for i in range(len(z)):
+        keep = np.arange(len(z)) != i
+        pred, _ = make_solver(coords[keep]).predict(coords[i:i + 1], z[keep])
+        errors[i] = pred[0] - z[i]
+    return float(np.sqrt(np.mean(errors*errors)))
+
+def benchmark_local_kriging(
+    coords:np.ndarray,
+    z:np.ndarray,
+    variogram:dict|None = None,
+    n_neighbors:tuple[int, ...] = (8, 16, 32),
+    grid_size:int = 300,
+):
+    """Compara a krigagem local com a global nas amostras de solo `coords`, `z`.
+
+    Mede o tempo em um grid de `grid_size` x `grid_size` células sobre a área das amostras, a diferença
+    para a predição e a variância da krigagem global e o erro da validação cruzada (leave-one-out).
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    if variogram is None:
+        variogram = fit_variogram(coords, z)
+
+    xs = np.linspace(coords[:, 0].min(), coords[:, 0].max(), grid_size)
+    ys = np.linspace(coords[:, 1].max(), coords[:, 1].min(), grid_size)
+    X, Y = np.meshgrid(xs, ys)
+    targets = np.column_stack([X.ravel(), Y.ravel()])
+
+    start = perf_counter()
+    pred_global, var_global = _predict_chunked(OrdinaryKriging(coords, variogram), targets, z)
+    t_global = perf_counter() - start
+    loo_global = _loo_rmse(lambda c: OrdinaryKriging(c, variogram), coords, z)
+
+    print(f"Global ({len(z)} amostras, {len(targets)} células): {t_global:.3f} s | LOO RMSE {loo_global:.4f}")
+
+    for k in n_neighbors:
+        if k >= len(z):
+            continue
+
+        start = perf_counter()
+        local = LocalKriging(coords, variogram, k)
+        pred, var = _predict_chunked(local, targets, z)
+        t_local = perf_counter() - start
+        loo_local = _loo_rmse(lambda c: LocalKriging(c, variogram, k), coords, z)
+
+        diff = np.abs(pred - pred_global)
+        print(f"Local k={k}: {t_local:.3f} s | {t_global/t_local:.1f}x | {local.misses} sistemas, {local.hits} reaproveitados | LOO RMSE {loo_local:.4f}")
+        print(f"\t|Δpred| médio {diff.mean():.4g}, máximo {diff.max():.4g} | |Δvar| máximo {np.abs(var - var_global).max():.4g}")
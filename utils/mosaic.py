@@ -0,0 +1,196 @@
+import os
+import json
+import zipfile
+import threading
+import numpy as np
+import rasterio
+
+from tqdm import tqdm
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.windows import from_bounds
+from concurrent.futures import ThreadPoolExecutor
+
+from .raster_blocks import iter_windows, tiled_profile
+
+
+def list_zip_tiles(raster_dir:str, extension:str = ".tif") -> list[str]:
+    """Caminhos `/vsizip/` de todos os rasteres dentro dos `.zip` de `raster_dir`, lidos sem extrair"""
+    paths = []
+    for file in sorted(os.listdir(raster_dir)):
+        if not file.lower().endswith(".zip"):
+            continue
+
+        zip_path = os.path.abspath(os.path.join(raster_dir, file)).replace("\\", "/")
+        with zipfile.ZipFile(zip_path, "r") as z:
+            for name in sorted(z.namelist()):
+                if name.lower().endswith(extension):
+                    paths.append(f"/vsizip/{zip_path}/{name}")
+    return paths
+
+def _source_file(path:str) -> str:
+    """Arquivo no disco de um caminho, inclusive `/vsizip/arquivo.zip/raster.tif`"""
+    if path.startswith("/vsizip/"):
+        path = path[len("/vsizip/"):]
+        return path[:path.lower().index(".zip") + 4]
+    return path
+
+def index_tiles(paths:list[str], index_path:str|None = None) -> list[dict]:
+    """Índice dos rasteres (limites, resolução, CRS e nodata), como um VRT simplificado.
+
+    Apenas os cabeçalhos são lidos. Com `index_path` o índice é salvo em JSON e, ao executar de novo,
+    os rasteres já indexados (mesmo arquivo, tamanho e data) não são abertos novamente.
+    """
+    cached = {}
+    if index_path is not None and os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            cached = {tile["path"]: tile for tile in json.load(f)}
+
+    tiles = []
+    for path in tqdm(paths, desc="Indexando rasteres"):
+        stat = os.stat(_source_file(path))
+        tile = cached.get(path)
+        if tile is None or tile["size"] != stat.st_size or tile["mtime"] != stat.st_mtime:
+            with rasterio.open(path) as src:
+                tile = {
+                    "path": path,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "bounds": list(src.bounds),
+                    "res": list(src.res),
+                    "crs": src.crs.to_string() if src.crs is not None else None,
+                    "nodata": src.nodata,
+                    "dtype": src.dtypes[0],
+                }
+        tiles.append(tile)
+
+    if index_path is not None:
+        tmp = f"{index_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(tiles, f, indent=1)
+        os.replace(tmp, index_path)
+
+    return tiles
+
+def build_mosaic(
+    raster_dir:str,
+    out_path:str,
+    crs:str = "EPSG:4326",
+    res:tuple[float, float]|None = None,
+    block_size:int = 2048,
+    resampling:Resampling = Resampling.nearest,
+    n_workers:int|None = None,
+) -> str:
+    """Mosaico dos rasteres dentro dos `.zip` de `raster_dir` (ex.: folhas do Topodata), gravado janela a janela.
+
+    Os rasteres são lidos direto dos zips (`/vsizip/`) e indexados pelos limites (`index_tiles`). Cada
+    janela de `block_size` do mosaico lê apenas os rasteres que a cruzam, na ordem dos arquivos; onde
+    há sobreposição vale o primeiro valor válido, como no `merge_arrays`. O nodata vira NaN (float32).
+    A resolução é a menor dos rasteres, se `res` não for dado, e o CRS é `crs` (as folhas do Topodata
+    não trazem o CRS).
+
+    O progresso é salvo em `out_path.progress.json`: se a execução for interrompida, a próxima continua
+    das janelas que faltam. A memória depende apenas de `block_size` e de `n_workers`.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    index_path = f"{out_path}.index.json"
+    progress_path = f"{out_path}.progress.json"
+
+    tiles = index_tiles(list_zip_tiles(raster_dir), index_path)
+    if not tiles:
+        raise ValueError(f"Nenhum raster encontrado nos zips de {raster_dir}")
+
+    bounds = np.array([tile["bounds"] for tile in tiles])
+    if res is None:
+        res = tuple(np.min([tile["res"] for tile in tiles], axis=0))
+
+    left, bottom, right, top = bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()
+    width = int(round((right - left)/res[0]))
+    height = int(round((top - bottom)/res[1]))
+    transform = Affine(res[0], 0, left, 0, -res[1], top)
+
+    profile = tiled_profile({"width": width, "height": height, "crs": CRS.from_user_input(crs), "transform": transform})
+    windows = iter_windows(width, height, block_size)
+
+    # Retoma o mosaico se o progresso for do mesmo grid e dos mesmos rasteres
+    grid = {"transform": list(transform)[:6], "width": width, "height": height, "block_size": block_size, "tiles": [tile["path"] for tile in tiles]}
+    done = set()
+    if os.path.exists(out_path) and os.path.exists(progress_path):
+        with open(progress_path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress["grid"] == grid:
+            done = set(progress["done"])
+
+    if done:
+        print(f"Retomando o mosaico: {len(done)} de {len(windows)} janelas já gravadas")
+    else:
+        with rasterio.open(out_path, "w", **profile):
+            pass
+
+    local = threading.local()
+    opened = []
+    lock = threading.Lock()
+
+    def read_window(i:int) -> tuple[int, np.ndarray]:
+        window = windows[i]
+        w_left, w_top = transform * (window.col_off, window.row_off)
+        w_right, w_bottom = transform * (window.col_off + window.width, window.row_off + window.height)
+
+        out = np.full((window.height, window.width), np.nan, dtype=np.float32)
+        hits = np.flatnonzero(
+            (bounds[:, 0] < w_right) & (bounds[:, 2] > w_left) &
+            (bounds[:, 1] < w_top) & (bounds[:, 3] > w_bottom)
+        )
+
+        # Um handle do GDAL por thread e por raster
+        datasets = getattr(local, "datasets", None)
+        if datasets is None:
+            datasets = local.datasets = {}
+
+        for t in hits:
+            tile = tiles[t]
+            src = datasets.get(tile["path"])
+            if src is None:
+                src = datasets[tile["path"]] = rasterio.open(tile["path"])
+                with lock:
+                    opened.append(src)
+
+            data = src.read(
+                1,
+                window=from_bounds(w_left, w_bottom, w_right, w_top, src.transform),
+                out_shape=(window.height, window.width),
+                boundless=True,
+                masked=True,
+                resampling=resampling,
+            )
+
+            # Primeiro valor válido de cada pixel
+            empty = np.isnan(out)
+            out[empty] = data.astype(np.float32).filled(np.nan)[empty]
+            if not np.isnan(out).any():
+                break
+
+        return i, out
+
+    pending = [i for i in range(len(windows)) if i not in done]
+    chunk = 4*n_workers
+    try:
+        with ThreadPoolExecutor(n_workers) as executor, tqdm(total=len(pending), desc="Mosaico") as bar:
+            for start in range(0, len(pending), chunk):
+                # O raster é fechado (gravado no disco) antes de salvar o progresso de cada grupo de janelas
+                with rasterio.open(out_path, "r+") as dst:
+                    for i, block in executor.map(read_window, pending[start:start + chunk]):
+                        dst.write(block, 1, window=windows[i])
+                        done.add(i)
+                        bar.update()
+
+                tmp = f"{progress_path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"grid": grid, "done": sorted(done)}, f)
+                os.replace(tmp, progress_path)
+    finally:
+        for src in opened:
+            src.close()
+
+    return out_path
@@ -0,0 +1,50 @@
+import numpy as np
+
+from .reclass import CHUNK_SIZE
+
+
+def weighted_overlay(factors:list[np.ndarray], weights:dict[str, list[float]]) -> dict[str, np.ndarray]:
+    """Soma ponderada de `factors` para vários conjuntos de pesos em uma única passada.
+
+    - `factors`: rasteres (índices de cada fator) com o mesmo shape
+    - `weights`: `{nome: [peso de cada fator]}`, por exemplo MIF, AHP ou pesos do usuário
+
+    Retorna `{nome: potencial}` em float32. Cada fator é lido uma vez por pedaço e somado em um
+    acumulador float32 por conjunto de pesos, sem temporários do tamanho do raster, então um
+    conjunto de pesos a mais custa apenas uma multiplicação e uma soma por pixel.
+    NaN em qualquer fator resulta em NaN no potencial.
+    """
+    if len(factors) == 0:
+        raise ValueError("É necessário pelo menos um fator")
+
+    shape = np.shape(factors[0])
+    for factor in factors:
+        if np.shape(factor) != shape:
+            raise ValueError(f"Todos os fatores devem ter o mesmo shape, {np.shape(factor)} != {shape}")
+
+    names = list(weights.keys())
+    W = np.array([np.asarray(weights[name], dtype="float32") for name in names]) # (conjuntos, fatores)
+    if W.shape[1] != len(factors):
+        raise ValueError(f"Cada conjunto de pesos deve ter {len(factors)} valores, um para cada fator")
+
+    flats = [np.asarray(factor).reshape(-1) for factor in factors]
+    size = flats[0].size
+
+    outputs = {name: np.zeros(size, dtype="float32") for name in names}
+    accumulators = [outputs[name] for name in names]
+    chunk_factor = np.empty(CHUNK_SIZE, dtype="float32")
+    chunk_tmp = np.empty(CHUNK_SIZE, dtype="float32")
+
+    for start in range(0, size, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, size)
+        factor = chunk_factor[:stop - start]
+        tmp = chunk_tmp[:stop - start]
+
+        for i, flat in enumerate(flats):
+            np.copyto(factor, flat[start:stop], casting="unsafe")
+
+            for j, acc in enumerate(accumulators):
+                np.multiply(factor, W[j, i], out=tmp)
+                np.add(acc[start:stop], tmp, out=acc[start:stop])
+
+    return {name: out.reshape(shape) for name, out in outputs.items()}
@@ -1,52 +1,112 @@
 import numpy as np
 import pandas as pd
+
+from time import perf_counter
 from shapely.geometry import Point
 
 
-def points_distance(infiltrations:pd.DataFrame, initial_point=None):
-    points:list[Point] = infiltrations.apply(lambda row: Point(row["Lon"], row["Lat"]), axis=1).values
+def points_distance(infiltrations:pd.DataFrame, initial_point=None) -> pd.Series:
+    """Ordem dos pontos de `infiltrations` (colunas `Lon`, `Lat`) para espalhar os pontos de calibração.
+
+    O primeiro ponto é `initial_point` (índice de `infiltrations`) ou o de maior média de `0.5^-d` para
+    todos os pontos. Cada ponto seguinte é o que ainda não foi escolhido com a maior média de `0.5^-d`
+    para os já escolhidos. A soma dos pesos de cada ponto restante é atualizada apenas com o último
+    ponto escolhido, `O(n)` por passo e sem montar a matriz de distâncias.
 
-    medias = _mean_dist(infiltrations)
-    infiltrations["distancia_media"] = medias
+    Retorna a posição (1..n) de cada ponto, `dist_position`.
+    """
+    xy = infiltrations[["Lon", "Lat"]].to_numpy(dtype=np.float64)
+    n = len(xy)
 
+    if initial_point is None:
+        current = int(np.argmax(_log_mean_weight(xy, xy)))
+    else:
+        current = infiltrations.index.get_loc(initial_point)
 
-    idx_max = initial_point or infiltrations["distancia_media"].idxmax()
+    position = np.zeros(n, dtype=np.int32)
+    position[current] = 1
 
-    infiltrations["dist_position"] = None
-    infiltrations.at[idx_max, "dist_position"] = 1
+    # Pontos restantes em ordem do índice (desempate igual ao `idxmax`) e log2 da soma dos pesos para os
+    # escolhidos. Em log, `0.5^-d = 2^d` não estoura para distâncias grandes (coordenadas em metros)
+    remaining = np.delete(np.arange(n), current)
+    x, y = xy[remaining, 0], xy[remaining, 1]
+    log_total = np.full(len(remaining), -np.inf)
+    chosen = np.zeros(len(remaining), dtype=bool)
+    for i in range(2, n + 1):
+        # Como todos os restantes têm o mesmo número de pontos escolhidos, a maior soma é a maior média
+        np.logaddexp2(log_total, np.hypot(x - xy[current, 0], y - xy[current, 1]), out=log_total)
+        log_total[chosen] = -np.inf
+        best = int(np.argmax(log_total))
+        current = remaining[best]
+        position[current] = i
+        chosen[best] = True
 
-    while True:
-        mask = infiltrations["dist_position"].isnull()
+        # Remove os escolhidos compactando os vetores de tempos em tempos, para que cada passo custe O(restantes)
+        if chosen.sum()*2 >= len(remaining):
+            keep = ~chosen
+            remaining, x, y, log_total, chosen = remaining[keep], x[keep], y[keep], log_total[keep], chosen[keep]
 
-        if not mask.any():
-            break
+    return pd.Series(position, index=infiltrations.index, name="dist_position")
 
-        points_calc = points[~mask]
-        medias = _mean_dist(infiltrations[mask], points_calc)
-        
-        infiltrations.loc[~mask, "distancia_media"] = 0
-        infiltrations.loc[mask, "distancia_media"] = medias
+def _log_mean_weight(xy:np.ndarray, xy_calc:np.ndarray, chunk_size:int = 1024) -> np.ndarray:
+    """log2 da média de `0.5^-d` de cada ponto de `xy` para os pontos de `xy_calc`, em blocos de `chunk_size` linhas"""
+    medias = np.empty(len(xy))
+    for start in range(0, len(xy), chunk_size):
+        block = xy[start:start + chunk_size]
+        dists = np.hypot(block[:, None, 0] - xy_calc[None, :, 0], block[:, None, 1] - xy_calc[None, :, 1])
 
-        idx_max = infiltrations["distancia_media"].idxmax()
-        infiltrations.at[idx_max, "dist_position"] = np.sum(~mask)+1
+        # log2(média(2^d)) = max + log2(média(2^(d - max))), sem estourar para distâncias grandes
+        d_max = dists.max(axis=1)
+        medias[start:start + len(block)] = d_max + np.log2(np.mean(np.exp2(dists - d_max[:, None]), axis=1))
+    return medias
 
+def _points_distance_reference(infiltrations:pd.DataFrame, initial_point=None) -> pd.Series:
+    """Implementação original com o Shapely, `O(n³)`, usada apenas para conferir `points_distance`"""
+    points = np.array([Point(lon, lat) for lon, lat in zip(infiltrations["Lon"], infiltrations["Lat"])])
 
+    def mean_dist(points_mask, points_calc):
+        return np.array([np.mean(np.pow(0.5, -np.array([p.distance(q) for q in points_calc]))) for p in points_mask])
 
-    infiltrations.pop("distancia_media")
-    return infiltrations.pop("dist_position").astype(np.int32)
+    medias = pd.Series(mean_dist(points, points), index=infiltrations.index)
+    idx_max = medias.idxmax() if initial_point is None else initial_point
 
-def _mean_dist(infiltrations:pd.DataFrame, points_calc = None):
-    points:list[Point] = infiltrations.apply(lambda row: Point(row["Lon"], row["Lat"]), axis=1).values
-    points2:list[Point] = points_calc if points_calc is not None else points
-    
-    medias = np.zeros(len(points))
-    for i in range(len(points)):
-        dists = np.array([])
-        point = points[i]
-        for j in range(len(points2)):
-            distance = point.distance(points2[j])
-            dists = np.append(dists, distance)
-        
-        medias[i] = np.mean(np.pow(0.5, -dists))
+    position = pd.Series(0, index=infiltrations.index, dtype=np.int32, name="dist_position")
+    position[idx_max] = 1
+    while (position == 0).any():
+        mask = (position == 0).values
 
-    return medias
+        medias[:] = 0
+        medias[mask] = mean_dist(points[mask], points[~mask])
+        position[medias.idxmax()] = np.sum(~mask) + 1
+
+    return position
+
+def benchmark_points_distance(n_points:tuple[int, ...] = (1_000, 5_000, 10_000), n_reference:int = 200, seed:int = 42):
+    """Mede o tempo de `points_distance` em pontos aleatórios (coordenadas em graus, em uma área de ~0.1°).
+
+    Com `n_reference` pontos também executa a implementação original e confere se a ordem é a mesma.
+    """
+    rng = np.random.default_rng(seed)
+
+    def random_points(n):
+        return pd.DataFrame({"Lon": -44 + 0.1*rng.random(n), "Lat": -20 + 0.1*rng.random(n)})
+
+    if n_reference:
+        df = random_points(n_reference)
+
+        start = perf_counter()
+        reference = _points_distance_reference(df)
+        t_reference = perf_counter() - start
+
+        start = perf_counter()
+        fast = points_distance(df)
+        t_fast = perf_counter() - start
+
+        print(f"{n_reference} pontos: original {t_reference:.3f} s | novo {t_fast:.4f} s | {t_reference/t_fast:.0f}x | mesma ordem: {reference.equals(fast)}")
+
+    for n in n_points:
+        df = random_points(n)
+
+        start = perf_counter()
+        points_distance(df)
+        print(f"{n} pontos: {perf_counter() - start:.3f} s")
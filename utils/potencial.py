@@ -0,0 +1,75 @@
+import numpy as np
+
+from functools import partial
+
+from .consts import ELEVACAO_INTERVALOS_MG, DECLIVIDADE_INTERVALOS_MG
+from .overlay import weighted_overlay
+from .raster_blocks import process_blocks
+from .reclass import reclassify_lut, reclassify_intervals, LUT_USO_SOLO_MAPBIOMAS
+
+
+# Ordem dos fatores e dos rasteres de entrada do potencial de infiltração de MG
+FATORES_MG = ["Form. Geo.", "Uso Solo", "Declividade", "Elevação", "Textura"]
+
+# Tipos de solo do IDE-Sisema, o índice de infiltração é o próprio tipo
+LUT_TIPOS_SOLO_MG = np.arange(10, dtype="float32")
+
+
+def fatores_bloco(blocos:list[np.ndarray]) -> list[np.ndarray]:
+    """Reclassifica um bloco dos cinco rasteres alinhados nos índices de infiltração de cada fator.
+
+    `blocos` está na ordem de `FATORES_MG`: unidade geológica, uso do solo (MapBiomas),
+    declividade, elevação e tipo de solo.
+    """
+    uni_geo, uso_solo, declividade, elevacao, tipo_solo = blocos
+
+    return [
+        uni_geo.astype("uint8").astype("float32"),                                                 # Unidade Geológica
+        reclassify_lut(uso_solo, LUT_USO_SOLO_MAPBIOMAS),                                          # Uso do Solo
+        reclassify_intervals(declividade, *DECLIVIDADE_INTERVALOS_MG, valid_range=(0, 360)),       # Declividade
+        reclassify_intervals(elevacao, *ELEVACAO_INTERVALOS_MG, valid_range=(0, None)),            # Elevação
+        reclassify_lut(tipo_solo.astype("uint8"), LUT_TIPOS_SOLO_MG),                              # Tipo de solo
+    ]
+
+def potencial_bloco(blocos:list[np.ndarray], pesos:dict[str, list[float]]) -> dict[str, np.ndarray]:
+    """Calcula o potencial de infiltração de um bloco para cada conjunto de pesos (MIF, AHP, ...).
+
+    `pesos` é `{nome: [influência de cada fator na ordem de FATORES_MG]}`.
+    """
+    return weighted_overlay(fatores_bloco(blocos), pesos)
+
+def potencial_mg(
+    rasters:list[str],
+    pesos:dict[str, list[float]],
+    saidas:dict[str, str],
+    block_size:int = 1024,
+    n_workers:int|None = None,
+):
+    """Gera os rasteres de potencial de infiltração em `saidas`, lendo os rasteres por blocos.
+
+    `rasters` são os caminhos dos rasteres alinhados, na ordem de `FATORES_MG`, `pesos` é
+    `{nome: [influência de cada fator]}` e `saidas` é `{nome: caminho}`. As entradas são lidas e
+    reclassificadas uma única vez para todos os conjuntos de pesos. Os blocos são calculados em
+    paralelo (`n_workers` threads, padrão todos os núcleos) e gravados diretamente nos GeoTIFFs,
+    então a memória depende do `block_size` e não do tamanho do raster.
+    """
+    if len(rasters) != len(FATORES_MG):
+        raise ValueError(f"São necessários {len(FATORES_MG)} rasteres, na ordem {FATORES_MG}")
+
+    if set(pesos) != set(saidas):
+        raise ValueError("Cada conjunto de pesos deve ter um caminho de saída")
+
+    for nome, valores in pesos.items():
+        if len(valores) != len(FATORES_MG):
+            raise ValueError(f"Os pesos {nome} devem ter {len(FATORES_MG)} valores, na ordem {FATORES_MG}")
+
+    return process_blocks(
+        partial(potencial_bloco, pesos={nome: list(valores) for nome, valores in pesos.items()}),
+        rasters,
+        saidas,
+        dtype="float32",
+        nodata=np.nan,
+        block_size=block_size,
+        n_workers=n_workers,
+        desc="Calculando potencial",
+    )
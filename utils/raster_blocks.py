@@ -0,0 +1,210 @@
+import os
+import threading
+import numpy as np
+import rasterio
+
+from tqdm import tqdm
+from contextlib import ExitStack
+from rasterio.windows import Window
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def iter_windows(width:int, height:int, block_size:int = 1024) -> list[Window]:
+    """Retorna as janelas `Window` de `block_size` x `block_size` que cobrem um raster de `width` x `height`"""
+    windows = []
+    for row in range(0, height, block_size):
+        for col in range(0, width, block_size):
+            windows.append(Window(
+                col_off=col,
+                row_off=row,
+                width=min(block_size, width - col),
+                height=min(block_size, height - row),
+            ))
+    return windows
+
+def check_aligned(paths:list[str]):
+    """Verifica se todos os rasteres possuem o mesmo grid (tamanho, transformação e CRS) e retorna o profile do primeiro"""
+    profile = None
+    for path in paths:
+        with rasterio.open(path) as src:
+            if profile is None:
+                profile = src.profile.copy()
+                continue
+
+            same = (
+                src.width == profile["width"] and
+                src.height == profile["height"] and
+                src.transform.almost_equals(profile["transform"]) and
+                src.crs == profile["crs"]
+            )
+            if not same:
+                raise ValueError(f"O raster {path} não está alinhado com {paths[0]}, todos devem ter o mesmo grid")
+
+    return profile
+
+def tiled_profile(profile:dict, dtype="float32", nodata=np.nan, count:int = 1, block_size:int = 512) -> dict:
+    """Retorna um profile de GeoTIFF tileado e comprimido, baseado no `profile` do raster de referência"""
+    profile = profile.copy()
+    profile.update(
+        driver="GTiff",
+        dtype=dtype,
+        nodata=nodata,
+        count=count,
+        tiled=True,
+        blockxsize=block_size,
+        blockysize=block_size,
+        compress="deflate",
+        predictor=3 if np.dtype(dtype).kind == "f" else 2,
+        BIGTIFF="IF_SAFER",
+    )
+    return profile
+
+
+class BlockReader:
+    """Leitor de janelas de vários rasteres alinhados, com um handle do GDAL por thread"""
+
+    def __init__(self, paths:list[str]):
+        self.paths = paths
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+        self._size = None
+
+    def read(self, window:Window) -> list[np.ndarray]:
+        datasets = getattr(self._local, "datasets", None)
+        if datasets is None:
+            datasets = [rasterio.open(path) for path in self.paths]
+            self._local.datasets = datasets
+            with self._lock:
+                self._opened.extend(datasets)
+
+        return [dataset.read(1, window=window) for dataset in datasets]
+
+    def read_halo(self, window:Window, halo:int) -> tuple[list[np.ndarray], tuple[tuple[int, int], tuple[int, int]]]:
+        """Lê `window` com `halo` pixels a mais em cada lado, limitado à extensão do raster.
+
+        Retorna os blocos e as larguras `((cima, baixo), (esquerda, direita))` do halo que ficaram fora do
+        raster, para completar com `np.pad(bloco, pad, mode="edge")` (o mesmo que `mode="nearest"` do scipy).
+        """
+        width, height = self.size()
+        row0 = max(0, window.row_off - halo)
+        col0 = max(0, window.col_off - halo)
+        row1 = min(height, window.row_off + window.height + halo)
+        col1 = min(width, window.col_off + window.width + halo)
+
+        pad = (
+            (row0 - (window.row_off - halo), (window.row_off + window.height + halo) - row1),
+            (col0 - (window.col_off - halo), (window.col_off + window.width + halo) - col1),
+        )
+        return self.read(Window(col0, row0, col1 - col0, row1 - row0)), pad
+
+    def size(self) -> tuple[int, int]:
+        """Largura e altura dos rasteres"""
+        if self._size is None:
+            with rasterio.open(self.paths[0]) as src:
+                self._size = (src.width, src.height)
+        return self._size
+
+    def close(self):
+        for dataset in self._opened:
+            dataset.close()
+        self._opened = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def map_blocks(func, paths:list[str], windows:list[Window], n_workers:int|None = None, desc:str = "Processando blocos", halo:int = 0):
+    """Gera `(window, func(blocos))` para cada janela, calculando em paralelo em `n_workers` threads.
+
+    O GDAL e a maior parte das operações do numpy liberam o GIL, então threads usam todos os núcleos
+    sem precisar serializar os blocos. No máximo `2*n_workers` blocos ficam em memória ao mesmo tempo.
+
+    Com `halo > 0` (filtros de vizinhança), os blocos são lidos com `halo` pixels a mais em cada lado e
+    `func` é chamada como `func(blocos, pad)`, ver `BlockReader.read_halo`. O resultado de `func` deve ter
+    o tamanho da janela, sem o halo.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+
+    with BlockReader(paths) as reader:
+        def run(window:Window):
+            if halo:
+                return window, func(*reader.read_halo(window, halo))
+            return window, func(reader.read(window))
+
+        progress = tqdm(total=len(windows), desc=desc)
+
+        # Sem paralelismo, útil para depuração
+        if n_workers == 1:
+            for window in windows:
+                yield run(window)
+                progress.update()
+            progress.close()
+            return
+
+        with ThreadPoolExecutor(n_workers) as executor:
+            pendentes = set()
+            for window in windows:
+                pendentes.add(executor.submit(run, window))
+
+                if len(pendentes) < 2*n_workers:
+                    continue
+
+                prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for future in prontos:
+                    yield future.result()
+                    progress.update()
+
+            for future in wait(pendentes).done:
+                yield future.result()
+                progress.update()
+
+        progress.close()
+
+def process_blocks(
+    func,
+    paths:list[str],
+    out_path:str|dict[str, str],
+    dtype="float32",
+    nodata=np.nan,
+    block_size:int = 1024,
+    n_workers:int|None = None,
+    desc:str = "Processando blocos",
+    count:int = 1,
+    descriptions:list[str]|None = None,
+    halo:int = 0,
+):
+    """Aplica `func` bloco a bloco sobre os rasteres alinhados de `paths` e grava o resultado em `out_path`.
+
+    `func` recebe a lista com as janelas lidas de cada raster (na ordem de `paths`) e deve retornar
+    o array do bloco de saída. Se `out_path` for um dicionário `{nome: caminho}`, `func` deve retornar
+    `{nome: bloco}` e cada saída é gravada no seu raster, com uma única leitura das entradas.
+    Com `count > 1` cada bloco de saída tem a forma `(count, altura, largura)` e as bandas recebem
+    os nomes de `descriptions`. Com `halo > 0`, `func` recebe os blocos com o halo, ver `map_blocks`.
+    A memória máxima depende apenas de `block_size` e de `n_workers`.
+    """
+    profile = check_aligned(paths)
+    windows = iter_windows(profile["width"], profile["height"], block_size)
+    out_profile = tiled_profile(profile, dtype=dtype, nodata=nodata, count=count)
+
+    multi = isinstance(out_path, dict)
+    out_paths = out_path if multi else {None: out_path}
+
+    with ExitStack() as stack:
+        dsts = {name: stack.enter_context(rasterio.open(path, "w", **out_profile)) for name, path in out_paths.items()}
+        for dst in dsts.values():
+            for band, description in enumerate(descriptions or [], start=1):
+                dst.set_band_description(band, description)
+
+        for window, block in map_blocks(func, paths, windows, n_workers, desc, halo):
+            blocks = block if multi else {None: block}
+            for name, dst in dsts.items():
+                if count == 1:
+                    dst.write(blocks[name].astype(dtype), 1, window=window)
+                else:
+                    dst.write(blocks[name].astype(dtype), window=window)
+
+    return out_path
@@ -0,0 +1,172 @@
+import numpy as np
+
+from time import perf_counter
+
+from .consts import (
+    USO_SOLO_CLASS,
+    USO_SOLO_MAPBIOMAS,
+    SOIL_TYPES,
+    ELEVACAO_INTERVALOS,
+)
+
+
+def lut_from_classes(classes:dict, key:str|None = "infiltration_index", fill:float = 0.0) -> np.ndarray:
+    """Compila um dicionário `{classe: valor}` (ou `{classe: {key: valor}}`) em uma tabela densa.
+
+    A posição `i` da tabela tem o valor da classe `i`; classes ausentes recebem `fill`.
+    """
+    if min(classes) < 0:
+        raise ValueError("As classes da tabela devem ser inteiros não negativos")
+
+    lut = np.full(max(classes) + 1, fill, dtype="float32")
+    for classe, value in classes.items():
+        lut[classe] = value[key] if isinstance(value, dict) else value
+
+    return lut
+
+# Tamanho dos pedaços processados por vez, os temporários cabem no cache do processador
+CHUNK_SIZE = 1 << 16
+
+# Acima deste número de limites a busca binária (searchsorted) passa a compensar
+MAX_BREAKS_COMPARE = 32
+
+
+def reclassify_lut(values:np.ndarray, lut:np.ndarray, fill:float = 0.0, below:float|None = None) -> np.ndarray:
+    """Reclassifica um raster categórico com uma única leitura da tabela `lut`.
+
+    - Classes maiores que a tabela recebem `fill`
+    - Classes negativas (nodata) recebem `below`, por padrão igual a `fill`
+    - Em rasteres float, NaN, infinitos e valores não inteiros (ex.: 2.5) não são classes e recebem `fill`
+    """
+    below = fill if below is None else below
+
+    # Tabela estendida: [abaixo, *lut, acima], assim um único `take` resolve tudo
+    table = np.concatenate([[below], lut, [fill]]).astype("float32")
+
+    values = np.asarray(values)
+    is_float = values.dtype.kind == "f"
+    flat = values.reshape(-1)
+    out = np.empty(flat.size, dtype="float32")
+    idx = np.empty(CHUNK_SIZE, dtype=np.int64)
+
+    for start in range(0, flat.size, CHUNK_SIZE):
+        chunk = flat[start:start + CHUNK_SIZE]
+        chunk_idx = idx[:chunk.size]
+
+        # A conversão de float para inteiro truncaria 2.5 para a classe 2 e não é definida para NaN,
+        # então esses valores vão para a posição de `fill` e os demais são limitados antes da conversão
+        if is_float:
+            not_class = ~np.isfinite(chunk) | (np.trunc(chunk) != chunk)
+            chunk = np.clip(np.where(not_class, len(lut), chunk), -1, len(lut))
+
+        np.copyto(chunk_idx, chunk, casting="unsafe")
+        np.clip(chunk_idx, -1, len(lut), out=chunk_idx)
+        chunk_idx += 1
+        np.take(table, chunk_idx, out=out[start:start + chunk.size])
+
+    return out.reshape(values.shape)
+
+def reclassify_intervals(
+    values:np.ndarray,
+    breaks:list[float],
+    classes:list[float],
+    valid_range:tuple[float|None, float|None] = (None, None),
+) -> np.ndarray:
+    """Reclassifica um raster contínuo por intervalos `[limite anterior, limite)` em uma única passada.
+
+    `classes` deve ter um valor a mais que `breaks`. Valores fora de `valid_range` (inclusive)
+    e NaN resultam em NaN.
+    """
+    if len(classes) != len(breaks) + 1:
+        raise ValueError("Deve existir uma classe a mais que o número de limites")
+
+    values = np.asarray(values)
+
+    # Limites no mesmo tipo do raster, evitando uma cópia em float64 nas comparações
+    dtype = values.dtype if values.dtype.kind == "f" else np.dtype("float64")
+    inf = dtype.type(np.inf)
+
+    low, high = valid_range
+    low = -inf if low is None else dtype.type(low)
+    high = inf if high is None else np.nextafter(dtype.type(high), inf)
+
+    # Tabela de intervalos: abaixo de `low` e a partir de `high` a classe é NaN.
+    # O índice do intervalo é o número de limites menores ou iguais ao valor, então NaN cai no índice 0 (NaN)
+    # e no searchsorted, que ordena NaN depois de tudo, no último índice (também NaN).
+    table_breaks = np.array([low, *breaks, high], dtype=dtype)
+    table = np.array([np.nan, *classes, np.nan], dtype="float32")
+
+    if len(table_breaks) > MAX_BREAKS_COMPARE:
+        return table.take(np.searchsorted(table_breaks, values, side="right"))
+
+    # Para poucos limites, contar as comparações é bem mais rápido que a busca binária
+    flat = values.reshape(-1)
+    out = np.empty(flat.size, dtype="float32")
+    idx = np.empty(CHUNK_SIZE, dtype=np.uint8)
+    cmp = np.empty(CHUNK_SIZE, dtype=bool)
+
+    for start in range(0, flat.size, CHUNK_SIZE):
+        chunk = flat[start:start + CHUNK_SIZE]
+        chunk_idx = idx[:chunk.size]
+        chunk_cmp = cmp[:chunk.size]
+
+        chunk_idx[:] = 0
+        for _break in table_breaks:
+            np.greater_equal(chunk, _break, out=chunk_cmp)
+            np.add(chunk_idx, chunk_cmp, out=chunk_idx)
+
+        np.take(table, chunk_idx, out=out[start:start + chunk.size])
+
+    return out.reshape(values.shape)
+
+
+# Tabelas compiladas das constantes
+LUT_USO_SOLO_CLASS     = lut_from_classes(USO_SOLO_CLASS)
+LUT_USO_SOLO_MAPBIOMAS = lut_from_classes(USO_SOLO_MAPBIOMAS)
+LUT_SOIL_TYPES         = lut_from_classes(SOIL_TYPES)
+
+
+def benchmark_reclass(shape:tuple[int, int] = (4000, 4000), seed:int = 42):
+    """Compara o tempo das máscaras por classe (abordagem antiga) com as tabelas de reclassificação"""
+    rng = np.random.default_rng(seed)
+
+    uso_solo = rng.choice([-1, *USO_SOLO_MAPBIOMAS.keys()], size=shape).astype("float32")
+    elevacao = rng.uniform(-100, 2000, size=shape).astype("float32")
+
+    # Uso do solo
+    start = perf_counter()
+    old = np.zeros(shape, dtype="float32")
+    for key, value in USO_SOLO_MAPBIOMAS.items():
+        old[uso_solo == key] = value["infiltration_index"]
+    old[uso_solo < 0] = np.nan
+    t_old = perf_counter() - start
+
+    start = perf_counter()
+    new = reclassify_lut(uso_solo, LUT_USO_SOLO_MAPBIOMAS, below=np.nan)
+    t_new = perf_counter() - start
+
+    print(f"Uso do solo ({len(USO_SOLO_MAPBIOMAS)} classes): máscaras {t_old:.3f} s | tabela {t_new:.3f} s | {t_old/t_new:.1f}x")
+    print(f"\tResultados iguais: {np.array_equal(old, new, equal_nan=True)}")
+
+    # Elevação
+    breaks, classes = ELEVACAO_INTERVALOS
+
+    start = perf_counter()
+    old = np.zeros(shape, dtype="float32")
+    old[elevacao < breaks[0]] = classes[0]
+    for i in range(1, len(breaks)):
+        old[(elevacao >= breaks[i-1]) & (elevacao < breaks[i])] = classes[i]
+    old[elevacao >= breaks[-1]] = classes[-1]
+    old[elevacao < 0] = np.nan
+    t_old = perf_counter() - start
+
+    start = perf_counter()
+    new = reclassify_intervals(elevacao, breaks, classes, valid_range=(0, None))
+    t_new = perf_counter() - start
+
+    print(f"Elevação ({len(classes)} intervalos): máscaras {t_old:.3f} s | tabela {t_new:.3f} s | {t_old/t_new:.1f}x")
+    print(f"\tResultados iguais: {np.array_equal(old, new, equal_nan=True)}")
+
+
+if __name__ == "__main__":
+    benchmark_reclass()
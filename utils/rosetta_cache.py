@@ -0,0 +1,139 @@
+import os
+import atexit
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from rosetta import rosetta, SoilData
+
+
+class RosettaCache:
+    """Cache dos resultados do Rosetta por textura `(areia, silte, argila)`.
+
+    Cada chamada calcula apenas as texturas únicas (`np.unique`) que ainda não estão no cache, então
+    rasteres inteiros custam uma chamada do Rosetta por combinação distinta. As texturas são arredondadas
+    em `decimals` casas para formar a chave. O cache em memória é LRU com até `max_size` texturas e, com
+    `path`, também é salvo em disco (`.npz`) e recarregado entre sessões.
+
+    O arquivo não é regravado a cada chamada: as texturas novas são acumuladas e o cache é salvo quando
+    elas chegam a `flush_every` ou a um quarto do cache (o que for maior), então o total gravado em uma
+    varredura cresce linearmente com o tamanho do cache. O restante é salvo por `flush` e na saída do
+    Python.
+    """
+
+    def __init__(self, version:int = 3, max_size:int = 1_000_000, decimals:int = 4, path:str|None = None, flush_every:int = 10_000):
+        self.version = version
+        self.max_size = max_size
+        self.decimals = decimals
+        self.flush_every = flush_every
+        self.path = None
+
+        self._width = None
+        self._pending = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._atexit = False
+
+        if path is not None:
+            self.use_disk(path)
+
+    def use_disk(self, path:str):
+        """Usa o arquivo `path` como cache em disco, carregando as texturas já calculadas"""
+        self.path = path
+        if not self._atexit:
+            atexit.register(self.flush)
+            self._atexit = True
+
+        if not os.path.exists(path):
+            return
+
+        with np.load(path) as data:
+            if int(data["version"]) != self.version:
+                raise ValueError(f"O cache {path} é do Rosetta {int(data['version'])}, não do {self.version}")
+
+            with self._lock:
+                self._width = data["values"].shape[1]
+                for key, value in zip(data["keys"], data["values"]):
+                    self._cache[tuple(key)] = value
+
+    def save(self):
+        """Salva o cache em disco, se houver um `path`"""
+        if self.path is None:
+            return
+
+        with self._lock:
+            keys = np.array(list(self._cache.keys()), dtype=np.float64).reshape(-1, 3)
+            values = np.array(list(self._cache.values()), dtype=np.float64).reshape(len(keys), -1)
+            self._pending = 0
+
+        tmp = f"{self.path}.tmp.npz"
+        np.savez(tmp, keys=keys, values=values, version=self.version)
+        os.replace(tmp, self.path)
+
+    def flush(self):
+        """Salva o cache em disco se houver texturas novas ainda não salvas"""
+        if self._pending:
+            self.save()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __call__(self, sand, silt, clay) -> np.ndarray:
+        """Retorna a média do Rosetta `(..., C)` com todas as colunas (θr, θs, α, n, Ks, ...), NaN onde a textura é inválida"""
+        sand = np.atleast_1d(sand)
+        silt = np.atleast_1d(silt)
+        clay = np.atleast_1d(clay)
+
+        if not (sand.shape == silt.shape == clay.shape):
+            raise ValueError("sand, silt e clay devem ter o mesmo tamanho.")
+
+        data = np.round(np.stack([sand.ravel(), silt.ravel(), clay.ravel()], axis=1).astype(np.float64), self.decimals)
+        valid = np.isfinite(data).all(axis=1)
+
+        unique, inverse = np.unique(data[valid], axis=0, return_inverse=True)
+
+        keys = [tuple(row) for row in unique.tolist()]
+        values = [None]*len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                values[i] = self._cache.get(key)
+                if values[i] is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+
+        if missing:
+            mean, _, _ = rosetta(self.version, SoilData.from_array(unique[missing]))
+            self._width = mean.shape[1]
+            for i, row in zip(missing, mean):
+                values[i] = row
+
+            with self._lock:
+                for i in missing:
+                    self._cache[keys[i]] = values[i].copy()
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+                self._pending += len(missing)
+                flush = self._pending >= max(self.flush_every, len(self._cache)//4)
+
+            if flush:
+                self.save()
+
+        if self._width is None:
+            # Nenhuma textura válida e nada calculado ainda
+            mean, _, _ = rosetta(self.version, SoilData.from_array(np.array([[33.3, 33.3, 33.4]])))
+            self._width = mean.shape[1]
+
+        out = np.full((len(data), self._width), np.nan)
+        if values:
+            out[valid] = np.array(values)[inverse.reshape(-1)]
+        return out.reshape(sand.shape + (self._width,))
+
+
+# Cache compartilhado pelas PTFs e pelo Infiltrometro
+ROSETTA_CACHE = RosettaCache()
+
+def rosetta_mean(sand, silt, clay) -> np.ndarray:
+    """Média do Rosetta 3 `(..., C)` para as texturas, usando o cache compartilhado `ROSETTA_CACHE`"""
+    return ROSETTA_CACHE(sand, silt, clay)
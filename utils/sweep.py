@@ -0,0 +1,147 @@
+import os
+import re
+import zlib
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def task_key(task:dict) -> str:
+    """Nome estável de uma tarefa, usado no checkpoint e na semente"""
+    key = "__".join(f"{name}={value}" for name, value in task.items())
+    return re.sub(r"[^\w=.-]", "_", key)
+
+def task_seed(seed:int, task:dict) -> np.random.SeedSequence:
+    """Semente da tarefa derivada da semente global e dos parâmetros da tarefa.
+
+    Não depende da ordem das tarefas nem do processo que a executa, então uma varredura interrompida e
+    retomada (ou com outro número de processos) gera os mesmos números aleatórios em cada tarefa.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(zlib.crc32(task_key(task).encode()),))
+
+
+def _update_hash(h, obj):
+    """Atualiza o hash `h` com o conteúdo de `obj` (arrays, tabelas, dicionários, listas e valores simples)"""
+    if isinstance(obj, np.ndarray):
+        h.update(f"ndarray{obj.dtype.str}{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else pickle.dumps(obj.tolist()))
+    elif isinstance(obj, (pd.Series, pd.DataFrame, pd.Index)):
+        h.update(f"{type(obj).__name__}{obj.shape}".encode())
+        h.update(pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index)).to_numpy().tobytes())
+        if isinstance(obj, pd.DataFrame):
+            _update_hash(h, list(obj.columns))
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for key in sorted(obj, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _update_hash(h, item)
+    elif obj is None or isinstance(obj, (str, bytes, bool, int, float, np.generic)):
+        h.update(repr(obj).encode())
+    else:
+        h.update(pickle.dumps(obj))
+
+def sweep_fingerprint(func, context:dict, seed:int) -> str:
+    """Hash da função, da semente e dos dados compartilhados (`context`) de uma varredura.
+
+    Os checkpoints ficam em uma subpasta com este hash, então executar de novo com outra semente, outros
+    parâmetros (ex.: `n_simulations`) ou outros dados não reaproveita resultados antigos.
+    """
+    h = hashlib.sha256()
+    _update_hash(h, [f"{func.__module__}.{func.__qualname__}", seed])
+    _update_hash(h, context)
+    return h.hexdigest()
+
+
+# Função e dados compartilhados de cada processo de trabalho
+_WORKER: dict = {}
+
+def _init_worker(func, context):
+    _WORKER["func"] = func
+    _WORKER["context"] = context
+
+def _run_task(task:dict, seed:int, checkpoint_dir:str|None) -> pd.DataFrame:
+    rng = np.random.default_rng(task_seed(seed, task))
+    df = _WORKER["func"](task, rng, **_WORKER["context"])
+
+    for i, (name, value) in enumerate(task.items()):
+        df.insert(i, name, value)
+
+    if checkpoint_dir is not None:
+        path = os.path.join(checkpoint_dir, f"{task_key(task)}.parquet")
+        tmp = f"{path}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    return df
+
+def run_sweep(
+    func,
+    tasks:list[dict],
+    context:dict|None = None,
+    seed:int = 42,
+    n_workers:int|None = None,
+    checkpoint_dir:str|None = None,
+    out_path:str|None = None,
+) -> pd.DataFrame:
+    """Executa as tarefas independentes de uma varredura (ex.: PTF x número de pontos x repetição) em paralelo.
+
+    - `func(task, rng, **context)`: função de nível de módulo (para ser enviada aos processos) que
+      retorna um DataFrame com o resultado da tarefa
+    - `tasks`: parâmetros de cada tarefa, ex.: `{"PTF": "COSBY", "N_PONTOS": 10}`, que viram colunas do resultado
+    - `context`: dados compartilhados enviados uma única vez para cada processo
+    - `seed`: semente global, cada tarefa tem o seu gerador derivado dela (ver `task_seed`)
+    - `checkpoint_dir`: cada tarefa concluída é salva nesta pasta, em uma subpasta com o hash da função,
+      da semente e do `context` (ver `sweep_fingerprint`), e é apenas lida ao executar novamente com
+      os mesmos dados
+    - `out_path`: arquivo Parquet com a tabela de todas as tarefas
+
+    Com `n_workers=1` executa no próprio processo. Em scripts (não notebooks) a chamada deve estar
+    protegida por `if __name__ == "__main__":` por causa dos processos.
+    """
+    context = context or {}
+    n_workers = n_workers or os.cpu_count() or 1
+
+    keys = [task_key(task) for task in tasks]
+    if len(set(keys)) != len(keys):
+        raise ValueError("As tarefas da varredura devem ser únicas")
+
+    results = {}
+    pending = []
+    if checkpoint_dir is not None:
+        checkpoint_dir = os.path.join(checkpoint_dir, sweep_fingerprint(func, context, seed)[:16])
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    for key, task in zip(keys, tasks):
+        path = None if checkpoint_dir is None else os.path.join(checkpoint_dir, f"{key}.parquet")
+        if path is not None and os.path.exists(path):
+            results[key] = pd.read_parquet(path)
+        else:
+            pending.append((key, task))
+
+    if len(results):
+        print(f"Retomando a varredura: {len(results)} de {len(tasks)} tarefas já concluídas")
+
+    if n_workers == 1:
+        _init_worker(func, context)
+        for key, task in tqdm(pending, desc="Varredura"):
+            results[key] = _run_task(task, seed, checkpoint_dir)
+    elif pending:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(func, context)) as executor:
+            futures = {executor.submit(_run_task, task, seed, checkpoint_dir): key for key, task in pending}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Varredura"):
+                results[futures[future]] = future.result()
+
+    table = pd.concat([results[key] for key in keys], ignore_index=True)
+
+    if out_path is not None:
+        table.to_parquet(out_path, index=False)
+
+    return table
@@ -0,0 +1,324 @@
+import numpy as np
+import rasterio
+
+from .raster_blocks import iter_windows, map_blocks, process_blocks
+
+
+# Bandas geradas por `terrain_raster`, na ordem
+TERRAIN_BANDS = ["elevation", "slope_deg", "aspect_deg", "curv_profile", "curv_plan", "curv_gauss", "tpi", "tri"]
+
+# Halo necessário: 1 pixel para as derivadas e o TPI, 2 para o TRI (média 3x3 de |Z - média 3x3|)
+TERRAIN_HALO = 2
+
+
+def horn_kernels(dx:float, dy:float) -> dict[str, np.ndarray]:
+    """Kernels de Horn (1ª e 2ª ordem) e da média dos 8 vizinhos, no formato do `scipy.ndimage.convolve`"""
+    K8 = np.array([[1,1,1],[1,0,1],[1,1,1]], float)
+    return {
+        "p":  np.array([[-1,0,1],[-2,0,2],[-1,0,1]]) / (8*dx),
+        "q":  np.array([[-1,-2,-1],[0,0,0],[1,2,1]]) / (8*dy),
+        "r":  np.array([[1,-2,1],[2,-4,2],[1,-2,1]]) / (3*dx*dx),
+        "t":  np.array([[1,2,1],[-2,-4,-2],[1,2,1]]) / (3*dy*dy),
+        "s":  np.array([[-1,0,1],[0,0,0],[1,0,-1]]) / (4*dx*dy),
+        "K8": K8 / K8.sum(),
+    }
+
+def _stencil(zp:np.ndarray, kernels:dict[str, np.ndarray], names:list[str], dtype) -> dict[str, np.ndarray]:
+    """Aplica vários kernels 3x3 de uma vez, somando cada um dos 9 deslocamentos de `zp` uma única vez.
+
+    `zp` tem 1 pixel de borda, o resultado tem 2 linhas e 2 colunas a menos. Os kernels são invertidos
+    para dar o mesmo resultado da convolução do scipy.
+    """
+    height, width = zp.shape[0] - 2, zp.shape[1] - 2
+    out = {name: np.zeros((height, width), dtype=dtype) for name in names}
+    for a in range(3):
+        for b in range(3):
+            shifted = zp[a:a + height, b:b + width]
+            for name in names:
+                weight = kernels[name][2 - a, 2 - b]
+                if weight != 0:
+                    out[name] += dtype(weight)*shifted
+    return out
+
+def terrain_block(
+    z:np.ndarray,
+    pad:tuple[tuple[int, int], tuple[int, int]],
+    dx:float,
+    dy:float,
+    fill:float,
+    nodata:float|None = None,
+    dtype = np.float32,
+) -> np.ndarray:
+    """Calcula as 8 bandas de `TERRAIN_BANDS` de um bloco do MDT lido com halo de `TERRAIN_HALO` pixels.
+
+    - `z`: bloco com o halo, limitado à extensão do raster
+    - `pad`: partes do halo fora do raster, completadas repetindo a borda (`mode="nearest"`)
+    - `fill`: valor usado no lugar do nodata nas vizinhanças (a média do MDT)
+
+    Retorna `(8, linhas, colunas)` do bloco sem o halo.
+    """
+    z = z.astype(dtype, copy=True)
+    if nodata is not None and not np.isnan(nodata):
+        z[z == nodata] = np.nan
+
+    nodata_mask = np.isnan(z)
+    z[nodata_mask] = fill
+    zp = np.pad(z, pad, mode="edge")
+    nodata_mask = np.pad(nodata_mask, pad, mode="edge")
+
+    h = TERRAIN_HALO
+    inner = (slice(h, -h), slice(h, -h))
+    ring = (slice(h - 1, zp.shape[0] - h + 1), slice(h - 1, zp.shape[1] - h + 1))
+    kernels = horn_kernels(dx, dy)
+
+    # Derivadas e média dos vizinhos em uma única passada, a média também no anel em volta do bloco (TRI)
+    derivs = _stencil(zp[h - 1:zp.shape[0] - h + 1, h - 1:zp.shape[1] - h + 1], kernels, ["p", "q", "r", "t", "s"], dtype)
+    neighbor_mean = _stencil(zp, kernels, ["K8"], dtype)["K8"]
+
+    # |Z - média| no anel; fora do raster repete a borda, como o scipy faz com o array inteiro
+    abs_diff = np.abs(zp[ring] - neighbor_mean)
+    out_rows = (max(0, pad[0][0] - h + 1), max(0, pad[0][1] - h + 1))
+    out_cols = (max(0, pad[1][0] - h + 1), max(0, pad[1][1] - h + 1))
+    if any(out_rows + out_cols):
+        abs_diff = np.pad(
+            abs_diff[out_rows[0]:abs_diff.shape[0] - out_rows[1], out_cols[0]:abs_diff.shape[1] - out_cols[1]],
+            (out_rows, out_cols),
+            mode="edge",
+        )
+    tri = _stencil(abs_diff, kernels, ["K8"], dtype)["K8"]
+    tpi = zp[inner] - neighbor_mean[1:-1, 1:-1]
+
+    mask = nodata_mask[inner]
+    p, q, r, t, s = (np.where(mask, np.nan, derivs[name]).astype(dtype) for name in ["p", "q", "r", "t", "s"])
+
+    eps = dtype(1e-12)
+    grad = np.sqrt(p**2 + q**2)
+
+    # declividade
+    slope_deg = np.degrees(np.arctan(grad))
+
+    # aspecto
+    aspect = np.degrees(np.arctan2(q, -p))
+    aspect = np.where(aspect < 0, 360 + aspect, aspect)
+
+    # curvaturas
+    den = (grad**3) + eps
+    curv_profile = (r*(p**2) + 2*s*p*q + t*(q**2)) / den
+    curv_plan    = (r*(q**2) - 2*s*p*q + t*(p**2)) / den
+    curv_gauss   = (r*t - s**2) / ((1 + p**2 + q**2)**2 + eps)
+
+    elevation = np.where(mask, np.nan, zp[inner])
+    tpi[mask] = np.nan
+    tri[mask] = np.nan
+
+    return np.stack([elevation, slope_deg, aspect, curv_profile, curv_plan, curv_gauss, tpi, tri]).astype(dtype, copy=False)
+
+def raster_mean(path:str, block_size:int = 1024, n_workers:int|None = None) -> float:
+    """Média dos pixels válidos do raster (ignorando NaN e o nodata), lida bloco a bloco"""
+    with rasterio.open(path) as src:
+        width, height, nodata = src.width, src.height, src.nodata
+
+    def block_sum(blocks):
+        block = blocks[0].astype(np.float64)
+        valid = ~np.isnan(block)
+        if nodata is not None and not np.isnan(nodata):
+            valid &= block != nodata
+        return block[valid].sum(), valid.sum()
+
+    total = 0.0
+    count = 0
+    for _, (block_total, block_count) in map_blocks(block_sum, [path], iter_windows(width, height, block_size), n_workers, "Média do MDT"):
+        total += block_total
+        count += block_count
+
+    if count == 0:
+        raise ValueError(f"O raster {path} não tem pixels válidos")
+    return total/count
+
+def terrain_raster(
+    dem_path:str,
+    out_path:str,
+    block_size:int = 1024,
+    n_workers:int|None = None,
+    dtype = "float32",
+) -> str:
+    """Gera um raster de 8 bandas (`TERRAIN_BANDS`) com as variáveis geomorfológicas do MDT `dem_path`.
+
+    Mesmo cálculo do `generate_geomorf` (kernels de Horn, declividade, aspecto, curvaturas de perfil,
+    plano e gaussiana, TPI e TRI 3x3, nodata preenchido com a média do MDT e bordas repetidas), mas em
+    blocos de `block_size` com halo de `TERRAIN_HALO` pixels, em `dtype` e em paralelo em `n_workers`
+    threads. O resultado é gravado bloco a bloco em um GeoTIFF tileado (BigTIFF quando necessário),
+    então a memória não depende do tamanho do MDT.
+    """
+    with rasterio.open(dem_path) as src:
+        dx, dy = abs(src.transform.a), abs(src.transform.e)
+        nodata = src.nodata
+
+    fill = raster_mean(dem_path, block_size, n_workers)
+    np_dtype = np.dtype(dtype).type
+
+    def func(blocks, pad):
+        return terrain_block(blocks[0], pad, dx, dy, fill, nodata, np_dtype)
+
+    return process_blocks(
+        func,
+        [dem_path],
+        out_path,
+        dtype=dtype,
+        block_size=block_size,
+        n_workers=n_workers,
+        desc="Variáveis geomorfológicas",
+        count=len(TERRAIN_BANDS),
+        descriptions=TERRAIN_BANDS,
+        halo=TERRAIN_HALO,
+    )
+
+
+# Estatísticas de `multiscale_raster`, cada uma gerada em todas as janelas
+MULTISCALE_STATS = ["tpi", "tri", "roughness"]
+
+
+def _box_sum(a:np.ndarray, size:int) -> np.ndarray:
+    """Soma em janelas `size` x `size` por imagem integral, só onde a janela cabe inteira (`(H-size+1, W-size+1)`)"""
+    S = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(a, axis=0, dtype=np.float64), axis=1, out=S[1:, 1:])
+    return S[size:, size:] - S[:-size, size:] - S[size:, :-size] + S[:-size, :-size]
+
+def _running_max(a:np.ndarray, size:int, axis:int) -> np.ndarray:
+    """Máximo em janelas de `size` ao longo de `axis` pelo algoritmo de van Herk/Gil-Werman (3 comparações por pixel)"""
+    a = np.moveaxis(a, axis, 0)
+    n = a.shape[0]
+    m = -(-n//size)*size
+
+    padded = np.full((m,) + a.shape[1:], -np.inf, dtype=a.dtype)
+    padded[:n] = a
+    blocks = padded.reshape((m//size, size) + a.shape[1:])
+
+    # Máximo acumulado do início (g) e do fim (h) de cada bloco de `size`
+    g = np.maximum.accumulate(blocks, axis=1).reshape(padded.shape)
+    h = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+
+    out = np.maximum(h[:n - size + 1], g[size - 1:n])
+    return np.moveaxis(out, 0, axis)
+
+def _box_range(a:np.ndarray, size:int) -> np.ndarray:
+    """Máximo - mínimo em janelas `size` x `size` (NaN ignorado), só onde a janela cabe inteira"""
+    nan = np.isnan(a)
+    high = _running_max(_running_max(np.where(nan, -np.inf, a), size, 0), size, 1)
+    low = -_running_max(_running_max(np.where(nan, -np.inf, -a), size, 0), size, 1)
+    return np.where(np.isfinite(high), high - low, np.nan)
+
+def _neighbor_mean(a:np.ndarray, size:int) -> np.ndarray:
+    """Média dos vizinhos válidos em janelas `size` x `size`, sem o pixel central, só onde a janela cabe inteira"""
+    r = size//2
+    valid = ~np.isnan(a)
+    values = np.where(valid, a, 0)
+
+    center = (slice(r, a.shape[0] - r), slice(r, a.shape[1] - r))
+    total = _box_sum(values, size) - values[center]
+    count = _box_sum(valid, size) - valid[center]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total/np.maximum(count, 1), np.nan)
+
+def multiscale_halo(sizes:list[int]) -> int:
+    """Halo necessário para `multiscale_block`: o TRI usa duas médias seguidas da maior janela"""
+    return 2*(max(sizes)//2)
+
+def multiscale_block(
+    z:np.ndarray,
+    pad:tuple[tuple[int, int], tuple[int, int]],
+    sizes:list[int],
+    nodata:float|None = None,
+    dtype = np.float32,
+) -> np.ndarray:
+    """TPI, TRI e rugosidade de um bloco do MDT em cada janela de `sizes` (ímpares), custo constante por pixel.
+
+    - TPI: elevação menos a média dos vizinhos na janela
+    - TRI: média, na janela, de |elevação - média dos vizinhos| (com `size=3` é o TRI do `terrain_block`)
+    - rugosidade: máximo - mínimo da elevação na janela
+
+    As médias usam imagens integrais e o máximo e o mínimo o algoritmo de van Herk/Gil-Werman, então o
+    custo não depende do tamanho da janela. O nodata é ignorado nas janelas (em vez de preenchido com a
+    média), as bordas do raster repetem os pixels da borda. `z` é o bloco lido com halo de
+    `multiscale_halo(sizes)` pixels e `pad` as partes do halo fora do raster.
+
+    Retorna `(3*len(sizes), linhas, colunas)` na ordem `MULTISCALE_STATS` de cada janela.
+    """
+    z = z.astype(np.float64, copy=True)
+    if nodata is not None and not np.isnan(nodata):
+        z[z == nodata] = np.nan
+
+    zp = np.pad(z, pad, mode="edge")
+    R = multiscale_halo(sizes)
+    height, width = zp.shape[0] - 2*R, zp.shape[1] - 2*R
+    inner = (slice(R, R + height), slice(R, R + width))
+    mask = np.isnan(zp[inner])
+
+    bands = []
+    for size in sizes:
+        if size < 3 or size%2 == 0:
+            raise ValueError(f"As janelas devem ser ímpares e maiores que 1, recebido {size}")
+        r = size//2
+
+        # Média dos vizinhos em todo o bloco com halo, alinhada a zp[r:-r, r:-r]
+        mean = _neighbor_mean(zp, size)
+        tpi = zp[r:-r, r:-r] - mean
+
+        # |Z - média| fora do raster repete a borda, como o scipy faz com o array inteiro
+        abs_diff = np.abs(tpi)
+        out_rows = (max(0, pad[0][0] - r), max(0, pad[0][1] - r))
+        out_cols = (max(0, pad[1][0] - r), max(0, pad[1][1] - r))
+        if any(out_rows + out_cols):
+            abs_diff = np.pad(
+                abs_diff[out_rows[0]:abs_diff.shape[0] - out_rows[1], out_cols[0]:abs_diff.shape[1] - out_cols[1]],
+                (out_rows, out_cols),
+                mode="edge",
+            )
+        tri = _neighbor_mean(abs_diff, size)
+
+        roughness = _box_range(zp, size)
+
+        crop = R - r
+        for band in (tpi[crop:crop + height, crop:crop + width], tri[R - 2*r:R - 2*r + height, R - 2*r:R - 2*r + width], roughness[crop:crop + height, crop:crop + width]):
+            band = band.astype(dtype)
+            band[mask] = np.nan
+            bands.append(band)
+
+    return np.stack(bands)
+
+def multiscale_raster(
+    dem_path:str,
+    out_path:str,
+    sizes:list[int] = (3, 5, 11, 21, 51, 101),
+    block_size:int = 1024,
+    n_workers:int|None = None,
+    dtype = "float32",
+) -> str:
+    """Gera um raster com TPI, TRI e rugosidade do MDT `dem_path` em cada janela de `sizes` (pixels).
+
+    As bandas se chamam `{estatística}_{janela}`, ex.: `tpi_3`, `tri_21`, `roughness_101`, ver
+    `multiscale_block`. Processado em blocos com halo, em paralelo e gravado bloco a bloco, como no
+    `terrain_raster`.
+    """
+    sizes = list(sizes)
+    with rasterio.open(dem_path) as src:
+        nodata = src.nodata
+
+    np_dtype = np.dtype(dtype).type
+    descriptions = [f"{stat}_{size}" for size in sizes for stat in MULTISCALE_STATS]
+
+    def func(blocks, pad):
+        return multiscale_block(blocks[0], pad, sizes, nodata, np_dtype)
+
+    return process_blocks(
+        func,
+        [dem_path],
+        out_path,
+        dtype=dtype,
+        block_size=block_size,
+        n_workers=n_workers,
+        desc="Variáveis multiescala",
+        count=len(descriptions),
+        descriptions=descriptions,
+        halo=multiscale_halo(sizes),
+    )
@@ -0,0 +1,196 @@
+import math
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+
+from tqdm import tqdm
+from rasterio.crs import CRS
+from rasterio.features import rasterize
+from rasterio.warp import transform_geom
+from rasterio.errors import WindowError
+from rasterio.windows import Window, from_bounds, transform as window_transform
+
+
+def zone_index(
+    zones:dict[str, object],
+    transform,
+    width:int,
+    height:int,
+    all_touched:bool = False,
+) -> tuple[Window, np.ndarray, np.ndarray]:
+    """Pixels de cada zona no grid (`transform`, `width`, `height`), com cada zona rasterizada uma única vez.
+
+    As zonas podem se sobrepor (ex.: a área de drenagem inteira e as sub-bacias dentro dela), então o
+    resultado não é um raster de rótulos e sim a lista dos pixels de todas as zonas, na ordem de `zones`.
+    Como no `rio.clip`, um pixel pertence à zona quando o seu centro está dentro do polígono
+    (`all_touched=False`).
+
+    Retorna `(window, pixels, labels)`: a janela que contém todas as zonas, o índice de cada pixel no
+    raster achatado da janela e o índice da zona de cada pixel, em ordem crescente.
+    """
+    full = Window(0, 0, width, height)
+    windows = []
+    for geom in zones.values():
+        # Janela inteira (em pixels) que contém os limites da zona
+        window = from_bounds(*shapely.bounds(geom), transform=transform)
+        col_off, row_off = math.floor(window.col_off), math.floor(window.row_off)
+        window = Window(col_off, row_off, math.ceil(window.col_off + window.width) - col_off, math.ceil(window.row_off + window.height) - row_off)
+        try:
+            windows.append(window.intersection(full))
+        except WindowError:
+            windows.append(None)
+
+    valid = [w for w in windows if w is not None]
+    if not valid:
+        raise ValueError("Nenhuma zona cruza o grid do raster")
+
+    row_off = min(w.row_off for w in valid)
+    col_off = min(w.col_off for w in valid)
+    row_end = max(w.row_off + w.height for w in valid)
+    col_end = max(w.col_off + w.width for w in valid)
+    bounds = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+    pixels, labels = [], []
+    for label, (geom, window) in enumerate(zip(zones.values(), windows)):
+        if window is None:
+            continue
+
+        mask = rasterize(
+            [geom],
+            out_shape=(int(window.height), int(window.width)),
+            transform=window_transform(window, transform),
+            fill=0,
+            default_value=1,
+            all_touched=all_touched,
+            dtype=np.uint8,
+        )
+        rows, cols = np.nonzero(mask)
+        pixels.append((rows + (window.row_off - row_off))*bounds.width + cols + (window.col_off - col_off))
+        labels.append(np.full(rows.size, label, dtype=np.int64))
+
+    return bounds, np.concatenate(pixels), np.concatenate(labels)
+
+def _segments(counts:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Posições do primeiro e do último valor de cada zona nos valores ordenados por zona"""
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return first, first + counts - 1
+
+def _zone_stats(values:np.ndarray, labels:np.ndarray, n_zones:int, categorical:bool) -> dict[str, np.ndarray]:
+    """Estatísticas por zona dos `values` válidos, com `labels` em ordem crescente"""
+    if categorical:
+        # Histograma das classes por zona em um único bincount: contagem, soma, mediana, mínimo,
+        # máximo e frações saem do histograma, sem ordenar os valores
+        offset = int(values.min()) if values.size else 0
+        n_classes = int(values.max()) - offset + 1 if values.size else 1
+        codes = labels*n_classes + (values.astype(np.int64) - offset)
+        hist = np.bincount(codes, minlength=n_zones*n_classes).reshape(n_zones, n_classes)
+        classes = np.arange(n_classes) + offset
+
+        counts = hist.sum(axis=1)
+        sums = hist @ classes.astype(np.float64)
+    else:
+        counts = np.bincount(labels, minlength=n_zones)
+        sums = np.bincount(labels, weights=values, minlength=n_zones)
+
+    empty = counts == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats = {"count": counts, "mean": sums/counts}
+
+    # Posições do valor central (ou dos dois centrais) de cada zona, como no np.median
+    low_rank = np.maximum(counts - 1, 0)//2
+    high_rank = counts//2
+
+    if categorical:
+        cumsum = np.cumsum(hist, axis=1)
+        present = hist > 0
+
+        # Classe do valor na posição `rank` = classes com contagem acumulada até `rank`
+        low = classes[np.minimum((cumsum <= low_rank[:, None]).sum(axis=1), n_classes - 1)]
+        high = classes[np.minimum((cumsum <= high_rank[:, None]).sum(axis=1), n_classes - 1)]
+        stats["median"] = (low + high)/2
+        stats["min"] = classes[np.argmax(present, axis=1)]
+        stats["max"] = classes[n_classes - 1 - np.argmax(present[:, ::-1], axis=1)]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for c in np.flatnonzero(present.any(axis=0)):
+                stats[f"frac_{classes[c]}"] = hist[:, c]/counts
+    else:
+        # Valores ordenados dentro de cada zona (as zonas já estão em ordem)
+        values = values[np.lexsort((values, labels))]
+        first, last = _segments(counts)
+
+        # Apenas as zonas com pixels válidos: nas vazias `first` já aponta para a zona seguinte (ou
+        # para depois do fim de `values`, se a zona vazia for a última)
+        full = ~empty
+        first, last, low_rank, high_rank = first[full], last[full], low_rank[full], high_rank[full]
+        for key in ("median", "min", "max"):
+            stats[key] = np.full(n_zones, np.nan)
+        stats["median"][full] = (values[first + low_rank] + values[first + high_rank])/2
+        stats["min"][full] = values[first]
+        stats["max"][full] = values[last]
+
+    for key in ("median", "min", "max"):
+        stats[key] = np.where(empty, np.nan, stats[key].astype(np.float64))
+
+    return stats
+
+def zonal_stats(
+    rasters:dict[str, str],
+    zones:dict[str, object],
+    crs = None,
+    categorical:dict[str, bool]|None = None,
+    valid_range:tuple[float|None, float|None] = (0, None),
+    all_touched:bool = False,
+) -> pd.DataFrame:
+    """Estatísticas de cada raster `{nome: caminho}` em cada zona `{nome: geometria}` (ex.: sub-bacias).
+
+    As zonas são rasterizadas uma única vez por grid (ver `zone_index`) e cada raster é lido uma única
+    vez, apenas na janela que contém as zonas. A contagem e a média saem de um `np.bincount` dos pixels
+    de todas as zonas. Nos rasteres categóricos (por padrão os de inteiros, ou os indicados em
+    `categorical`) o histograma das classes por zona dá a mediana, o mínimo, o máximo e a fração de
+    cada classe (colunas `frac_<classe>`); nos contínuos a mediana vem dos valores ordenados por zona.
+
+    São considerados apenas os pixels diferentes do nodata do raster, que não são NaN e que estão em
+    `valid_range`. As geometrias estão no `crs` (por padrão o dos rasteres).
+
+    Retorna uma tabela com uma linha por zona e raster: `zone`, `raster`, `count`, `mean`, `median`,
+    `min`, `max` e as frações das classes (NaN para os rasteres contínuos).
+    """
+    categorical = categorical or {}
+    crs = CRS.from_user_input(crs) if crs is not None else None
+    names = list(zones.keys())
+
+    indices = {}
+    tables = []
+    for name, path in tqdm(rasters.items(), desc="Estatísticas zonais"):
+        with rasterio.open(path) as src:
+            grid = (src.crs, tuple(src.transform), src.width, src.height)
+            if grid not in indices:
+                geoms = list(zones.values())
+                if crs is not None and src.crs is not None and crs != src.crs:
+                    geoms = [shapely.geometry.shape(transform_geom(crs, src.crs, shapely.geometry.mapping(g))) for g in geoms]
+                indices[grid] = zone_index(dict(zip(names, geoms)), src.transform, src.width, src.height, all_touched)
+
+            window, pixels, labels = indices[grid]
+            values = src.read(1, window=window).reshape(-1)[pixels]
+            nodata = src.nodata
+            is_categorical = categorical.get(name, np.dtype(src.dtypes[0]).kind in "iub")
+
+        valid = np.ones(values.size, dtype=bool)
+        if nodata is not None:
+            valid &= values != nodata
+        if values.dtype.kind == "f":
+            valid &= ~np.isnan(values)
+        if valid_range[0] is not None:
+            valid &= values >= valid_range[0]
+        if valid_range[1] is not None:
+            valid &= values <= valid_range[1]
+
+        values = values[valid] if is_categorical else values[valid].astype(np.float64)
+        stats = _zone_stats(values, labels[valid], len(names), is_categorical)
+        tables.append(pd.DataFrame({"zone": names, "raster": name, **stats}))
+
+    table = pd.concat(tables, ignore_index=True)
+    frac = sorted((c for c in table.columns if c.startswith("frac_")), key=lambda c: float(c[5:]))
+    return table[["zone", "raster", "count", "mean", "median", "min", "max", *frac]]